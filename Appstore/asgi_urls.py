@@ -0,0 +1,13 @@
+"""
+ASGI 部署使用的 URL 配置：下载与版本查询由 core.async_views 处理，其余路由与 Appstore.urls 相同。
+
+由 core.middleware.ASGIURLConfMiddleware 按请求选用，见 settings.ASGI_ROOT_URLCONF。
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('', include('core.async_urls')),
+    *wsgi_urlpatterns,
+]
@@ -46,8 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',  # 最外层，统计包含其他中间件在内的完整耗时
     'corsheaders.middleware.CorsMiddleware',  # 移到最前面
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ASGIURLConfMiddleware',  # ASGI 部署下切换到异步视图路由
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,6 +62,8 @@ MIDDLEWARE = [
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 
 ROOT_URLCONF = 'Appstore.urls'
+# 通过 ASGI 服务器进入的请求使用的 URL 配置（下载与版本查询使用异步视图），留空则与 WSGI 相同
+ASGI_ROOT_URLCONF = os.getenv('ASGI_ROOT_URLCONF', 'Appstore.asgi_urls')
 
 TEMPLATES = [
     {
@@ -132,13 +136,120 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # 应用存储路径
 APP_STORAGE = os.getenv('APP_STORAGE_PATH', os.path.join(BASE_DIR, 'app_storage'))
 
+# 安装包与差分包的存储后端（见 core.storage）:
+#   'local' - APP_STORAGE 下按 blobs/ab/cd/<sha256> 分片存放（默认）
+#   's3'    - S3 兼容的对象存储（需要安装 boto3），下载重定向到预签名 URL
+# 上传临时文件与分块上传会话始终放在 APP_STORAGE 下；切换布局或后端后执行 manage.py migrate_storage
+APP_STORAGE_BACKEND = os.getenv('APP_STORAGE_BACKEND', 'local')
+APP_S3_BUCKET = os.getenv('APP_S3_BUCKET', '')
+# 对象键前缀，多个环境共用一个存储桶时区分
+APP_S3_PREFIX = os.getenv('APP_S3_PREFIX', '')
+# MinIO 等自建服务的地址，留空使用 AWS
+APP_S3_ENDPOINT_URL = os.getenv('APP_S3_ENDPOINT_URL', '')
+APP_S3_REGION = os.getenv('APP_S3_REGION', '')
+# 留空则使用 boto3 默认的凭据链（环境变量、配置文件、实例角色）
+APP_S3_ACCESS_KEY_ID = os.getenv('APP_S3_ACCESS_KEY_ID', '')
+APP_S3_SECRET_ACCESS_KEY = os.getenv('APP_S3_SECRET_ACCESS_KEY', '')
+# 超过阈值的文件分段并发上传
+APP_S3_MULTIPART_THRESHOLD = int(os.getenv('APP_S3_MULTIPART_THRESHOLD', 64 * 1024 * 1024))
+APP_S3_MULTIPART_CHUNKSIZE = int(os.getenv('APP_S3_MULTIPART_CHUNKSIZE', 16 * 1024 * 1024))
+APP_S3_MAX_CONCURRENCY = int(os.getenv('APP_S3_MAX_CONCURRENCY', 8))
+# 下载预签名 URL 的有效期（秒）
+APP_S3_URL_EXPIRES = int(os.getenv('APP_S3_URL_EXPIRES', 300))
+
+# 安装包下载转发模式:
+#   ''        - 由 Django 进程流式发送（默认）
+#   'nginx'   - 返回 X-Accel-Redirect，由 nginx 发送
+#   'sendfile'- 返回 X-Sendfile，由 Apache / lighttpd 发送
+APP_DOWNLOAD_OFFLOAD = os.getenv('APP_DOWNLOAD_OFFLOAD', '')
+# nginx 中映射到 APP_STORAGE 的 internal location，例如:
+#   location /protected-downloads/ { internal; alias /path/to/app_storage/; }
+APP_DOWNLOAD_ACCEL_PREFIX = os.getenv('APP_DOWNLOAD_ACCEL_PREFIX', '/protected-downloads/')
+
+# 可续传上传会话的有效期（秒），过期后由 cleanup_upload_sessions 命令清理
+APP_UPLOAD_SESSION_TTL = int(os.getenv('APP_UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+# 市场页缓存有效期（秒）；数据变化时通过代数计数器立即失效，因此可以设置得较长
+MARKET_CACHE_TIMEOUT = int(os.getenv('MARKET_CACHE_TIMEOUT', 300))
+
+# 缓存：默认为进程内缓存；多进程 / 多机部署时必须配置 REDIS_URL（需要安装 redis），
+# 使限流、下载并发计数与市场页缓存在各进程间共享，否则每个进程各自计数，上限按进程数放大
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# 接口令牌桶限流（次数/s|min|hour|day，留空不限），桶容量等于次数，见 core.throttling
+APP_THROTTLE_USER_RATE = os.getenv('APP_THROTTLE_USER_RATE', '600/min')
+# 按客户端 IP 的令牌桶，同一出口 IP（NAT、办公网络）的多个用户共用，应比单用户宽松
+APP_THROTTLE_IP_RATE = os.getenv('APP_THROTTLE_IP_RATE', '1200/min')
+# 同时进行的下载数上限：单个用户（未登录与签名链接按 IP）与全局，0 表示不限；
+# 多个工作进程时需要共享缓存（REDIS_URL）才能生效，使用进程内缓存时 manage.py check --deploy 会给出警告
+APP_DOWNLOAD_CONCURRENCY_PER_USER = int(os.getenv('APP_DOWNLOAD_CONCURRENCY_PER_USER', 4))
+APP_DOWNLOAD_CONCURRENCY_GLOBAL = int(os.getenv('APP_DOWNLOAD_CONCURRENCY_GLOBAL', 512))
+# 单个下载连接的限速（字节/秒），0 表示不限；仅对由 Django 发送的下载生效
+APP_DOWNLOAD_BANDWIDTH = int(os.getenv('APP_DOWNLOAD_BANDWIDTH', 0))
+
+# 批量检查更新接口单次最多提交的应用数
+APP_UPDATE_CHECK_MAX_APPS = int(os.getenv('APP_UPDATE_CHECK_MAX_APPS', 500))
+
+# 差分升级包（需要安装 bsdiff4）
+APP_DELTA_UPDATES = os.getenv('APP_DELTA_UPDATES', 'True') == 'True'
+# bsdiff 需要把新旧文件读入内存，另需约 10 倍于旧文件大小的工作内存（后缀数组），
+# 64MB 的安装包单个任务即需要约 1GB 内存，且 run_jobs 的每个工作进程都可能同时生成；
+# 超过该大小的安装包不生成差分包，调大前需按 工作进程数 × 内存占用 评估主机内存
+APP_DELTA_MAX_FILE_SIZE = int(os.getenv('APP_DELTA_MAX_FILE_SIZE', 64 * 1024 * 1024))
+# 差分包大小超过目标文件该比例时视为没有收益，不保存
+APP_DELTA_MAX_RATIO = float(os.getenv('APP_DELTA_MAX_RATIO', 0.8))
+
+# 下载计数先累加在本机 SQLite 旁路表中，留空则放在 APP_STORAGE 下
+APP_DOWNLOAD_COUNTER_DB = os.getenv('APP_DOWNLOAD_COUNTER_DB', '')
+# flush_download_counters --interval 的默认写回间隔（秒）
+APP_DOWNLOAD_COUNTER_FLUSH_INTERVAL = int(os.getenv('APP_DOWNLOAD_COUNTER_FLUSH_INTERVAL', 60))
+
+# 静态目录索引（全部应用及其最新版本），版本变化后在后台增量更新；留空目录则放在 APP_STORAGE/catalog
+APP_CATALOG_INDEX = os.getenv('APP_CATALOG_INDEX', 'True') == 'True'
+APP_CATALOG_DIR = os.getenv('APP_CATALOG_DIR', '')
+# 变化后推迟多少秒更新索引（由 run_jobs 执行），期间同一应用的多次变化合并为一次重写
+APP_CATALOG_UPDATE_DELAY = int(os.getenv('APP_CATALOG_UPDATE_DELAY', 5))
+# 索引响应的 Cache-Control max-age（秒），过期后客户端带 If-None-Match 重新验证
+APP_CATALOG_MAX_AGE = int(os.getenv('APP_CATALOG_MAX_AGE', 60))
+
+# 版本接口签发的签名下载链接的时间窗口（秒），链接的剩余有效期在 1 到 2 个窗口之间
+APP_SIGNED_URL_TTL = int(os.getenv('APP_SIGNED_URL_TTL', 60 * 60))
+# 签名下载链接的协议与主机（例如 CDN 域名 https://cdn.example.com），留空则使用请求的主机
+APP_SIGNED_URL_BASE = os.getenv('APP_SIGNED_URL_BASE', '')
+
+# 安装包内容清单最多保存的文件条目数，超出部分只计入文件数与总大小
+APP_MANIFEST_MAX_ENTRIES = int(os.getenv('APP_MANIFEST_MAX_ENTRIES', 5000))
+
+# 后台任务（manage.py run_jobs）：上传后的校验、清单解析、差分包生成等。
+# 必须与 Web 服务一同运行 run_jobs，否则新上传的版本会一直停留在 pending（任务积压时会记录警告）
+# 工作进程数，留空则为 CPU 核数
+APP_JOB_WORKERS = int(os.getenv('APP_JOB_WORKERS') or os.cpu_count() or 1)
+# 任务最多执行次数，失败后按 APP_JOB_RETRY_DELAY 指数退避重试
+APP_JOB_MAX_ATTEMPTS = int(os.getenv('APP_JOB_MAX_ATTEMPTS', 5))
+APP_JOB_RETRY_DELAY = int(os.getenv('APP_JOB_RETRY_DELAY', 30))
+# 执行超过该时间（秒）的任务视为工作进程已退出，重新排队
+APP_JOB_TIMEOUT = int(os.getenv('APP_JOB_TIMEOUT', 60 * 60))
+# 已完成任务的保留时间（秒）
+APP_JOB_RETENTION = int(os.getenv('APP_JOB_RETENTION', 7 * 24 * 60 * 60))
+
+# 版本列表 / 最新版本接口的 Cache-Control max-age（秒），过期后客户端与 CDN 带 If-None-Match 重新验证
+APP_VERSION_API_MAX_AGE = int(os.getenv('APP_VERSION_API_MAX_AGE', 60))
+
+# /metrics 的访问令牌（Authorization: Bearer <token>）；留空时只在 DEBUG 下开放，否则返回 403
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 # ====================== #
 #      REST 框架配置      #
 # ====================== #
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        # orjson 渲染，未安装 orjson 时自动退回 JSONRenderer
+        'core.renderers.ORJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -146,6 +257,16 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.FormParser',
     ],
     'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.UserTokenBucketThrottle',
+        'core.throttling.IPTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': APP_THROTTLE_USER_RATE,
+        'ip': APP_THROTTLE_IP_RATE,
+    },
+    # 位于反向代理之后时设置为代理层数，限流按 X-Forwarded-For 中的客户端 IP 计算
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES')) if os.getenv('NUM_PROXIES') else None,
 }
 
 # ====================== #
@@ -165,6 +286,16 @@ AUTHENTICATION_BACKENDS = (
 GITHUB_CLIENT_ID = os.getenv('GITHUB_CLIENT_ID')
 GITHUB_CLIENT_SECRET = os.getenv('GITHUB_CLIENT_SECRET')
 GITHUB_REDIRECT_URI = os.getenv('GITHUB_REDIRECT_URI', 'http://127.0.0.1:8000/github-callback/')
+GITHUB_OAUTH_URL = os.getenv('GITHUB_OAUTH_URL', 'https://github.com/login/oauth')
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+GITHUB_VERIFY_SSL = os.getenv('GITHUB_VERIFY_SSL', 'True') == 'True'
+# 调用 GitHub 的连接/读取超时（秒）与幂等请求的重试次数
+GITHUB_CONNECT_TIMEOUT = float(os.getenv('GITHUB_CONNECT_TIMEOUT', 3.05))
+GITHUB_READ_TIMEOUT = float(os.getenv('GITHUB_READ_TIMEOUT', 10))
+GITHUB_RETRIES = int(os.getenv('GITHUB_RETRIES', 2))
+# 连续失败达到该次数后熔断，冷却 GITHUB_CIRCUIT_RESET_TIMEOUT 秒后再试探
+GITHUB_CIRCUIT_FAILURES = int(os.getenv('GITHUB_CIRCUIT_FAILURES', 5))
+GITHUB_CIRCUIT_RESET_TIMEOUT = float(os.getenv('GITHUB_CIRCUIT_RESET_TIMEOUT', 30))
 
 SOCIAL_AUTH_PIPELINE = (
     'social_core.pipeline.social_auth.social_details',
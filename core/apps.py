@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # 注册目录索引更新信号、查询计数、后台任务处理函数与部署检查
+        from . import catalog, checks, deltas, metrics, processing  # noqa: F401
@@ -0,0 +1,13 @@
+# async_urls.py
+from django.urls import path
+from . import async_views
+
+# ASGI 部署下由异步视图处理的路由，路径和名称与 core.urls 中的同步版本一致
+urlpatterns = [
+    path('apps/<str:app_id>/versions/', async_views.app_versions, name='app-versions'),
+    path('apps/<str:app_id>/versions/<str:version>/download/', async_views.download_app_version,
+         name='download-app-version'),
+    path('apps/<str:app_id>/versions/latest/', async_views.latest_version, name='latest-version'),
+    path('dl/<str:app_id>/<str:version>/<str:token>/<str:file_name>', async_views.signed_download,
+         name='signed-download'),
+]
@@ -0,0 +1,195 @@
+# async_views.py
+"""
+ASGI 部署下的异步视图：下载、最新版本查询与版本列表。
+
+与 views 中的同步实现返回相同的数据，区别在于等待数据库与慢速客户端时不占用线程，
+单个 uvicorn 工作进程即可同时服务大量下载连接。由 Appstore.asgi_urls 路由。
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from rest_framework.request import Request
+
+from . import manifests, signed_downloads, throttling, views
+from .conditional import apply_headers, aversion_validators, not_modified, validator_headers
+from .counters import record_download, should_count
+from .downloads import storage_download_response
+from .models import AppVersion
+from .pagination import VersionCursorPagination, version_list_columns
+from .renderers import ORJSONRenderer
+from .serializers import AppVersionSerializer
+from .storage import get_storage
+
+_sync_app_versions = views.AppVersionAPI.as_view()
+_renderer = ORJSONRenderer()
+
+
+def _json_response(data, status=200):
+    """与同步接口使用同一渲染器，输出逐字节一致"""
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+@require_safe
+async def download_app_version(request, app_id, version):
+    """下载特定版本应用（异步流式发送）"""
+    # 不使用异步的 login_required：它依赖认证后端的 aget_user，GitHub 登录后端没有实现
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    throttled = await asyncio.to_thread(throttling.check_ip_throttle, request)
+    if throttled is not None:
+        return throttled
+
+    app_version = await AppVersion.objects.select_related('application').filter(
+        application__app_id=app_id,
+        version=version
+    ).exclude(processing_state=AppVersion.FAILED).afirst()
+    if app_version is None:
+        return _json_response({"error": "版本不存在"}, status=404)
+
+    storage = get_storage()
+    if not await asyncio.to_thread(storage.exists, app_version.storage_key):
+        return _json_response({"error": "文件不存在"}, status=404)
+
+    slot = await asyncio.to_thread(throttling.acquire_download_slot, throttling.download_identity(request, user))
+    if slot is None:
+        return throttling.too_many_requests(throttling.SLOT_RETRY_AFTER, "同时进行的下载过多，请稍后再试")
+
+    if should_count(request):
+        await asyncio.to_thread(record_download, app_version.id, app_version.application_id)
+
+    try:
+        response = await asyncio.to_thread(
+            storage_download_response,
+            request,
+            storage,
+            app_version.storage_key,
+            app_version.file_name,
+            md5_hash=app_version.md5_hash,
+            asynchronous=True
+        )
+    except BaseException:
+        slot.release()
+        raise
+    return throttling.finish_download(response, slot)
+
+
+@require_safe
+async def signed_download(request, app_id, version, token, file_name):
+    """签名下载链接（异步流式发送），校验与限流逻辑与 views.signed_download 相同"""
+    throttled = await asyncio.to_thread(throttling.check_ip_throttle, request)
+    if throttled is not None:
+        return throttled
+    grant = signed_downloads.verify(token, app_id, version, file_name)
+    if grant is None:
+        return _json_response({"error": "下载链接无效或已过期"}, status=403)
+
+    storage = get_storage()
+    if not await asyncio.to_thread(storage.exists, grant['k']):
+        return _json_response({"error": "文件不存在"}, status=404)
+
+    slot = await asyncio.to_thread(throttling.acquire_download_slot, throttling.download_identity(request))
+    if slot is None:
+        return throttling.too_many_requests(throttling.SLOT_RETRY_AFTER, "同时进行的下载过多，请稍后再试")
+
+    if should_count(request):
+        await asyncio.to_thread(record_download, grant['i'], grant['p'])
+
+    try:
+        response = await asyncio.to_thread(
+            storage_download_response,
+            request,
+            storage,
+            grant['k'],
+            grant['n'],
+            md5_hash=grant['h'],
+            asynchronous=True
+        )
+    except BaseException:
+        slot.release()
+        raise
+    return throttling.finish_download(signed_downloads.apply_cache_headers(response, grant), slot)
+
+
+@require_safe
+async def latest_version(request, app_id):
+    """获取最新版本信息，查询逻辑与条件请求处理与 LatestVersionAPI 相同"""
+    throttled = await asyncio.to_thread(throttling.check_ip_throttle, request)
+    if throttled is not None:
+        return throttled
+    validators = await aversion_validators(app_id)
+    if validators is None:
+        return _json_response({"error": f"应用ID '{app_id}' 不存在"}, status=404)
+    if not validators['version_count']:
+        return _json_response({"error": "该应用暂无可用版本"}, status=404)
+    user = await sync_to_async(get_user)(request)
+    headers = validator_headers(request, validators, 'latest', signed=user.is_authenticated)
+    response = not_modified(request, validators, headers)
+    if response is not None:
+        return response
+
+    version = await AppVersion.objects.filter(
+        application_id=validators['id'], processing_state=AppVersion.READY
+    ).annotate(**manifests.MANIFEST_ANNOTATIONS).order_by('-sort_key', '-upload_time').afirst()
+    if version is None:
+        return apply_headers(_json_response({"error": "该应用暂无可用版本"}, status=404), headers)
+    data = AppVersionSerializer(version).data
+    if user.is_authenticated:
+        signed_downloads.add_download_urls(request, app_id, [version], [data])
+    manifests.add_manifest_summaries([version], [data])
+    return apply_headers(_json_response(data), headers)
+
+
+@csrf_exempt
+async def app_versions(request, app_id):
+    """
+    获取应用所有版本信息。
+
+    上传新版本（POST）仍交给同步的 AppVersionAPI：请求体解析与哈希计算本身就是阻塞操作，
+    CSRF 校验也由其 SessionAuthentication 负责。
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return await sync_to_async(_sync_app_versions)(request, app_id=app_id)
+
+    throttled = await asyncio.to_thread(throttling.check_ip_throttle, request)
+    if throttled is not None:
+        return throttled
+
+    try:
+        mapper, with_url, with_manifest = views.version_list_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return _json_response({"error": str(e)}, status=400)
+
+    validators = await aversion_validators(app_id)
+    if validators is None:
+        return _json_response({"error": f"应用ID '{app_id}' 不存在"}, status=404)
+    user = await sync_to_async(get_user)(request)
+    with_url = with_url and user.is_authenticated
+    headers = validator_headers(request, validators, 'versions', signed=with_url)
+    response = not_modified(request, validators, headers)
+    if response is not None:
+        return response
+
+    # 游标分页沿用 VersionCursorPagination，游标格式与同步接口通用；
+    # DRF 的分页器只有同步实现，与 Django 异步 ORM 一样在 sync_to_async 中执行查询
+    paginator = VersionCursorPagination()
+    versions = AppVersion.objects.filter(application_id=validators['id']).values(
+        *version_list_columns(mapper, views.version_list_extra_columns(with_url, with_manifest))
+    )
+    page = await sync_to_async(paginator.paginate_queryset)(versions, Request(request))
+
+    data = mapper.map(page)
+    if with_url:
+        signed_downloads.add_download_urls(request, app_id, page, data)
+    if with_manifest:
+        manifests.add_manifest_summaries(page, data)
+    response = _json_response(data)
+    link = paginator.get_paginated_response([]).get('Link')
+    if link:
+        response['Link'] = link
+    return apply_headers(response, headers)
@@ -0,0 +1,96 @@
+# benchmarks.py
+"""性能基准命令共用的工具：合成文本、延迟统计与运行环境信息"""
+import itertools
+import platform
+import statistics
+import subprocess
+
+import django
+from django.conf import settings
+from django.db import connection
+
+SYLLABLES = [
+    'ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'zo', 'pi', 'sa', 'vo', 'de', 'gu', 'chi', 'an', 'el', 'or',
+    'tra', 'ven', 'dor', 'lum', 'pix', 'nov', 'sync', 'mat',
+]
+
+
+def build_vocabulary(rng, size=20000):
+    """由音节拼出的合成词表，按词长排序，配合 zipf_weights 抽样时短词更常见"""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words, key=lambda word: (len(word), word))
+
+
+def zipf_weights(size):
+    """Zipf 分布的累积权重，供 random.choices(cum_weights=...) 使用（比传 weights 快得多）"""
+    return list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def parse_size(text):
+    """解析 64K / 1M / 2G 形式的大小，返回字节数"""
+    text = text.strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for unit, factor in (('G', 1024 ** 3), ('M', 1024 ** 2), ('K', 1024)):
+        if size >= factor and size % factor == 0:
+            return f'{size // factor}{unit}'
+    return str(size)
+
+
+def percentile(samples, percent):
+    """最近秩百分位数，样本为空时返回 None"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_ms, elapsed_seconds=None, ndigits=3):
+    """把一组毫秒延迟汇总为 count / mean / p50 / p95 / p99 / max 及吞吐量"""
+    summary = {
+        'count': len(samples_ms),
+        'mean_ms': round(statistics.mean(samples_ms), ndigits) if samples_ms else None,
+    }
+    for percent in (50, 95, 99):
+        value = percentile(samples_ms, percent)
+        summary[f'p{percent}_ms'] = round(value, ndigits) if value is not None else None
+    summary['max_ms'] = round(max(samples_ms), ndigits) if samples_ms else None
+    if elapsed_seconds:
+        summary['throughput_rps'] = round(len(samples_ms) / elapsed_seconds, 2)
+    return summary
+
+
+def git_revision():
+    """当前代码的提交号与工作区是否有未提交修改，不在 git 仓库中时返回 (None, None)"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def environment_info():
+    """写入结果文件的运行环境，便于判断两次结果是否可比"""
+    commit, dirty = git_revision()
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'platform': platform.platform(),
+    }
@@ -0,0 +1,94 @@
+# blobstore.py
+"""内容寻址的安装包存储：相同内容只保存一份"""
+import os
+
+from django.db import IntegrityError, transaction
+
+from .models import AppVersion, Blob, _delete_blob_file, blob_key
+from .processing import schedule_processing
+from .storage import get_storage
+
+
+def _get_or_create_blob(md5_hash, sha256_hash, size):
+    try:
+        with transaction.atomic():
+            return Blob.objects.get_or_create(
+                sha256_hash=sha256_hash,
+                defaults={'md5_hash': md5_hash, 'size': size}
+            )
+    except IntegrityError:
+        # 并发上传相同内容时，另一请求已先创建了记录
+        return Blob.objects.get(sha256_hash=sha256_hash), False
+
+
+def store_uploaded_file(uploaded_file):
+    """保存 HashingUploadedFile；内容已存在时不再写入，临时文件在请求结束时自动删除"""
+    blob, _ = _get_or_create_blob(uploaded_file.md5_hash, uploaded_file.sha256_hash, uploaded_file.size)
+    storage = get_storage()
+    if not storage.exists(blob.storage_key):
+        uploaded_file.commit(storage, blob.storage_key)
+    return blob
+
+
+def store_local_file(temp_path, md5_hash, sha256_hash, size):
+    """保存本地临时文件（例如分块上传拼接出的文件），内容已存在时直接删除临时文件"""
+    blob, _ = _get_or_create_blob(md5_hash, sha256_hash, size)
+    storage = get_storage()
+    if storage.exists(blob.storage_key):
+        os.remove(temp_path)
+    else:
+        storage.put_file(blob.storage_key, temp_path)
+    return blob
+
+
+def find_blob(sha256_hash, size):
+    """按哈希与大小查找已存储且文件完整的内容"""
+    blob = Blob.objects.filter(sha256_hash=sha256_hash.lower(), size=size).first()
+    if blob is None or not get_storage().exists(blob_key(blob.sha256_hash)):
+        return None
+    return blob
+
+
+def discard_unreferenced_blob(blob):
+    """删除没有任何版本引用的内容及其文件，加锁方式与 models.release_blob 相同"""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=blob.pk).first()
+        if blob is None or blob.ref_count or AppVersion.objects.filter(blob_id=blob.pk).exists():
+            return
+        sha256_hash = blob.sha256_hash
+        blob.delete()
+    transaction.on_commit(lambda: _delete_blob_file(sha256_hash))
+
+
+def create_version_from_blob(application, version, file_name, blob, release_notes='', **extra):
+    """
+    创建引用 blob 的版本记录（引用计数由 post_save 信号维护），版本进入 pending 状态，
+    校验等处理由后台任务完成。
+
+    版本号已存在（并发上传同一版本时另一请求先完成）时抛出 IntegrityError，
+    本次存入而没有被引用的内容随之删除
+    """
+    try:
+        with transaction.atomic():
+            # 锁住内容记录直到版本创建完成，期间删除最后一个引用它的版本会等待，不会删除该内容
+            if Blob.objects.select_for_update().filter(pk=blob.pk).first() is None:
+                # 取得 blob 之后、加锁之前内容已被删除：重新登记，避免版本引用已删除的记录。
+                # 文件若已随之删除，后台校验会把版本标记为失败
+                blob, _ = _get_or_create_blob(blob.md5_hash, blob.sha256_hash, blob.size)
+            app_version = AppVersion.objects.create(
+                application=application,
+                version=version,
+                file_name=file_name,
+                file_size=blob.size,
+                md5_hash=blob.md5_hash,
+                sha256_hash=blob.sha256_hash,
+                release_notes=release_notes,
+                blob=blob,
+                processing_state=AppVersion.PENDING,
+                **extra
+            )
+            schedule_processing(app_version)
+    except IntegrityError:
+        discard_unreferenced_blob(blob)
+        raise
+    return app_version
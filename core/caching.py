@@ -0,0 +1,53 @@
+# caching.py
+"""基于代数计数器失效的缓存，以及防止缓存击穿的互斥计算"""
+import time
+
+from django.core.cache import cache
+
+MARKET_GENERATION_KEY = 'market:generation'
+
+
+def market_generation():
+    """当前市场数据的代数，应用或版本变化后递增，旧代数的缓存自然失效"""
+    generation = cache.get(MARKET_GENERATION_KEY)
+    if generation is None:
+        # 计数器被淘汰后以毫秒时间戳重新开始，避免与淘汰前的代数重复而读到旧缓存
+        cache.add(MARKET_GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(MARKET_GENERATION_KEY)
+    return generation
+
+
+def bump_market_generation():
+    try:
+        cache.incr(MARKET_GENERATION_KEY)
+    except ValueError:
+        cache.add(MARKET_GENERATION_KEY, int(time.time() * 1000), None)
+
+
+def get_or_compute(key, compute, timeout, lock_timeout=10, poll_interval=0.05, max_wait=2.0):
+    """
+    读取缓存，未命中时只允许一个请求计算并回填。
+
+    其他并发请求短暂轮询等待结果，超过 max_wait 仍未得到结果时自行计算，
+    保证持锁进程崩溃时也不会长时间阻塞。
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + max_wait
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
@@ -0,0 +1,256 @@
+# catalog.py
+"""
+静态目录索引：一个列出全部应用及其最新版本的 JSON 文档，供客户端和镜像站一次性拉取全量目录。
+
+- 索引按内容摘要命名写入 APP_CATALOG_DIR（index-<digest>.json 及预压缩的 .gz / .br），
+  全部写完后原子替换 current.json 指向新摘要，读取方不会读到写了一半的文件
+- 版本或应用变化后只重新查询受影响的应用，其余条目沿用上一份索引，由 run_jobs 的后台任务合并更新
+- 摘要同时作为强 ETag，客户端轮询时未变化只需返回 304
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from . import jobs
+from .models import Application, AppVersion
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只有进程内互斥
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # 未安装时只生成 gzip 版本
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+POINTER_NAME = 'current.json'
+# 预压缩版本：(Content-Encoding, 文件后缀)，按协商优先级排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# 每次目录变化都会重新压缩整个索引；默认的 11 级比 5 级慢一个数量级以上，体积只小几个百分点
+BROTLI_QUALITY = 5
+
+_local_lock = threading.Lock()
+
+
+def catalog_dir():
+    return settings.APP_CATALOG_DIR or os.path.join(settings.APP_STORAGE, 'catalog')
+
+
+def index_path(digest, encoding=None, directory=None):
+    suffix = dict(ENCODINGS)[encoding] if encoding else ''
+    return os.path.join(directory or catalog_dir(), f'index-{digest}.json{suffix}')
+
+
+def index_etag(digest, encoding=None):
+    """每种编码的字节不同，强 ETag 需要区分编码"""
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def read_pointer(directory=None):
+    """当前索引的 {digest, encodings, count, size}，尚未生成时返回 None"""
+    try:
+        with open(os.path.join(directory or catalog_dir(), POINTER_NAME), 'rb') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _entry(application, latest):
+    entry = {
+        'id': application['id'],
+        'app_id': application['app_id'],
+        'name': application['name'],
+        'owner': application['owner__username'],
+        'latest_version': None,
+    }
+    if latest is not None:
+        entry['latest_version'] = {
+            'version': latest['version'],
+            'file_name': latest['file_name'],
+            'file_size': latest['file_size'],
+            'md5_hash': latest['md5_hash'],
+            'sha256_hash': latest['sha256_hash'],
+            'upload_time': latest['upload_time'],
+            'processing_state': latest['processing_state'],
+            'download_url': reverse('download-app-version', args=[application['app_id'], latest['version']]),
+        }
+    return entry
+
+
+def _query_entries(application_ids=None):
+    """两条查询取出应用及其最新可用版本，application_ids 为 None 时查询全部应用"""
+    applications = Application.objects.all()
+    versions = AppVersion.objects.all()
+    if application_ids is not None:
+        applications = applications.filter(id__in=application_ids)
+        versions = versions.filter(application_id__in=application_ids)
+
+    latest_id = AppVersion.objects.filter(
+        application=OuterRef('application'), processing_state=AppVersion.READY
+    ).order_by('-sort_key', '-upload_time').values('id')[:1]
+    latest = {
+        row['application_id']: row for row in versions.filter(id=Subquery(latest_id)).values(
+            'application_id', 'version', 'file_name', 'file_size', 'md5_hash', 'sha256_hash', 'upload_time',
+            'processing_state'
+        ).iterator()
+    }
+    return {
+        row['id']: _entry(row, latest.get(row['id']))
+        for row in applications.values('id', 'app_id', 'name', 'owner__username').iterator()
+    }
+
+
+def _load_entries(directory, pointer):
+    with open(index_path(pointer['digest'], directory=directory), 'rb') as f:
+        document = json.load(f)
+    return {entry['id']: entry for entry in document['applications']}
+
+
+def _atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp 创建的文件只有属主可读，索引可能直接由前端 Web 服务器发送
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_old_generations(directory, keep):
+    for name in os.listdir(directory):
+        if name.startswith('index-') and name.split('.', 1)[0][len('index-'):] not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def _write_index(directory, entries, previous):
+    document = {
+        'format': FORMAT_VERSION,
+        'count': len(entries),
+        'applications': sorted(entries.values(), key=lambda entry: entry['app_id']),
+    }
+    data = json.dumps(document, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    if previous is not None and previous['digest'] == digest:
+        return previous
+
+    _atomic_write(index_path(digest, directory=directory), data)
+    encodings = []
+    for encoding, _ in ENCODINGS:
+        if encoding == 'br':
+            if brotli is None:
+                continue
+            compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+        else:
+            # 固定 mtime，相同内容的压缩结果逐字节一致
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        _atomic_write(index_path(digest, encoding, directory), compressed)
+        encodings.append(encoding)
+
+    pointer = {'digest': digest, 'encodings': encodings, 'count': len(entries), 'size': len(data)}
+    # 指针最后替换，此前读取方看到的始终是完整的旧索引
+    _atomic_write(os.path.join(directory, POINTER_NAME), json.dumps(pointer).encode())
+    # 保留上一份索引，刚读到旧指针的请求仍能打开对应文件
+    _remove_old_generations(directory, {digest, previous['digest'] if previous is not None else digest})
+    return pointer
+
+
+@contextmanager
+def _write_lock(directory):
+    """同一时间只有一个线程 / 进程改写索引"""
+    os.makedirs(directory, exist_ok=True)
+    with _local_lock, open(os.path.join(directory, '.lock'), 'wb') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def rebuild_catalog_index():
+    """从数据库全量生成索引，返回新的指针"""
+    directory = catalog_dir()
+    with _write_lock(directory):
+        return _write_index(directory, _query_entries(), read_pointer(directory))
+
+
+def update_catalog_index(application_ids):
+    """只重新查询给定应用的条目并合并进当前索引；索引尚不存在时全量生成"""
+    directory = catalog_dir()
+    with _write_lock(directory):
+        previous = read_pointer(directory)
+        if previous is None:
+            return _write_index(directory, _query_entries(), None)
+        entries = _load_entries(directory, previous)
+        fresh = _query_entries(application_ids)
+        for application_id in application_ids:
+            if application_id in fresh:
+                entries[application_id] = fresh[application_id]
+            else:
+                entries.pop(application_id, None)
+        return _write_index(directory, entries, previous)
+
+
+def open_catalog_index(accepted_encodings=()):
+    """
+    打开当前索引中客户端接受的最优编码版本，返回 (文件对象, 指针, 编码)；
+    编码为 None 表示未压缩。索引不存在时先全量生成
+    """
+    for _ in range(3):
+        pointer = read_pointer() or rebuild_catalog_index()
+        encoding = next(
+            (encoding for encoding, _ in ENCODINGS
+             if encoding in pointer['encodings'] and (encoding in accepted_encodings or '*' in accepted_encodings)),
+            None
+        )
+        try:
+            return open(index_path(pointer['digest'], encoding), 'rb'), pointer, encoding
+        except FileNotFoundError:
+            # 读取指针后索引又被替换了两次，重新读取指针
+            continue
+    raise FileNotFoundError("目录索引在读取期间被反复替换")
+
+
+# 后台合并更新：变化后推迟 APP_CATALOG_UPDATE_DELAY 秒执行，期间同一应用的多次变化只重写一次索引
+
+@jobs.register('update_catalog_index')
+def update_catalog_job(application_id):
+    update_catalog_index({application_id})
+
+
+def schedule_catalog_update(application_id):
+    """在当前事务中排队，事务回滚时随之取消"""
+    jobs.enqueue_debounced('update_catalog_index', settings.APP_CATALOG_UPDATE_DELAY, application_id=application_id)
+
+
+@receiver(post_save, sender=AppVersion)
+@receiver(post_delete, sender=AppVersion)
+def update_catalog_on_version_change(sender, instance, **kwargs):
+    if settings.APP_CATALOG_INDEX:
+        schedule_catalog_update(instance.application_id)
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def update_catalog_on_application_change(sender, instance, **kwargs):
+    if settings.APP_CATALOG_INDEX:
+        schedule_catalog_update(instance.pk)
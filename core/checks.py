@@ -0,0 +1,41 @@
+# checks.py
+"""配置检查：配置错误在启动时报错，部署相关的警告由 manage.py check --deploy 执行"""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+from .downloads import OFFLOAD_MODES
+
+# 计数只在当前进程内有效（或根本不保存）的缓存后端
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_download_offload(app_configs, **kwargs):
+    """下载转发模式写错时每次下载都会失败，在启动时而不是请求时报错"""
+    mode = settings.APP_DOWNLOAD_OFFLOAD
+    if not mode or mode in OFFLOAD_MODES:
+        return []
+    return [Error(
+        f"未知的下载转发模式 APP_DOWNLOAD_OFFLOAD={mode!r}",
+        hint=f"可选值为 {'、'.join(OFFLOAD_MODES)}，留空则由 Django 发送文件",
+        id='core.E001',
+    )]
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    限流令牌桶与下载并发计数保存在缓存中。进程内缓存下每个工作进程各自计数，
+    多进程 / 多机部署时实际上限是配置值乘以进程数，必须使用 Redis、Memcached 等共享缓存
+    """
+    caps = settings.APP_DOWNLOAD_CONCURRENCY_PER_USER or settings.APP_DOWNLOAD_CONCURRENCY_GLOBAL
+    if not caps or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        "下载并发上限与接口限流使用进程内缓存计数，多个工作进程时各自计数，上限不会生效",
+        hint="配置 REDIS_URL 使用共享缓存；只运行单个工作进程时可以忽略",
+        id='core.W001',
+    )]
@@ -0,0 +1,95 @@
+# conditional.py
+"""
+版本接口的条件请求：由应用的版本数与最新上传时间生成 ETag / Last-Modified，
+客户端轮询时数据未变化直接返回 304，不再查询版本、序列化和发送响应体。
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from . import signed_downloads
+from .models import Application, AppVersion
+
+
+def _validators_queryset(app_id):
+    return Application.objects.filter(app_id=app_id).annotate(
+        version_count=Count('appversion'),
+        last_upload=Max('appversion__upload_time'),
+        # 后台处理完成（pending -> ready / failed）不改变以上两项，需要单独计入
+        pending_count=Count('appversion', filter=Q(appversion__processing_state=AppVersion.PENDING)),
+        failed_count=Count('appversion', filter=Q(appversion__processing_state=AppVersion.FAILED)),
+        # 第一次查看旧版本的清单时生成的清单摘要同样出现在版本接口中
+        last_manifest=Max('appversion__manifest__created_at'),
+    ).values('id', 'version_count', 'last_upload', 'pending_count', 'failed_count', 'last_manifest')
+
+
+def version_validators(app_id):
+    """
+    一条聚合查询取出 {id, version_count, last_upload, pending_count, failed_count, last_manifest}，
+    应用不存在时返回 None。
+
+    新增版本同时改变两者；删除版本只改变版本数，因此 Last-Modified 不一定变化，
+    客户端应优先使用 ETag
+    """
+    return _validators_queryset(app_id).first()
+
+
+async def aversion_validators(app_id):
+    return await _validators_queryset(app_id).afirst()
+
+
+def validator_headers(request, validators, resource, signed=False):
+    """
+    resource 区分同一应用下的不同接口（版本列表 / 最新版本），
+    查询参数（分页游标）参与 ETag 计算，每一页各有自己的校验器。
+
+    signed 表示响应中带有签名下载链接（仅对已登录用户签发）：链接按时间窗口签发，窗口变化后
+    ETag 随之变化，客户端不会一直沿用过期的链接；这类响应只允许浏览器缓存，不能进入 CDN 等共享缓存。
+    同一地址的内容随登录状态不同，响应均按 Cookie 与 Authorization 区分缓存
+    """
+    last_upload = validators['last_upload']
+    key = ':'.join([
+        resource,
+        str(validators['id']),
+        str(validators['version_count']),
+        str(validators['pending_count']),
+        str(validators['failed_count']),
+        validators['last_manifest'].isoformat() if validators['last_manifest'] else '',
+        last_upload.isoformat() if last_upload else '',
+        request.GET.urlencode(),
+        f'signed:{signed_downloads.current_window()}' if signed else 'anonymous',
+    ])
+    headers = {
+        'ETag': quote_etag(hashlib.md5(key.encode()).hexdigest()),
+        'Cache-Control': f"{'private' if signed else 'public'}, max-age={settings.APP_VERSION_API_MAX_AGE}",
+        'Vary': 'Cookie, Authorization',
+    }
+    if last_upload:
+        headers['Last-Modified'] = http_date(last_upload.timestamp())
+    return headers
+
+
+def not_modified(request, validators, headers):
+    """条件满足时返回带校验器的 304（或 412）响应，否则返回 None"""
+    last_upload = validators['last_upload']
+    response = get_conditional_response(
+        request,
+        etag=headers['ETag'],
+        last_modified=int(last_upload.timestamp()) if last_upload else None,
+    )
+    if response is not None:
+        apply_headers(response, headers)
+    return response
+
+
+def apply_headers(response, headers):
+    for name, value in headers.items():
+        if name == 'Vary':
+            # 保留渲染器、压缩中间件等已设置的 Vary
+            patch_vary_headers(response, value.split(', '))
+        else:
+            response[name] = value
+    return response
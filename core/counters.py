@@ -0,0 +1,183 @@
+# counters.py
+"""
+下载计数的写后缓冲：下载请求只在本机 SQLite 旁路表中原子累加，
+由 flush_download_counters 命令定期批量写回数据库并汇总为小时/天统计。
+"""
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .models import AppVersion, Application, DownloadStatDaily, DownloadStatHourly
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_downloads (
+    version_id INTEGER NOT NULL,
+    application_id INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    PRIMARY KEY (version_id, hour)
+)
+"""
+
+
+def counter_db_path():
+    return settings.APP_DOWNLOAD_COUNTER_DB or os.path.join(settings.APP_STORAGE, '.download_counters.sqlite3')
+
+
+def _connection():
+    """每个线程复用一个到旁路表的连接（WAL 模式，多进程并发写入安全）"""
+    path = counter_db_path()
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(SCHEMA)
+        connections[path] = conn
+    return conn
+
+
+def should_count(request):
+    """断点续传的后续区间请求不重复计数"""
+    range_header = request.META.get('HTTP_RANGE', '')
+    return not range_header or range_header.replace(' ', '').startswith('bytes=0-')
+
+
+def _discard_connection():
+    conn = getattr(_local, 'connections', {}).pop(counter_db_path(), None)
+    if conn is not None:
+        conn.close()
+
+
+def record_download(version_id, application_id):
+    """
+    累加一次下载，不访问主数据库。计数只是尽力而为：旁路表被锁超时、磁盘只读或已满时
+    记录日志并丢弃这次计数，不影响下载本身
+    """
+    hour = int(time.time()) // 3600 * 3600
+    try:
+        _connection().execute(
+            "INSERT INTO pending_downloads (version_id, application_id, hour, hits) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (version_id, hour) DO UPDATE SET hits = hits + 1",
+            (version_id, application_id, hour)
+        )
+    except (sqlite3.Error, OSError):
+        logger.exception(f"下载计数写入失败，已丢弃: AppVersion {version_id}")
+        # 出错的连接可能已不可用，下次重新打开
+        _discard_connection()
+
+
+def _bulk_increment(model, counts):
+    """单条 UPDATE ... SET download_count = download_count + CASE id ... 批量累加"""
+    if not counts:
+        return
+    model.objects.filter(pk__in=counts.keys()).update(
+        download_count=F('download_count') + Case(
+            *[When(pk=pk, then=Value(hits)) for pk, hits in counts.items()],
+            default=Value(0)
+        )
+    )
+
+
+def _merge_rollup(model, period_field, counts):
+    """把 {(version_id, application_id, period): hits} 合并进汇总表"""
+    if not counts:
+        return
+    keys = {(version_id, period) for version_id, _, period in counts}
+    existing = {
+        (row.version_id, getattr(row, period_field)): row
+        for row in model.objects.filter(
+            version_id__in={version_id for version_id, _ in keys},
+            **{f'{period_field}__in': {period for _, period in keys}}
+        )
+    }
+    to_update, to_create = [], []
+    for (version_id, application_id, period), hits in counts.items():
+        row = existing.get((version_id, period))
+        if row is not None:
+            row.count += hits
+            to_update.append(row)
+        else:
+            to_create.append(model(
+                version_id=version_id, application_id=application_id, count=hits, **{period_field: period}
+            ))
+    if to_update:
+        model.objects.bulk_update(to_update, ['count'])
+    if to_create:
+        model.objects.bulk_create(to_create)
+
+
+def _flush_batch(conn, rows):
+    version_ids = {version_id for version_id, _, _, _ in rows}
+    live_versions = set(AppVersion.objects.filter(pk__in=version_ids).values_list('pk', flat=True))
+
+    per_version = defaultdict(int)
+    per_app = defaultdict(int)
+    hourly = defaultdict(int)
+    daily = defaultdict(int)
+    for version_id, application_id, hour, hits in rows:
+        if version_id not in live_versions:
+            # 版本已删除，丢弃其计数
+            continue
+        hour_start = datetime.datetime.fromtimestamp(hour, tz=datetime.timezone.utc)
+        per_version[version_id] += hits
+        per_app[application_id] += hits
+        hourly[(version_id, application_id, hour_start)] += hits
+        daily[(version_id, application_id, hour_start.date())] += hits
+
+    with transaction.atomic():
+        _bulk_increment(AppVersion, per_version)
+        _bulk_increment(Application, per_app)
+        _merge_rollup(DownloadStatHourly, 'hour', hourly)
+        _merge_rollup(DownloadStatDaily, 'day', daily)
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.executemany(
+            "UPDATE pending_downloads SET hits = hits - ? WHERE version_id = ? AND hour = ?",
+            [(hits, version_id, hour) for version_id, _, hour, hits in rows]
+        )
+        conn.execute("DELETE FROM pending_downloads WHERE hits <= 0")
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return sum(per_version.values())
+
+
+def flush_download_counters(batch_size=5000):
+    """
+    把旁路表中的计数分批写回数据库，返回写回的下载次数。
+
+    每批先读取待写回的计数，在数据库事务提交后再从旁路表中扣除相同的数量，
+    期间新增的下载不会丢失；数据库写入失败时计数保留到下次写回。
+    """
+    conn = _connection()
+    total = 0
+    last_key = (-1, -1)
+    while True:
+        rows = conn.execute(
+            "SELECT version_id, application_id, hour, hits FROM pending_downloads "
+            "WHERE (version_id, hour) > (?, ?) ORDER BY version_id, hour LIMIT ?",
+            (*last_key, batch_size)
+        ).fetchall()
+        if not rows:
+            return total
+        total += _flush_batch(conn, rows)
+        last_key = (rows[-1][0], rows[-1][2])
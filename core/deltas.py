@@ -0,0 +1,78 @@
+# deltas.py
+"""相邻版本之间的二进制差分包：版本处理完成后由后台任务生成，供客户端增量升级"""
+import hashlib
+import logging
+
+from django.conf import settings
+
+from . import jobs
+from .models import AppVersion, VersionDelta
+from .storage import get_storage
+
+try:
+    import bsdiff4
+except ImportError:  # 未安装时不生成差分包，下载接口回退为完整文件
+    bsdiff4 = None
+
+logger = logging.getLogger(__name__)
+
+
+def previous_version(app_version):
+    """同一应用中按语义版本号紧邻的上一个版本"""
+    return AppVersion.objects.filter(
+        application_id=app_version.application_id,
+        sort_key__lt=app_version.sort_key
+    ).order_by('-sort_key', '-upload_time').first()
+
+
+def generate_delta(to_version_id):
+    """生成上一个版本到 to_version 的差分包，返回 VersionDelta 或 None"""
+    if bsdiff4 is None:
+        return None
+
+    to_version = AppVersion.objects.select_related('application').filter(pk=to_version_id).first()
+    if to_version is None:
+        return None
+    from_version = previous_version(to_version)
+    if from_version is None or from_version.md5_hash == to_version.md5_hash:
+        return None
+    if max(from_version.file_size, to_version.file_size) > settings.APP_DELTA_MAX_FILE_SIZE:
+        # bsdiff 需要把两个文件都读入内存，另需数倍于此的工作内存，过大的安装包直接跳过
+        return None
+
+    storage = get_storage()
+    source_key, target_key = from_version.storage_key, to_version.storage_key
+    if not (storage.exists(source_key) and storage.exists(target_key)):
+        return None
+
+    existing = VersionDelta.objects.filter(from_version=from_version, to_version=to_version).first()
+    if existing is not None:
+        return existing
+
+    delta = VersionDelta(from_version=from_version, to_version=to_version, algorithm='bsdiff4')
+    # 两个文件均不超过 APP_DELTA_MAX_FILE_SIZE，直接读入内存；远程存储后端同样适用
+    try:
+        with storage.open(source_key) as source, storage.open(target_key) as target:
+            patch = bsdiff4.diff(source.read(), target.read())
+    except MemoryError:
+        logger.warning(f"生成差分包时内存不足，已跳过: {from_version.pk} -> {to_version.pk}")
+        return None
+    delta.file_size = len(patch)
+    if delta.file_size >= to_version.file_size * settings.APP_DELTA_MAX_RATIO:
+        # 差分包没有明显收益时不保存
+        return None
+    delta.sha256_hash = hashlib.sha256(patch).hexdigest()
+    storage.put_bytes(delta.storage_key, patch)
+    delta.save()
+    return delta
+
+
+def skip_delta(error, version_id):
+    """生成失败（包括工作进程因内存不足被杀）时不重试，该版本只提供完整安装包下载"""
+    logger.warning(f"差分包生成失败，已跳过版本 {version_id}")
+
+
+@jobs.register('generate_delta', on_failure=skip_delta, max_attempts=1)
+def generate_delta_job(version_id):
+    """由 process_version 在版本处理完成后排队，在 run_jobs 工作进程中执行"""
+    generate_delta(version_id)
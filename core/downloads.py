@@ -0,0 +1,287 @@
+# downloads.py
+"""安装包下载响应：支持 HTTP Range / If-Range 断点续传，以及交给前端 Web 服务器发送文件"""
+import asyncio
+import mimetypes
+import os
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+# 单次读取的块大小
+CHUNK_SIZE = 64 * 1024
+# APP_DOWNLOAD_OFFLOAD 可选的转发模式，启动时由 core.checks 校验
+OFFLOAD_MODES = ('nginx', 'sendfile')
+
+
+def parse_range_header(header, file_size):
+    """
+    解析 Range 请求头，返回 [(start, end), ...]（end 为闭区间）。
+
+    - 请求头缺失或语法错误时返回 None（按普通请求处理完整文件）
+    - 语法正确但没有任何可满足区间时返回 []（应答 416）
+    """
+    if not header:
+        return None
+    unit, sep, ranges_spec = header.partition('=')
+    if not sep or unit.strip().lower() != 'bytes':
+        return None
+
+    ranges = []
+    for spec in ranges_spec.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        start_str, sep, end_str = spec.partition('-')
+        if not sep:
+            return None
+        start_str, end_str = start_str.strip(), end_str.strip()
+        try:
+            if start_str:
+                start = int(start_str)
+                if end_str:
+                    end = int(end_str)
+                    if end < start:
+                        return None
+                else:
+                    end = file_size - 1
+            else:
+                # 后缀区间: bytes=-500 表示最后 500 字节
+                if not end_str:
+                    return None
+                suffix = int(end_str)
+                if suffix < 0:
+                    return None
+                if suffix == 0:
+                    continue
+                start = max(file_size - suffix, 0)
+                end = file_size - 1
+        except ValueError:
+            return None
+
+        if start >= file_size:
+            # 不可满足的区间直接忽略
+            continue
+        ranges.append((start, min(end, file_size - 1)))
+
+    if not ranges:
+        return []
+    return _merge_ranges(ranges)
+
+
+def _merge_ranges(ranges):
+    """合并重叠或相邻的区间，防止客户端用大量碎片区间放大流量"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_matches(request, etag, last_modified):
+    """校验 If-Range：条件不满足时应返回完整文件而非区间"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # 只接受强校验器，弱 ETag 不能用于区间请求
+        return etag is not None and if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and last_modified is not None and last_modified <= if_range_date
+
+
+def _iter_file_range(file_path, start, end):
+    """按块读取文件的 [start, end] 区间"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _aiter_file_range(file_path, start, end):
+    """
+    _iter_file_range 的异步版本：磁盘读取放到线程池中执行，
+    等待慢速客户端接收数据时不占用任何线程
+    """
+    f = await asyncio.to_thread(open, file_path, 'rb')
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _part_header(boundary, content_type, start, end, file_size):
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+    ).encode('ascii')
+
+
+def _iter_multipart(file_path, ranges, boundary, content_type, file_size):
+    """生成 multipart/byteranges 响应体"""
+    for start, end in ranges:
+        yield _part_header(boundary, content_type, start, end, file_size)
+        yield from _iter_file_range(file_path, start, end)
+    yield f"\r\n--{boundary}--\r\n".encode('ascii')
+
+
+async def _aiter_multipart(file_path, ranges, boundary, content_type, file_size):
+    for start, end in ranges:
+        yield _part_header(boundary, content_type, start, end, file_size)
+        async for chunk in _aiter_file_range(file_path, start, end):
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode('ascii')
+
+
+def _multipart_length(ranges, boundary, content_type, file_size):
+    """预先计算 multipart 响应体长度，以便设置 Content-Length"""
+    length = 0
+    for start, end in ranges:
+        length += len(_part_header(boundary, content_type, start, end, file_size))
+        length += end - start + 1
+    length += len(f"\r\n--{boundary}--\r\n")
+    return length
+
+
+def _set_common_headers(response, filename, etag, last_modified):
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if filename:
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+
+
+def ranged_file_response(request, file_path, filename, md5_hash=None, asynchronous=False):
+    """
+    构造支持断点续传的文件下载响应。
+
+    - 无 Range 头或 If-Range 不匹配: 200 + 完整文件
+    - 单区间: 206 + Content-Range
+    - 多区间: 206 + multipart/byteranges
+    - 区间不可满足: 416 + Content-Range: bytes */<size>
+
+    ETag 取自版本记录中保存的 MD5，供客户端在 If-Range 中回传。
+    asynchronous 为 True 时响应体是异步迭代器，供 ASGI 下的异步视图使用。
+    """
+    stat = os.stat(file_path)
+    file_size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag(md5_hash) if md5_hash else None
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    ranges = None
+    if request.method in ('GET', 'HEAD') and _if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(request.META.get('HTTP_RANGE'), file_size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{file_size}'
+        _set_common_headers(response, None, etag, last_modified)
+        return response
+
+    if not ranges and asynchronous:
+        response = StreamingHttpResponse(
+            _aiter_file_range(file_path, 0, file_size - 1),
+            content_type=content_type
+        )
+        response['Content-Length'] = str(file_size)
+        _set_common_headers(response, filename, etag, last_modified)
+        return response
+
+    if not ranges:
+        response = FileResponse(open(file_path, 'rb'), as_attachment=True, filename=filename)
+        _set_common_headers(response, None, etag, last_modified)
+        return response
+
+    iter_range = _aiter_file_range if asynchronous else _iter_file_range
+    iter_multipart = _aiter_multipart if asynchronous else _iter_multipart
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            iter_range(file_path, start, end),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = uuid.uuid4().hex
+        response = StreamingHttpResponse(
+            iter_multipart(file_path, ranges, boundary, content_type, file_size),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = str(_multipart_length(ranges, boundary, content_type, file_size))
+
+    _set_common_headers(response, filename, etag, last_modified)
+    return response
+
+
+def offload_file_response(file_path, storage_root, filename, md5_hash=None, mode=None):
+    """
+    构造交由前端代理发送文件的空响应。
+
+    - nginx: X-Accel-Redirect 指向 internal location（APP_DOWNLOAD_ACCEL_PREFIX + 相对路径）
+    - sendfile: X-Sendfile 指向文件绝对路径（Apache mod_xsendfile / lighttpd）
+
+    Range、If-Range 由代理自行处理，这里只负责鉴权之后的定位。
+    """
+    mode = mode or settings.APP_DOWNLOAD_OFFLOAD
+    response = HttpResponse(
+        content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    if md5_hash:
+        response['ETag'] = quote_etag(md5_hash)
+
+    if mode == 'nginx':
+        relative_path = os.path.relpath(file_path, storage_root).replace(os.sep, '/')
+        prefix = settings.APP_DOWNLOAD_ACCEL_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f"{prefix}/{quote(relative_path)}"
+    elif mode == 'sendfile':
+        response['X-Sendfile'] = os.path.abspath(file_path)
+    else:
+        raise ValueError(f"未知的下载转发模式: {mode}")
+    return response
+
+
+def file_download_response(request, file_path, storage_root, filename, md5_hash=None, asynchronous=False):
+    """根据 APP_DOWNLOAD_OFFLOAD 配置选择进程内流式发送或交给 Web 服务器发送"""
+    if settings.APP_DOWNLOAD_OFFLOAD:
+        return offload_file_response(file_path, storage_root, filename, md5_hash=md5_hash)
+    return ranged_file_response(request, file_path, filename, md5_hash=md5_hash, asynchronous=asynchronous)
+
+
+def storage_download_response(request, storage, key, filename, md5_hash=None, asynchronous=False):
+    """
+    发送存储后端中的文件：本地存储按 file_download_response 处理；
+    远程对象存储重定向到短时有效的预签名 URL，文件不经过应用进程
+    """
+    url = storage.download_url(key, filename)
+    if url is not None:
+        return HttpResponseRedirect(url)
+    return file_download_response(
+        request, storage.local_path(key), storage.location, filename,
+        md5_hash=md5_hash, asynchronous=asynchronous
+    )
@@ -0,0 +1,184 @@
+# github_client.py
+"""
+GitHub OAuth / API 的进程级共享客户端。
+
+- 复用 keep-alive 连接池，避免每次登录都重新进行 TCP + TLS 握手
+- 所有请求都有连接/读取超时，只对幂等请求和连接失败做有限次重试
+- 熔断器：连续失败达到阈值后在冷却期内直接失败，GitHub 故障时不拖住登录工作线程
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class GitHubError(Exception):
+    """GitHub 请求失败或返回了无法使用的数据"""
+
+
+class GitHubUnavailable(GitHubError):
+    """熔断器处于打开状态，暂不向 GitHub 发送请求"""
+
+
+class CircuitBreaker:
+    """
+    连续失败计数熔断器：失败 failure_threshold 次后打开，reset_timeout 秒后放行一个试探请求，
+    试探成功则关闭，失败则重新计时
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise GitHubUnavailable("GitHub 服务暂时不可用，请稍后重试")
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class GitHubClient:
+    def __init__(self, oauth_url, api_url, connect_timeout, read_timeout, retries,
+                 failure_threshold, reset_timeout, pool_size=10, verify=True):
+        self.oauth_url = oauth_url.rstrip('/')
+        self.api_url = api_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='github')
+
+        # 默认的 allowed_methods 不包含 POST：换取令牌只在连接失败（请求尚未发出）时重试，
+        # 避免授权码被重复提交
+        retry = Retry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=0.2, status_forcelist=(502, 503, 504), raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Accept'] = 'application/json'
+        self.session.verify = verify
+
+    def _request(self, method, url, **kwargs):
+        self.breaker.before_request()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            raise GitHubError(str(e)) from e
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise GitHubError(f"状态码{response.status_code}")
+        # 4xx 说明 GitHub 可用（授权码失效等），不计入熔断
+        self.breaker.record_success()
+        if response.status_code != 200:
+            raise GitHubError(f"状态码{response.status_code}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise GitHubError("响应不是合法的 JSON") from e
+
+    def exchange_code(self, code, redirect_uri):
+        """使用授权码换取 access_token"""
+        token_data = self._request('POST', f"{self.oauth_url}/access_token", data={
+            "client_id": settings.GITHUB_CLIENT_ID,
+            "client_secret": settings.GITHUB_CLIENT_SECRET,
+            "code": code,
+            "redirect_uri": redirect_uri,
+        })
+        access_token = token_data.get('access_token') if isinstance(token_data, dict) else None
+        if not access_token:
+            raise GitHubError("缺少access_token")
+        return access_token
+
+    def get_user(self, access_token):
+        return self._request('GET', f"{self.api_url}/user", headers={"Authorization": f"Bearer {access_token}"})
+
+    def get_emails(self, access_token):
+        return self._request(
+            'GET', f"{self.api_url}/user/emails", headers={"Authorization": f"Bearer {access_token}"}
+        )
+
+    def get_verified_email(self, access_token):
+        """返回主邮箱或任一已验证邮箱，没有时返回空字符串"""
+        emails = self.get_emails(access_token)
+        if not isinstance(emails, list):
+            return ''
+        primary_emails = [e['email'] for e in emails if e.get('primary') and e.get('verified')]
+        verified_emails = [e['email'] for e in emails if e.get('verified')]
+        return (primary_emails or verified_emails or [''])[0]
+
+    def submit(self, fn, *args):
+        """在共享线程池中执行 GitHub 请求，使其与数据库操作并行"""
+        return self.executor.submit(fn, *args)
+
+    def close(self):
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_github_client():
+    """进程内共享的 GitHubClient，首次使用时按 settings 创建"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GitHubClient(
+                    oauth_url=settings.GITHUB_OAUTH_URL,
+                    api_url=settings.GITHUB_API_URL,
+                    connect_timeout=settings.GITHUB_CONNECT_TIMEOUT,
+                    read_timeout=settings.GITHUB_READ_TIMEOUT,
+                    retries=settings.GITHUB_RETRIES,
+                    failure_threshold=settings.GITHUB_CIRCUIT_FAILURES,
+                    reset_timeout=settings.GITHUB_CIRCUIT_RESET_TIMEOUT,
+                    verify=settings.GITHUB_VERIFY_SSL,
+                )
+    return _client
+
+
+def reset_github_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+@receiver(setting_changed)
+def reset_client_on_setting_change(sender, setting, **kwargs):
+    if setting.startswith('GITHUB_'):
+        reset_github_client()
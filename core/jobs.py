@@ -0,0 +1,183 @@
+# jobs.py
+"""
+以数据库为队列的后台任务，不依赖外部消息中间件。
+
+- enqueue() 在当前事务中写入 Job 记录，事务回滚时任务随之取消
+- manage.py run_jobs 轮询到期的任务，以条件更新领取（多个工作进程、多台机器同时运行时
+  同一任务只会被一个进程领取），交给进程池执行
+- 任务失败后按指数退避重新排队，超过 APP_JOB_MAX_ATTEMPTS 次后标记为失败并调用 on_failure；
+  执行超过 APP_JOB_TIMEOUT 秒仍未完成的任务（工作进程异常退出）重新排队
+
+任务处理函数用 @register('kind') 注册，只接收 payload 中的关键字参数，需要可以重复执行。
+
+部署时必须运行 run_jobs，否则任务只会积压在队列中（上传的版本一直停留在 pending），
+积压时 warn_if_backlogged 会记录警告。
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# kind -> (处理函数, 最终失败时的回调, 最多执行次数)
+HANDLERS = {}
+
+# 到期超过该时间（秒）仍未被领取的任务，说明没有运行 run_jobs 工作进程或工作进程过少
+BACKLOG_WARNING_AGE = 5 * 60
+
+
+def register(kind, on_failure=None, max_attempts=None):
+    """
+    注册任务处理函数；on_failure(error, **payload) 在任务最终失败时调用。
+    max_attempts 覆盖 APP_JOB_MAX_ATTEMPTS，失败后重试没有意义的任务设为 1
+    """
+    def decorator(handler):
+        HANDLERS[kind] = (handler, on_failure, max_attempts)
+        return handler
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """加入队列，返回 Job；在事务中调用时随事务一起提交"""
+    if kind not in HANDLERS:
+        raise ValueError(f"未注册的任务类型: {kind}")
+    return Job.objects.create(kind=kind, payload=payload)
+
+
+def enqueue_debounced(kind, delay, **payload):
+    """
+    推迟 delay 秒执行的任务；相同 payload 的任务仍在排队时不再新建，返回 None。
+    推迟期间的多次变化由同一个任务一并处理
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"未注册的任务类型: {kind}")
+    if Job.objects.filter(kind=kind, status=Job.QUEUED, payload=payload).exists():
+        return None
+    return Job.objects.create(kind=kind, payload=payload, run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def warn_if_backlogged(now=None):
+    """排队的任务长时间无人领取时记录警告，返回是否积压"""
+    now = now or timezone.now()
+    backlogged = Job.objects.filter(
+        status=Job.QUEUED, run_after__lt=now - timedelta(seconds=BACKLOG_WARNING_AGE)
+    ).exists()
+    if backlogged:
+        logger.warning("后台任务积压未执行，请确认 manage.py run_jobs 工作进程正在运行")
+    return backlogged
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_stale(now=None):
+    """执行超时的任务重新排队，返回数量"""
+    now = now or timezone.now()
+    return Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.APP_JOB_TIMEOUT)
+    ).update(status=Job.QUEUED, locked_by='', locked_at=None, run_after=now)
+
+
+def claim(limit, owner=None, now=None):
+    """
+    领取至多 limit 个到期的任务，返回 Job 列表。
+
+    逐个以 status=queued 为条件更新为 running，更新成功才算领取成功；
+    不依赖 SELECT ... FOR UPDATE SKIP LOCKED，SQLite 上同样适用
+    """
+    now = now or timezone.now()
+    owner = owner or worker_id()
+    candidates = Job.objects.filter(
+        status=Job.QUEUED, run_after__lte=now
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)[:limit * 2]
+    claimed = []
+    for pk in candidates:
+        updated = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=owner, locked_at=now, attempts=F('attempts') + 1
+        )
+        if updated:
+            claimed.append(pk)
+            if len(claimed) >= limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_after', 'pk'))
+
+
+def execute(kind, payload):
+    """执行一个任务，返回 None 表示成功，否则返回错误信息"""
+    handler = HANDLERS[kind][0]
+    try:
+        handler(**payload)
+        return None
+    except Exception:
+        logger.exception(f"后台任务失败: {kind} {payload}")
+        return traceback.format_exc()
+
+
+def execute_in_worker(kind, payload):
+    """进程池子进程中的入口，参数与返回值都只使用可序列化的基本类型"""
+    try:
+        return execute(kind, payload)
+    finally:
+        # 子进程长期存在，每个任务结束后关闭连接，避免持有失效连接
+        connection.close()
+
+
+def backoff(attempts):
+    """第 n 次失败后的重试间隔（秒）"""
+    return min(settings.APP_JOB_RETRY_DELAY * 2 ** (attempts - 1), 3600)
+
+
+def complete(job, error=None, now=None):
+    """记录执行结果：成功、重新排队或最终失败"""
+    now = now or timezone.now()
+    if error is None:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.DONE, finished_at=now, locked_by='', locked_at=None, last_error=''
+        )
+        return Job.DONE
+
+    _, on_failure, max_attempts = HANDLERS.get(job.kind, (None, None, None))
+    if job.attempts < (max_attempts or settings.APP_JOB_MAX_ATTEMPTS):
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.QUEUED, locked_by='', locked_at=None, last_error=error,
+            run_after=now + timedelta(seconds=backoff(job.attempts))
+        )
+        return Job.QUEUED
+
+    with transaction.atomic():
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.FAILED, finished_at=now, locked_by='', locked_at=None, last_error=error
+        )
+        if on_failure is not None:
+            try:
+                on_failure(error, **job.payload)
+            except Exception:
+                logger.exception(f"任务失败回调出错: {job.kind} {job.payload}")
+    return Job.FAILED
+
+
+def run_inline(job):
+    """在当前进程中执行已领取的任务（测试与 --processes 0）"""
+    if job.kind not in HANDLERS:
+        return complete(job, f"未注册的任务类型: {job.kind}")
+    return complete(job, execute(job.kind, job.payload))
+
+
+def prune(now=None):
+    """删除早于 APP_JOB_RETENTION 秒完成的任务，失败的任务保留以便排查"""
+    now = now or timezone.now()
+    deleted, _ = Job.objects.filter(
+        status=Job.DONE, finished_at__lt=now - timedelta(seconds=settings.APP_JOB_RETENTION)
+    ).delete()
+    return deleted
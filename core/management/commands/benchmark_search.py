@@ -0,0 +1,92 @@
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import build_vocabulary, percentile, zipf_weights
+from core.models import Application
+from core.search import legacy_search, search_applications
+
+APP_ID_PREFIX = 'bench-search-'
+PAGE_SIZE = 9
+
+
+class Command(BaseCommand):
+    help = "对比市场页旧的 LIKE 模糊匹配与全文检索的查询耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apps', type=int, default=100_000, help="合成应用数量")
+        parser.add_argument('--repeat', type=int, default=5, help="每个检索词重复次数")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help="把结果写入 JSON 文件")
+        parser.add_argument('--cleanup', action='store_true', help="结束后删除合成数据")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = build_vocabulary(rng)
+        self.ensure_catalog(options['apps'], rng, vocabulary)
+
+        # 常见词、罕见词、前缀、多词组合与无结果查询
+        queries = [
+            vocabulary[0], vocabulary[50], vocabulary[2000], vocabulary[15000][:4],
+            f'{vocabulary[10]} {vocabulary[300]}', 'qqqnomatch',
+        ]
+        results = {}
+        for label, search in (('legacy_like', legacy_search), ('full_text', search_applications)):
+            samples = []
+            per_query = {}
+            for query in queries:
+                query_samples = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    queryset = search(Application.objects.order_by('-id'), query)
+                    # 与市场页分页一致：统计总数并取第一页
+                    queryset.count()
+                    list(queryset[:PAGE_SIZE])
+                    query_samples.append((time.perf_counter() - started) * 1000)
+                per_query[query] = round(statistics.mean(query_samples), 3)
+                samples.extend(query_samples)
+            results[label] = {
+                'mean_ms': round(statistics.mean(samples), 3),
+                'p50_ms': round(percentile(samples, 50), 3),
+                'p95_ms': round(percentile(samples, 95), 3),
+                'samples': len(samples),
+                'per_query_mean_ms': per_query,
+            }
+            self.stdout.write(
+                f"{label:12s} mean={results[label]['mean_ms']:.2f}ms "
+                f"p50={results[label]['p50_ms']:.2f}ms p95={results[label]['p95_ms']:.2f}ms"
+            )
+            for query, mean in per_query.items():
+                self.stdout.write(f"    {query!r:24s} {mean:.2f}ms")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'apps': options['apps'], 'queries': queries, 'results': results}, f, indent=2)
+
+        if options['cleanup']:
+            Application.objects.filter(app_id__startswith=APP_ID_PREFIX).delete()
+
+    def ensure_catalog(self, count, rng, vocabulary):
+        """补足合成应用到指定数量"""
+        existing = Application.objects.filter(app_id__startswith=APP_ID_PREFIX).count()
+        if existing >= count:
+            return
+        owner, _ = User.objects.get_or_create(username='bench_search')
+        self.stdout.write(f"生成 {count - existing} 个合成应用...")
+        cum_weights = zipf_weights(len(vocabulary))
+        batch = []
+        for index in range(existing, count):
+            name = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=2)).title()
+            description = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=20))
+            batch.append(Application(
+                app_id=f'{APP_ID_PREFIX}{index}', name=name, description=description, owner=owner
+            ))
+            if len(batch) >= 5000:
+                Application.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Application.objects.bulk_create(batch)
@@ -0,0 +1,94 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.benchmarks import environment_info, summarize
+from core.models import Application, AppVersion
+from core.pagination import version_list_columns
+from core.renderers import ORJSONRenderer
+from core.serializers import APP_VERSION_VALUES, AppVersionSerializer
+from core.versioning import version_sort_key
+
+APP_ID = 'bench-serialization'
+
+
+class Command(BaseCommand):
+    help = (
+        "对比版本列表的两种序列化方式：模型实例 + AppVersionSerializer + JSONRenderer，"
+        "与 values() + 字段映射 + ORJSONRenderer。测试数据在事务中创建，结束后回滚"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--versions', type=int, default=5000, help="单个应用的版本数量")
+        parser.add_argument('--repeat', type=int, default=20, help="每种方式的重复次数")
+        parser.add_argument('--fields', default='version,md5_hash', help="稀疏字段集场景使用的字段")
+        parser.add_argument('--json', dest='json_path', help="把结果写入 JSON 文件")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            application = self.create_versions(options['versions'])
+            versions = AppVersion.objects.filter(application=application).order_by('-sort_key', '-id')
+            sparse = APP_VERSION_VALUES.subset(options['fields'])
+
+            def model_serializer():
+                return JSONRenderer().render(AppVersionSerializer(list(versions), many=True).data)
+
+            def values_mapper(mapper=APP_VERSION_VALUES):
+                rows = versions.values(*version_list_columns(mapper))
+                return ORJSONRenderer().render(mapper.map(rows))
+
+            # 两种方式的输出必须一致，否则对比没有意义
+            if json.loads(model_serializer()) != json.loads(values_mapper()):
+                raise AssertionError("values() 映射与 AppVersionSerializer 的输出不一致")
+
+            results = {}
+            baseline = None
+            for label, func in (
+                ('model_serializer', model_serializer),
+                ('values_mapper', values_mapper),
+                ('values_mapper_sparse', lambda: values_mapper(sparse)),
+            ):
+                samples = []
+                size = 0
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    size = len(func())
+                    samples.append((time.perf_counter() - started) * 1000)
+                results[label] = summarize(samples)
+                results[label]['bytes'] = size
+                baseline = baseline or results[label]['p50_ms']
+                self.stdout.write(
+                    f"{label:22s} p50={results[label]['p50_ms']:.2f}ms p95={results[label]['p95_ms']:.2f}ms "
+                    f"{size} 字节  x{baseline / results[label]['p50_ms']:.1f}"
+                )
+            transaction.set_rollback(True)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({
+                    'environment': environment_info(),
+                    'versions': options['versions'],
+                    'fields': options['fields'],
+                    'results': results,
+                }, f, indent=2, ensure_ascii=False)
+
+    def create_versions(self, count):
+        owner, _ = User.objects.get_or_create(username=APP_ID)
+        application = Application.objects.create(
+            app_id=APP_ID, name='Serialization Bench', description='benchmark', owner=owner
+        )
+        versions = []
+        for index in range(count):
+            version = f'{index // 100}.{index % 100}.0'
+            versions.append(AppVersion(
+                application=application, version=version, file_name='bench.apk', file_size=index * 1024,
+                md5_hash=f'{index:032x}', sha256_hash=f'{index:064x}', release_notes=f'版本 {version} 更新说明',
+                # bulk_create 不调用 save()，需要手动填充排序键
+                sort_key=version_sort_key(version),
+            ))
+        AppVersion.objects.bulk_create(versions, batch_size=1000)
+        return application
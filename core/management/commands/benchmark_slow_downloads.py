@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from core.benchmarks import percentile
+from core.models import Application, AppVersion
+
+APP_ID = 'bench-download'
+VERSION = '1.0.0'
+FILE_NAME = 'bench.apk'
+
+# 启动被测服务器的命令，{addr} 为 host:port；WSGI 对照组使用 gunicorn 的线程工作模式
+SERVER_COMMANDS = {
+    'asgi': [sys.executable, 'manage.py', 'runasgi', '{addr}', '--workers', '1'],
+    'wsgi': [
+        sys.executable, '-m', 'gunicorn', 'Appstore.wsgi:application',
+        '--bind', '{addr}', '--workers', '1', '--threads', '{threads}', '--timeout', '0',
+    ],
+}
+
+
+def _percentile(samples, percent):
+    value = percentile(samples, percent)
+    return round(value, 2) if value is not None else None
+
+
+class Command(BaseCommand):
+    help = (
+        "慢速客户端下载压测：同时打开大量限速读取的下载连接，"
+        "统计单个工作进程能服务的连接数、首字节时间，以及压测期间 API 请求的延迟"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--server', choices=['asgi', 'wsgi', 'url'], default='asgi',
+            help="asgi: 启动 runasgi；wsgi: 启动 gunicorn 线程模式；url: 压测 --url 指定的已运行服务"
+        )
+        parser.add_argument('--url', default='http://127.0.0.1:8765', help="被测服务地址")
+        parser.add_argument('--threads', type=int, default=8, help="WSGI 对照组的线程数")
+        parser.add_argument('--clients', default='50,200,500', help="并发慢速连接数，逗号分隔")
+        parser.add_argument('--rate', type=int, default=64 * 1024, help="每个客户端的读取速率（字节/秒）")
+        parser.add_argument('--duration', type=float, default=10.0, help="每轮压测时长（秒）")
+        parser.add_argument('--file-size', type=int, default=16 * 1024 * 1024, help="测试安装包大小")
+        parser.add_argument('--json', dest='json_path', help="把结果写入 JSON 文件")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        host, port = url.hostname, url.port or 80
+        session_id = self.prepare(options['file_size'])
+        self.raise_fd_limit()
+
+        server = None
+        if options['server'] != 'url':
+            server = self.start_server(options['server'], f'{host}:{port}', options['threads'])
+        results = {}
+        try:
+            for clients in [int(n) for n in options['clients'].split(',')]:
+                result = asyncio.run(self.run_round(
+                    host, port, session_id, clients, options['rate'], options['duration']
+                ))
+                results[clients] = result
+                self.stdout.write(
+                    f"{options['server']} clients={clients:5d} served={result['served']:5d} "
+                    f"ttfb_p50={result['ttfb_p50_ms']}ms ttfb_p95={result['ttfb_p95_ms']}ms "
+                    f"api_p50={result['api_p50_ms']}ms api_p95={result['api_p95_ms']}ms "
+                    f"throughput={result['throughput_mib_s']}MiB/s"
+                )
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'server': options['server'], 'options': {
+                    key: options[key] for key in ('threads', 'rate', 'duration', 'file_size')
+                }, 'results': results}, f, indent=2)
+
+    def prepare(self, file_size):
+        """创建测试应用、安装包文件与已登录的会话，返回 sessionid"""
+        user, _ = User.objects.get_or_create(username='bench_download')
+        application, _ = Application.objects.get_or_create(
+            app_id=APP_ID, defaults={'name': 'Download Bench', 'description': 'benchmark', 'owner': user}
+        )
+        app_version, _ = AppVersion.objects.update_or_create(
+            application=application, version=VERSION,
+            defaults={'file_name': FILE_NAME, 'file_size': file_size, 'md5_hash': '0' * 32, 'blob': None}
+        )
+        file_path = app_version.storage_path
+        if file_path is None:
+            # 对象存储后端的下载重定向到预签名 URL，不经过被测服务器
+            raise CommandError("慢速客户端下载基准需要本地存储后端（APP_STORAGE_BACKEND=local）")
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != file_size:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'wb') as f:
+                f.truncate(file_size)
+
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def raise_fd_limit(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    def start_server(self, kind, addr, threads):
+        command = [part.format(addr=addr, threads=threads) for part in SERVER_COMMANDS[kind]]
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        host, port = addr.rsplit(':', 1)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"服务器启动失败: {' '.join(command)}")
+            try:
+                socket.create_connection((host, int(port)), timeout=0.5).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError("等待服务器启动超时")
+
+    async def run_round(self, host, port, session_id, clients, rate, duration):
+        path = f'/apps/{APP_ID}/versions/{VERSION}/download/'
+        deadline = time.monotonic() + duration
+        downloads = [
+            asyncio.create_task(self.slow_download(host, port, path, session_id, rate, deadline))
+            for _ in range(clients)
+        ]
+        api_latencies = await self.probe_api(host, port, deadline)
+        outcomes = await asyncio.gather(*downloads)
+
+        ttfb = [outcome[0] for outcome in outcomes if outcome[0] is not None]
+        received = sum(outcome[1] for outcome in outcomes)
+        return {
+            'served': len(ttfb),
+            'ttfb_p50_ms': _percentile(ttfb, 50),
+            'ttfb_p95_ms': _percentile(ttfb, 95),
+            'api_p50_ms': _percentile(api_latencies, 50),
+            'api_p95_ms': _percentile(api_latencies, 95),
+            'api_completed': len(api_latencies),
+            'throughput_mib_s': round(received / duration / (1024 * 1024), 2),
+        }
+
+    async def slow_download(self, host, port, path, session_id, rate, deadline):
+        """以固定速率读取响应的客户端，返回 (首字节毫秒数或 None, 已接收字节数)"""
+        started = time.monotonic()
+        first_byte = None
+        received = 0
+        writer = None
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # 缩小接收缓冲区，使服务端真正感受到客户端的读取速度
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 32 * 1024)
+            sock.setblocking(False)
+            await asyncio.wait_for(
+                asyncio.get_running_loop().sock_connect(sock, (host, port)), deadline - time.monotonic()
+            )
+            reader, writer = await asyncio.open_connection(sock=sock)
+            writer.write((
+                f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+                f"Cookie: {settings.SESSION_COOKIE_NAME}={session_id}\r\nConnection: close\r\n\r\n"
+            ).encode('ascii'))
+            await writer.drain()
+            chunk_size = max(rate // 10, 1024)
+            while time.monotonic() < deadline:
+                chunk = await asyncio.wait_for(reader.read(chunk_size), deadline - time.monotonic())
+                if not chunk:
+                    break
+                if first_byte is None:
+                    first_byte = (time.monotonic() - started) * 1000
+                received += len(chunk)
+                await asyncio.sleep(len(chunk) / rate)
+        except (asyncio.TimeoutError, OSError, ValueError):
+            pass
+        finally:
+            if writer is not None:
+                writer.close()
+        return first_byte, received
+
+    async def probe_api(self, host, port, deadline, interval=0.2):
+        """压测期间每隔 interval 秒请求一次最新版本接口，记录延迟（毫秒）"""
+        latencies = []
+        path = f'/apps/{APP_ID}/versions/latest/'
+        await asyncio.sleep(min(1.0, max(deadline - time.monotonic(), 0) / 4))
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port), deadline - time.monotonic()
+                )
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode('ascii'))
+                await writer.drain()
+                await asyncio.wait_for(reader.read(), deadline - time.monotonic())
+                latencies.append((time.monotonic() - started) * 1000)
+            except (asyncio.TimeoutError, OSError, ValueError):
+                pass
+            finally:
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(interval)
+        return latencies
@@ -0,0 +1,41 @@
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "清理过期的可续传上传会话及其分块文件"
+
+    def handle(self, *args, **options):
+        expired = UploadSession.objects.filter(expires_at__lte=timezone.now())
+        removed_sessions = 0
+        for upload_session in expired.iterator():
+            upload_session.delete_partial_file()
+            upload_session.delete()
+            removed_sessions += 1
+
+        # 清理没有对应会话记录的孤立分块文件（例如会话记录被手动删除）
+        sessions_dir = os.path.join(settings.APP_STORAGE, '.uploads', 'sessions')
+        removed_files = 0
+        if os.path.isdir(sessions_dir):
+            cutoff = time.time() - settings.APP_UPLOAD_SESSION_TTL
+            for entry in os.scandir(sessions_dir):
+                if not entry.name.endswith('.part') or entry.stat().st_mtime > cutoff:
+                    continue
+                try:
+                    session_id = uuid.UUID(entry.name[:-len('.part')])
+                except ValueError:
+                    continue
+                if not UploadSession.objects.filter(id=session_id).exists():
+                    os.remove(entry.path)
+                    removed_files += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已清理 {removed_sessions} 个过期会话，{removed_files} 个孤立分块文件"
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.counters import flush_download_counters
+
+
+class Command(BaseCommand):
+    help = "把缓冲在本机旁路表中的下载计数批量写回数据库，并更新小时/天汇总表"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, nargs='?', const=settings.APP_DOWNLOAD_COUNTER_FLUSH_INTERVAL, default=0,
+            help="持续运行并每隔指定秒数写回一次（不带数值时使用 APP_DOWNLOAD_COUNTER_FLUSH_INTERVAL），默认只写回一次"
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="每批写回的计数行数")
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            total = flush_download_counters(batch_size=options['batch_size'])
+            if total or not interval:
+                self.stdout.write(self.style.SUCCESS(f"已写回 {total} 次下载"))
+            if not interval:
+                return
+            close_old_connections()
+            time.sleep(interval)
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.benchmarks import build_vocabulary, format_size, parse_size, zipf_weights
+from core.caching import bump_market_generation
+from core.catalog import rebuild_catalog_index
+from core.models import Application, AppVersion
+from core.storage import get_storage
+from core.versioning import version_sort_key
+
+FILE_WRITE_CHUNK = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "批量生成合成应用目录（用户、应用、版本与磁盘上的安装包），供性能基准使用。"
+        "重复执行时只补足缺少的部分"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help="合成用户数量")
+        parser.add_argument('--apps', type=int, default=10_000, help="合成应用数量，可达数百万")
+        parser.add_argument('--versions', type=int, default=5, help="每个应用的版本数量")
+        parser.add_argument('--files', type=int, default=100, help="为前 N 个应用的最新版本写入真实安装包文件")
+        parser.add_argument('--file-sizes', default='64K,1M,16M', help="安装包大小，逗号分隔，按应用轮流使用")
+        parser.add_argument('--prefix', default='bench-', help="合成数据的 app_id / 用户名前缀")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--cleanup', action='store_true', help="删除带前缀的全部合成数据后退出")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['cleanup']:
+            self.cleanup(prefix)
+            return
+
+        started = time.perf_counter()
+        rng = random.Random(options['seed'])
+        self.vocabulary = build_vocabulary(rng)
+        self.cum_weights = zipf_weights(len(self.vocabulary))
+        self.file_sizes = [parse_size(size) for size in options['file_sizes'].split(',') if size.strip()]
+
+        owner_ids = self.ensure_users(prefix, options['users'])
+        existing = Application.objects.filter(app_id__startswith=f'{prefix}app-').count()
+        apps_created = versions_created = files_written = 0
+
+        for batch_start in range(existing, options['apps'], options['batch_size']):
+            batch_end = min(batch_start + options['batch_size'], options['apps'])
+            with transaction.atomic():
+                applications = Application.objects.bulk_create([
+                    self.make_application(rng, prefix, index, owner_ids) for index in range(batch_start, batch_end)
+                ])
+                versions = []
+                for index, application in zip(range(batch_start, batch_end), applications):
+                    with_file = index < options['files']
+                    versions.extend(self.make_versions(rng, application, options['versions'], index, with_file))
+                    if with_file and options['versions']:
+                        files_written += 1
+                AppVersion.objects.bulk_create(versions, batch_size=options['batch_size'])
+            apps_created += len(applications)
+            versions_created += len(versions)
+            self.stdout.write(f"  {batch_end}/{options['apps']} 个应用")
+
+        # bulk_create 不发送信号，手动使市场页缓存失效并重建目录索引
+        bump_market_generation()
+        if settings.APP_CATALOG_INDEX:
+            rebuild_catalog_index()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"新增 {apps_created} 个应用、{versions_created} 个版本、{files_written} 个安装包文件，"
+            f"耗时 {elapsed:.1f}s"
+        ))
+
+    def ensure_users(self, prefix, count):
+        usernames = [f'{prefix}user-{index}' for index in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        # bulk_create 不触发 post_save，合成用户不生成 UserProfile
+        User.objects.bulk_create([
+            User(username=username, password='!') for username in usernames if username not in existing
+        ])
+        return list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+
+    def words(self, rng, count):
+        return ' '.join(rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=count))
+
+    def make_application(self, rng, prefix, index, owner_ids):
+        return Application(
+            app_id=f'{prefix}app-{index}',
+            name=self.words(rng, 2).title(),
+            description=self.words(rng, 20),
+            owner_id=rng.choice(owner_ids),
+        )
+
+    def make_versions(self, rng, application, count, index, with_file):
+        """生成单调递增的版本号；with_file 时为最新版本写入真实文件"""
+        major, minor, patch = rng.randint(0, 3), rng.randint(0, 9), 0
+        versions = []
+        for number in range(count):
+            if number:
+                if rng.random() < 0.7:
+                    patch += 1
+                else:
+                    minor, patch = minor + 1, 0
+            version = f'{major}.{minor}.{patch}'
+            app_version = AppVersion(
+                application=application,
+                version=version,
+                file_name=f'{application.app_id}.apk',
+                file_size=rng.randint(1024, 64 * 1024 * 1024),
+                md5_hash=rng.randbytes(16).hex(),
+                release_notes=self.words(rng, 8),
+                # bulk_create 不调用 save()，需要手动填充排序键
+                sort_key=version_sort_key(version),
+            )
+            if with_file and number == count - 1:
+                self.write_package(rng, app_version, self.file_sizes[index % len(self.file_sizes)])
+            versions.append(app_version)
+        return versions
+
+    def write_package(self, rng, app_version, size):
+        # 先写入本地临时文件，再存入存储后端（对象存储上大文件分段上传）
+        upload_dir = os.path.join(settings.APP_STORAGE, '.uploads')
+        os.makedirs(upload_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+        md5, sha256 = hashlib.md5(), hashlib.sha256()
+        with os.fdopen(fd, 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                chunk = rng.randbytes(min(FILE_WRITE_CHUNK, remaining))
+                md5.update(chunk)
+                sha256.update(chunk)
+                f.write(chunk)
+                remaining -= len(chunk)
+        get_storage().put_file(app_version.storage_key, temp_path)
+        app_version.file_size = size
+        app_version.md5_hash = md5.hexdigest()
+        app_version.sha256_hash = sha256.hexdigest()
+        app_version.release_notes = f'synthetic {format_size(size)} package'
+
+    def cleanup(self, prefix):
+        applications = Application.objects.filter(app_id__startswith=prefix)
+        removed_files = 0
+        storage = get_storage()
+        for app_version in AppVersion.objects.filter(
+            application__in=applications, blob__isnull=True
+        ).select_related('application').iterator():
+            if storage.exists(app_version.storage_key):
+                storage.delete(app_version.storage_key)
+                removed_files += 1
+        # 上传基准产生的版本使用内容寻址存储，删除版本时由信号回收文件
+        deleted, _ = applications.delete()
+        User.objects.filter(username__startswith=prefix).delete()
+        bump_market_generation()
+        if settings.APP_CATALOG_INDEX:
+            rebuild_catalog_index()
+        self.stdout.write(self.style.SUCCESS(f"已删除 {deleted} 条记录，{removed_files} 个安装包文件"))
@@ -0,0 +1,213 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+
+from core.blobstore import _get_or_create_blob
+from core.caching import bump_market_generation
+from core.catalog import rebuild_catalog_index
+from core.models import AppVersion, Blob, VersionDelta, blob_key
+from core.storage import LocalStorage, get_storage
+
+HASH_CHUNK = 1024 * 1024
+
+
+def _file_hashes(path):
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            md5.update(chunk)
+            sha256.update(chunk)
+    return md5.hexdigest(), sha256.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "把本地 APP_STORAGE 中的文件迁移到当前存储后端的分片布局: "
+        "旧版 <app_id>/<version>_<file_name> 安装包转为内容寻址的 blobs/ab/cd/<sha256>，"
+        "差分包移到 deltas/ab/cd/，目标为对象存储时一并上传已有的内容文件。可重复执行"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="并发迁移的线程数（哈希计算与上传）")
+        parser.add_argument('--batch-size', type=int, default=1000, help="每批从数据库读取的记录数")
+        parser.add_argument('--dry-run', action='store_true', help="只检查并统计，不移动文件、不修改数据库")
+        parser.add_argument('--keep-source', action='store_true', help="复制而不是移动，保留原文件")
+
+    def handle(self, *args, **options):
+        self.source = LocalStorage(settings.APP_STORAGE)
+        self.target = get_storage()
+        self.same_backend = isinstance(self.target, LocalStorage) and self.target.location == self.source.location
+        self.dry_run = options['dry_run']
+        self.keep_source = options['keep_source']
+        self.workers = max(options['workers'], 1)
+        self.batch_size = options['batch_size']
+        # 哈希计算与文件传输并发执行，数据库写入很短，串行执行以免 SQLite 写锁冲突
+        self.db_lock = threading.Lock()
+
+        # 旧版版本补上 SHA-256 后差分包的存储键随之变化，先记下差分包当前所在位置
+        delta_sources = self.locate_deltas()
+        if not self.same_backend:
+            self.report('内容文件', self.run_batches(Blob.objects.order_by('pk'), self.migrate_blob))
+        version_results = self.run_batches(
+            AppVersion.objects.filter(blob__isnull=True).select_related('application').order_by('pk'),
+            self.migrate_version
+        )
+        self.report('旧版安装包', version_results)
+        self.report('差分包', self.run_batches(delta_sources, self.migrate_delta))
+
+        if version_results['migrated'] and not self.dry_run:
+            bump_market_generation()
+            if settings.APP_CATALOG_INDEX:
+                rebuild_catalog_index()
+
+    def run_batches(self, items, task):
+        """按批读取记录，交给线程池处理；单线程时在当前线程中执行"""
+        results = Counter()
+        if isinstance(items, list):
+            batches = (items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size))
+        else:
+            batches = self.iter_batches(items)
+
+        if self.workers == 1:
+            for batch in batches:
+                results.update(map(task, batch))
+            return results
+
+        def run(item):
+            try:
+                return task(item)
+            finally:
+                # 工作线程持有独立的数据库连接
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch in batches:
+                results.update(executor.map(run, batch))
+        return results
+
+    def iter_batches(self, queryset):
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:self.batch_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def report(self, label, results):
+        summary = '，'.join(f"{status} {count}" for status, count in sorted(results.items())) or '无'
+        prefix = '[dry-run] ' if self.dry_run else ''
+        self.stdout.write(f"{prefix}{label}: {summary}")
+        if results['md5_mismatch'] or results['missing']:
+            self.stdout.write(self.style.WARNING(f"{label}: 部分文件缺失或校验失败，已跳过，相关记录保持不变"))
+
+    def transfer(self, source_key, target_key):
+        """把本地源文件存入目标后端；--keep-source 时先复制一份再存入"""
+        source_path = self.source.path(source_key)
+        if self.keep_source:
+            upload_dir = os.path.join(self.source.location, '.uploads')
+            os.makedirs(upload_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+            os.close(fd)
+            shutil.copyfile(source_path, temp_path)
+            source_path = temp_path
+        self.target.put_file(target_key, source_path)
+
+    def discard_source(self, source_key):
+        if not self.keep_source:
+            self.source.delete(source_key)
+
+    def locate_deltas(self):
+        """[(差分包 id, 本地源存储键)]，只包含本地存在且需要迁移的文件"""
+        located = []
+        queryset = VersionDelta.objects.select_related(
+            'from_version__application', 'to_version__application'
+        ).order_by('pk')
+        for batch in self.iter_batches(queryset):
+            for delta in batch:
+                for key in (delta.storage_key, delta.legacy_storage_key):
+                    if self.source.exists(key):
+                        located.append((delta.pk, key))
+                        break
+        return located
+
+    def migrate_blob(self, blob):
+        key = blob.storage_key
+        if not self.source.exists(key):
+            return 'missing' if not self.target.exists(key) else 'skipped'
+        if self.target.exists(key):
+            return 'skipped'
+        if not self.dry_run:
+            self.transfer(key, key)
+        return 'migrated'
+
+    def migrate_version(self, app_version):
+        source_key = app_version.legacy_storage_key
+        if not self.source.exists(source_key):
+            return self.adopt_blob(app_version)
+
+        md5_hash, sha256_hash = _file_hashes(self.source.path(source_key))
+        if md5_hash != app_version.md5_hash:
+            self.stderr.write(f"MD5 不匹配，跳过: {source_key}")
+            return 'md5_mismatch'
+        if self.dry_run:
+            return 'migrated'
+
+        size = self.source.size(source_key)
+        target_key = blob_key(sha256_hash)
+        if self.target.exists(target_key):
+            # 内容相同的文件已存在，只需引用
+            self.discard_source(source_key)
+        else:
+            self.transfer(source_key, target_key)
+        with self.db_lock:
+            blob, _ = _get_or_create_blob(md5_hash, sha256_hash, size)
+            return self.link_blob(app_version, blob)
+
+    def adopt_blob(self, app_version):
+        """旧文件已不在本地时，引用内容相同（MD5 与大小一致）且已存储的内容文件"""
+        blob = Blob.objects.filter(md5_hash=app_version.md5_hash, size=app_version.file_size).first()
+        if blob is None or not self.target.exists(blob_key(blob.sha256_hash)):
+            return 'missing'
+        if self.dry_run:
+            return 'migrated'
+        with self.db_lock:
+            return self.link_blob(app_version, blob)
+
+    def link_blob(self, app_version, blob):
+        with transaction.atomic():
+            # 条件更新，并发执行或重复执行时不会重复增加引用计数
+            updated = AppVersion.objects.filter(pk=app_version.pk, blob__isnull=True).update(
+                blob=blob, sha256_hash=blob.sha256_hash
+            )
+            if updated:
+                Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return 'migrated' if updated else 'skipped'
+
+    def migrate_delta(self, located):
+        delta_id, source_key = located
+        delta = VersionDelta.objects.select_related(
+            'from_version__application', 'to_version__application'
+        ).filter(pk=delta_id).first()
+        if delta is None:
+            return 'skipped'
+        target_key = delta.storage_key
+        if self.same_backend and source_key == target_key:
+            return 'skipped'
+        if self.dry_run:
+            return 'migrated'
+        if self.target.exists(target_key):
+            # 内容相同的版本之间的差分包共用同一个文件
+            self.discard_source(source_key)
+        else:
+            self.transfer(source_key, target_key)
+        return 'migrated'
@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core.benchmarks import environment_info, format_size, parse_size, summarize
+from core.models import Application, AppVersion
+
+# 上传放在最后：上传产生的后台任务不应影响其他场景
+SCENARIOS = (
+    'market', 'market_cold', 'market_search', 'app_detail', 'versions_api', 'latest_api', 'download', 'upload',
+)
+
+
+class Scenario:
+    """一个基准场景：request(i) 发出一次请求并返回响应；prepare(i) 在计时之外准备数据"""
+
+    def __init__(self, name, request, prepare=None, bytes_per_request=0):
+        self.name = name
+        self.request = request
+        self.prepare = prepare
+        self.bytes_per_request = bytes_per_request
+
+
+class Command(BaseCommand):
+    help = (
+        "在进程内对主要页面与接口进行基准测试，统计吞吐量与 p50/p95/p99 延迟，结果写入 JSON 以便在提交之间对比。"
+        "需先用 generate_catalog 生成合成目录"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench-', help="generate_catalog 使用的前缀")
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"逗号分隔，可选: {', '.join(SCENARIOS)}")
+        parser.add_argument('--iterations', type=int, default=200, help="页面与接口场景的请求次数")
+        parser.add_argument('--io-iterations', type=int, default=20, help="上传、下载场景每种大小的请求次数")
+        parser.add_argument('--warmup', type=int, default=5, help="每个场景计时前的预热请求次数")
+        parser.add_argument('--sizes', default='64K,1M,16M', help="上传、下载的文件大小，逗号分隔")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--with-deltas', action='store_true',
+            help="上传后照常在后台生成差分包（默认关闭，避免后台 bsdiff 与计时请求争用 CPU）"
+        )
+        parser.add_argument('--output', help="结果 JSON 文件路径")
+        parser.add_argument('--compare', help="与之前的结果 JSON 对比并输出变化")
+
+    def handle(self, *args, **options):
+        self.prefix = options['prefix']
+        self.rng = random.Random(options['seed'])
+        requested = {name.strip() for name in options['scenarios'].split(',') if name.strip()}
+        selected = [name for name in SCENARIOS if name in requested]
+        unknown = requested - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"未知的场景: {', '.join(sorted(unknown))}")
+
+        catalog = Application.objects.filter(app_id__startswith=f'{self.prefix}app-')
+        self.app_ids = list(catalog.order_by('?').values_list('app_id', flat=True)[:1000])
+        if not self.app_ids:
+            raise CommandError("没有找到合成目录，请先执行 generate_catalog")
+        self.app_pks = list(Application.objects.filter(app_id__in=self.app_ids).values_list('pk', flat=True))
+
+        self.user, _ = User.objects.get_or_create(username=f'{self.prefix}runner')
+        # 使用 ALLOWED_HOSTS 中的主机名，不依赖测试环境对 testserver 的放行
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h and h != '*'), 'localhost')
+        self.client = Client(HTTP_HOST=host)
+        self.client.force_login(self.user)
+
+        sizes = [parse_size(size) for size in options['sizes'].split(',') if size.strip()]
+        scenarios = []
+        for name in selected:
+            scenarios.extend(getattr(self, f'scenario_{name}')(sizes))
+
+        results = {}
+        try:
+            with override_settings(APP_DELTA_UPDATES=settings.APP_DELTA_UPDATES and options['with_deltas']):
+                for scenario in scenarios:
+                    iterations = options['io_iterations'] if scenario.bytes_per_request else options['iterations']
+                    results[scenario.name] = self.measure(scenario, iterations, options['warmup'])
+                    self.report(scenario.name, results[scenario.name])
+        finally:
+            self.cleanup_uploads()
+
+        output = {
+            'environment': environment_info(),
+            'timestamp': timezone.now().isoformat(),
+            'catalog': {
+                'users': User.objects.count(),
+                'applications': Application.objects.count(),
+                'versions': AppVersion.objects.count(),
+            },
+            'options': {
+                key: options[key] for key in ('iterations', 'io_iterations', 'warmup', 'sizes', 'seed', 'with_deltas')
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(output, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"结果已写入 {options['output']}"))
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def measure(self, scenario, iterations, warmup):
+        samples = []
+        total = 0.0
+        for i in range(-warmup, iterations):
+            if scenario.prepare is not None:
+                scenario.prepare(i)
+            started = time.perf_counter()
+            response = scenario.request(i)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+            response.close()
+            if response.status_code >= 400:
+                raise CommandError(f"{scenario.name} 请求失败: 状态码 {response.status_code}")
+            if i >= 0:
+                samples.append(elapsed * 1000)
+                total += elapsed
+        result = summarize(samples, elapsed_seconds=total)
+        if scenario.bytes_per_request:
+            result['bytes'] = scenario.bytes_per_request
+            result['throughput_mib_s'] = round(scenario.bytes_per_request * len(samples) / total / 1024 ** 2, 2)
+        return result
+
+    def report(self, name, result):
+        line = (
+            f"{name:24s} n={result['count']:<5d} {result['throughput_rps']:>9.1f} req/s  "
+            f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms p99={result['p99_ms']:.2f}ms"
+        )
+        if 'throughput_mib_s' in result:
+            line += f"  {result['throughput_mib_s']} MiB/s"
+        self.stdout.write(line)
+
+    def compare(self, path, results):
+        with open(path) as f:
+            baseline = json.load(f)
+        self.stdout.write(f"与 {path}（提交 {baseline.get('environment', {}).get('commit')}）对比:")
+        for name, result in results.items():
+            previous = baseline.get('scenarios', {}).get(name)
+            if not previous:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if previous.get(key):
+                    changes.append(f"{key[:-3]} {(result[key] - previous[key]) / previous[key] * 100:+.1f}%")
+            self.stdout.write(f"  {name:24s} {'  '.join(changes)}")
+
+    def random_app_id(self):
+        return self.rng.choice(self.app_ids)
+
+    # 场景定义
+
+    def scenario_market(self, sizes):
+        return [Scenario('market', lambda i: self.client.get('/'))]
+
+    def scenario_market_cold(self, sizes):
+        # 每次请求前清空缓存，测量缓存未命中时的查询与渲染开销
+        return [Scenario('market_cold', lambda i: self.client.get('/'), prepare=lambda i: cache.clear())]
+
+    def scenario_market_search(self, sizes):
+        names = list(Application.objects.filter(app_id__in=self.app_ids[:50]).values_list('name', flat=True))
+        terms = [name.split()[0].lower() for name in names if name.split()]
+        return [Scenario('market_search', lambda i: self.client.get('/', {'q': self.rng.choice(terms)}))]
+
+    def scenario_app_detail(self, sizes):
+        return [Scenario('app_detail', lambda i: self.client.get(f'/app/{self.rng.choice(self.app_pks)}/'))]
+
+    def scenario_versions_api(self, sizes):
+        return [Scenario('versions_api', lambda i: self.client.get(f'/apps/{self.random_app_id()}/versions/'))]
+
+    def scenario_latest_api(self, sizes):
+        return [Scenario('latest_api', lambda i: self.client.get(f'/apps/{self.random_app_id()}/versions/latest/'))]
+
+    def scenario_upload(self, sizes):
+        application, _ = Application.objects.get_or_create(
+            app_id=f'{self.prefix}upload', defaults={'name': 'Upload Bench', 'description': 'benchmark', 'owner': self.user}
+        )
+        scenarios = []
+        for size in sizes:
+            state = {}
+
+            def prepare(i, size=size, state=state):
+                # 每次上传不同的内容，避免命中内容去重
+                state['file'] = SimpleUploadedFile(f'bench-{size}.apk', os.urandom(size))
+                state['version'] = f'{size}.{i + 1000}.{self.rng.randrange(10 ** 9)}'
+
+            def request(i, state=state):
+                return self.client.post(f'/apps/{application.app_id}/versions/', {
+                    'version': state['version'], 'file': state['file'],
+                })
+
+            scenarios.append(Scenario(f'upload_{format_size(size)}', request, prepare, bytes_per_request=size))
+        return scenarios
+
+    def scenario_download(self, sizes):
+        scenarios = []
+        for size in sizes:
+            app_version = AppVersion.objects.select_related('application').filter(
+                application__app_id__startswith=f'{self.prefix}app-',
+                file_size=size,
+                release_notes__startswith='synthetic ',
+            ).first()
+            if app_version is None:
+                self.stderr.write(f"没有 {format_size(size)} 的安装包文件，跳过下载场景（generate_catalog --file-sizes）")
+                continue
+            url = f'/apps/{app_version.application.app_id}/versions/{app_version.version}/download/'
+            scenarios.append(Scenario(
+                f'download_{format_size(size)}', lambda i, url=url: self.client.get(url), bytes_per_request=size
+            ))
+        return scenarios
+
+    def cleanup_uploads(self):
+        # 删除版本时由信号回收内容寻址存储中的文件
+        Application.objects.filter(app_id=f'{self.prefix}upload').delete()
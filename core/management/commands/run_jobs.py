@@ -0,0 +1,121 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import jobs
+
+# 每隔多少秒清理一次已完成的任务
+PRUNE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        "执行数据库队列中的后台任务（上传后的校验、差分包生成等）。"
+        "主进程负责领取任务与记录结果，任务在进程池中执行；可在多台机器上同时运行"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.APP_JOB_WORKERS,
+            help="工作进程数，默认 APP_JOB_WORKERS（未配置时为 CPU 核数）；0 表示在当前进程中执行"
+        )
+        parser.add_argument('--once', action='store_true', help="执行完当前到期的任务后退出")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="队列为空时的轮询间隔（秒）")
+        parser.add_argument(
+            '--max-tasks-per-child', type=int, default=100,
+            help="每个工作进程执行多少个任务后重启，释放大文件处理占用的内存"
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        previous = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+
+        processes = options['processes']
+        results = {}
+        try:
+            if processes <= 0:
+                self.run_inline(options['once'], options['poll_interval'], results)
+            else:
+                self.run_pool(processes, options, results)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+        summary = '，'.join(f"{status} {count}" for status, count in sorted(results.items())) or '无'
+        self.stdout.write(self.style.SUCCESS(f"已执行任务: {summary}"))
+
+    def stop(self, signum, frame):
+        # 不再领取新任务，等待执行中的任务完成后退出
+        self.stopping = True
+
+    def count(self, results, status):
+        results[status] = results.get(status, 0) + 1
+
+    def housekeeping(self):
+        now = time.monotonic()
+        if now - getattr(self, 'last_prune', 0) >= PRUNE_INTERVAL:
+            jobs.prune()
+            self.last_prune = now
+        jobs.requeue_stale()
+
+    def run_inline(self, once, poll_interval, results):
+        while not self.stopping:
+            self.housekeeping()
+            claimed = jobs.claim(1)
+            if not claimed:
+                if once:
+                    return
+                close_old_connections()
+                time.sleep(poll_interval)
+                continue
+            self.count(results, jobs.run_inline(claimed[0]))
+
+    def create_executor(self, processes, max_tasks_per_child):
+        # 子进程以 spawn 方式启动，各自初始化 Django 并建立数据库连接
+        return ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+            max_tasks_per_child=max_tasks_per_child,
+        )
+
+    def run_pool(self, processes, options, results):
+        owner = jobs.worker_id()
+        executor = self.create_executor(processes, options['max_tasks_per_child'])
+        running = {}
+        try:
+            while running or not self.stopping:
+                if not self.stopping:
+                    self.housekeeping()
+                    free = processes - len(running)
+                    if free > 0:
+                        for job in jobs.claim(free, owner=owner):
+                            running[executor.submit(jobs.execute_in_worker, job.kind, job.payload)] = job
+                if not running:
+                    if options['once']:
+                        return
+                    close_old_connections()
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        error = future.result()
+                    except Exception as e:
+                        # 工作进程异常退出（例如内存不足被杀），同一进程池中的其它任务一并失败
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        error = f"{type(e).__name__}: {e}"
+                    self.count(results, jobs.complete(job, error))
+                if broken:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self.create_executor(processes, options['max_tasks_per_child'])
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
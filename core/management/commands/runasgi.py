@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    import uvicorn
+except ImportError:  # pragma: no cover - 取决于部署环境
+    uvicorn = None
+
+
+class Command(BaseCommand):
+    help = "使用 uvicorn 运行 ASGI 应用（下载与版本查询走异步视图）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('addrport', nargs='?', default='127.0.0.1:8000', help="监听地址，格式为 host:port")
+        parser.add_argument('--workers', type=int, default=1, help="工作进程数")
+        parser.add_argument(
+            '--limit-concurrency', type=int, default=None,
+            help="单个进程允许的最大并发连接数，超出后返回 503"
+        )
+        parser.add_argument('--keep-alive', type=int, default=5, help="空闲 keep-alive 连接的超时时间（秒）")
+        parser.add_argument('--reload', action='store_true', help="代码变更时自动重启（仅用于开发）")
+
+    def handle(self, *args, **options):
+        if uvicorn is None:
+            raise CommandError("未安装 uvicorn，请先执行 pip install uvicorn")
+        host, _, port = options['addrport'].rpartition(':')
+        if not port.isdigit():
+            raise CommandError(f"无效的监听地址: {options['addrport']}")
+
+        uvicorn.run(
+            'Appstore.asgi:application',
+            host=host or '127.0.0.1',
+            port=int(port),
+            workers=options['workers'],
+            limit_concurrency=options['limit_concurrency'],
+            timeout_keep_alive=options['keep_alive'],
+            reload=options['reload'],
+            # Django 不支持 ASGI lifespan 协议
+            lifespan='off',
+        )
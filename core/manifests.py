@@ -0,0 +1,243 @@
+# manifests.py
+"""
+安装包内容清单。
+
+不解压、不读取整个安装包：ZIP 的文件列表与大小都在文件末尾的中央目录中，zipfile 打开文件时
+只定位并读取这一部分；APK 另外解压其中的 AndroidManifest.xml（二进制 XML，通常只有几 KB），
+取得包名、versionCode / versionName 与 SDK 版本。对象存储后端以 Range 请求读取同样的局部内容。
+
+解析结果按 MD5 缓存在 PackageManifest 中。新版本在后台处理时生成（processing 的处理步骤），
+更早上传的版本在第一次查看清单时生成；此后版本列表、最新版本与应用详情页随版本查询一并
+JOIN 取出摘要，不再读取安装包。
+"""
+import struct
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import PackageManifest
+from .storage import get_storage
+
+# 随版本一起输出的摘要字段；完整文件列表只在清单接口中返回
+SUMMARY_FIELDS = ('file_count', 'uncompressed_size', 'apk', 'error')
+# values() 中随版本 JOIN 取出摘要所需的列
+MANIFEST_COLUMNS = tuple(f'manifest__{field}' for field in SUMMARY_FIELDS)
+# 取模型实例时以 annotate(**MANIFEST_ANNOTATIONS) 只 JOIN 摘要列，不读取完整文件列表
+MANIFEST_ANNOTATIONS = {f'manifest_{field}': F(f'manifest__{field}') for field in SUMMARY_FIELDS}
+
+ANDROID_MANIFEST = 'AndroidManifest.xml'
+# 解压后超过该大小的 AndroidManifest.xml 不解析，防止压缩炸弹
+MAX_ANDROID_MANIFEST_SIZE = 4 * 1024 * 1024
+
+# 二进制 XML（AXML）的块类型与属性值类型，见 AOSP ResourceTypes.h
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_TYPE = 0x0003
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+UTF8_FLAG = 0x100
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+TYPE_INT_BOOLEAN = 0x12
+NO_INDEX = 0xFFFFFFFF
+
+# 编译工具可能去掉属性名，只保留资源 ID，按资源 ID 识别需要的属性
+ATTRIBUTE_IDS = {
+    0x0101021b: 'versionCode',
+    0x0101021c: 'versionName',
+    0x0101020c: 'minSdkVersion',
+    0x01010270: 'targetSdkVersion',
+}
+APK_FIELDS = {
+    ('manifest', 'package'): 'package',
+    ('manifest', 'versionCode'): 'version_code',
+    ('manifest', 'versionName'): 'version_name',
+    ('uses-sdk', 'minSdkVersion'): 'min_sdk',
+    ('uses-sdk', 'targetSdkVersion'): 'target_sdk',
+}
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def _decode_string(data, pos, utf8):
+    if utf8:
+        # 依次为字符数与字节数，各占 1 或 2 字节
+        pos += 2 if data[pos] & 0x80 else 1
+        length = data[pos]
+        if length & 0x80:
+            length = ((length & 0x7f) << 8) | data[pos + 1]
+            pos += 2
+        else:
+            pos += 1
+        return data[pos:pos + length].decode('utf-8', 'replace')
+    length, = struct.unpack_from('<H', data, pos)
+    pos += 2
+    if length & 0x8000:
+        low, = struct.unpack_from('<H', data, pos)
+        length = ((length & 0x7fff) << 16) | low
+        pos += 2
+    return data[pos:pos + length * 2].decode('utf-16-le', 'replace')
+
+
+def _read_string_pool(data, offset):
+    _, header_size, _, count, _, flags, strings_start, _ = struct.unpack_from('<HHIIIIII', data, offset)
+    offsets = struct.unpack_from(f'<{count}I', data, offset + header_size)
+    base = offset + strings_start
+    return [_decode_string(data, base + string_offset, flags & UTF8_FLAG) for string_offset in offsets]
+
+
+def _attribute_value(strings, raw_value, data_type, value):
+    if data_type == TYPE_STRING:
+        return strings[value]
+    if data_type in (TYPE_INT_DEC, TYPE_INT_HEX):
+        return value
+    if data_type == TYPE_INT_BOOLEAN:
+        return value != 0
+    if data_type == TYPE_REFERENCE:
+        # 引用 resources.arsc 中的资源，不再继续解析
+        return f'@0x{value:08x}'
+    return strings[raw_value] if raw_value != NO_INDEX else value
+
+
+def _read_element(data, pos, strings, resource_ids):
+    """返回 (元素名, {属性名: 值})，pos 指向 start element 块头之后"""
+    _, _, _, name, attribute_start, attribute_size, attribute_count = struct.unpack_from('<IIIIHHH', data, pos)
+    pos += 8  # 跳过行号与注释，指向扩展部分
+    attributes = {}
+    for index in range(attribute_count):
+        attribute_pos = pos + attribute_start + index * attribute_size
+        _, attribute_name, raw_value, _, _, data_type, value = struct.unpack_from('<IIIHBBI', data, attribute_pos)
+        if attribute_name < len(resource_ids) and resource_ids[attribute_name] in ATTRIBUTE_IDS:
+            key = ATTRIBUTE_IDS[resource_ids[attribute_name]]
+        else:
+            key = strings[attribute_name]
+        attributes[key] = _attribute_value(strings, raw_value, data_type, value)
+    return strings[name], attributes
+
+
+def _parse_axml(data):
+    chunk_type, header_size, _ = struct.unpack_from('<HHI', data, 0)
+    if chunk_type != RES_XML_TYPE:
+        raise ManifestError("不是二进制 XML 文件")
+    strings, resource_ids, apk = [], (), {}
+    offset = header_size
+    while offset + 8 <= len(data):
+        chunk_type, header_size, chunk_size = struct.unpack_from('<HHI', data, offset)
+        if chunk_size < 8:
+            raise ManifestError("无效的 XML 块")
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = _read_string_pool(data, offset)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            count = (chunk_size - header_size) // 4
+            resource_ids = struct.unpack_from(f'<{count}I', data, offset + header_size)
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            element, attributes = _read_element(data, offset + 8, strings, resource_ids)
+            if element == 'application':
+                # <uses-sdk> 必须出现在 <application> 之前，之后的内容不需要
+                break
+            for (owner, attribute), field in APK_FIELDS.items():
+                if owner == element and attribute in attributes:
+                    apk[field] = attributes[attribute]
+        offset += chunk_size
+    if 'package' not in apk:
+        raise ManifestError("缺少 <manifest> 元素")
+    return apk
+
+
+def parse_android_manifest(data):
+    """从二进制 AndroidManifest.xml 中取出包名、版本号与 SDK 版本"""
+    try:
+        return _parse_axml(data)
+    except (struct.error, IndexError) as e:
+        raise ManifestError("无法解析 AndroidManifest.xml") from e
+
+
+def _read_apk_info(archive):
+    try:
+        info = archive.getinfo(ANDROID_MANIFEST)
+    except KeyError:
+        return None
+    if info.file_size > MAX_ANDROID_MANIFEST_SIZE:
+        return None
+    try:
+        return parse_android_manifest(archive.read(info))
+    except (ManifestError, zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError):
+        # 清单损坏、加密或使用了不支持的压缩方式时只返回文件列表
+        return None
+
+
+def read_package(fileobj):
+    """解析可随机访问的安装包文件，返回 PackageManifest 的字段"""
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except (zipfile.BadZipFile, ValueError, EOFError):
+        return {'error': "不是有效的 ZIP 文件"}
+    with archive:
+        files = [info for info in archive.infolist() if not info.is_dir()]
+        return {
+            'file_count': len(files),
+            'uncompressed_size': sum(info.file_size for info in files),
+            'entries': [
+                {'name': info.filename, 'size': info.file_size, 'compressed_size': info.compress_size}
+                for info in files[:settings.APP_MANIFEST_MAX_ENTRIES]
+            ],
+            'apk': _read_apk_info(archive),
+        }
+
+
+def get_manifest(app_version):
+    """读取缓存的清单，没有时解析安装包并缓存；安装包文件不存在时抛出 FileNotFoundError"""
+    manifest = PackageManifest.objects.filter(md5_hash=app_version.md5_hash).first()
+    if manifest is not None:
+        return manifest
+    storage = get_storage()
+    if not storage.exists(app_version.storage_key):
+        raise FileNotFoundError(app_version.storage_key)
+    with storage.open_seekable(app_version.storage_key) as f:
+        fields = read_package(f)
+    try:
+        with transaction.atomic():
+            return PackageManifest.objects.create(md5_hash=app_version.md5_hash, **fields)
+    except IntegrityError:
+        # 并发查看同一内容时，另一请求已先写入
+        return PackageManifest.objects.get(md5_hash=app_version.md5_hash)
+
+
+def inspect_version(app_version):
+    """processing 的处理步骤：在后台生成清单，不是 ZIP 文件不影响版本可用"""
+    get_manifest(app_version)
+
+
+def _summary(manifest):
+    return {field: getattr(manifest, field) for field in SUMMARY_FIELDS}
+
+
+def add_manifest_summaries(rows, items):
+    """
+    给序列化结果逐项加上 manifest 摘要，尚未生成清单时为 None。
+    rows 为带 MANIFEST_COLUMNS 的 values() 行，或带 MANIFEST_ANNOTATIONS 的模型实例
+    """
+    for row, item in zip(rows, items):
+        if isinstance(row, dict):
+            values = {field: row[f'manifest__{field}'] for field in SUMMARY_FIELDS}
+        else:
+            values = {field: getattr(row, f'manifest_{field}') for field in SUMMARY_FIELDS}
+        # LEFT JOIN 没有匹配时各列均为 None，error 列本身不会为 NULL
+        item['manifest'] = None if values['error'] is None else values
+    return items
+
+
+def manifest_data(manifest):
+    """清单接口的完整输出"""
+    return {
+        'md5_hash': manifest.md5_hash,
+        **_summary(manifest),
+        'truncated': manifest.file_count > len(manifest.entries),
+        'entries': manifest.entries,
+    }
@@ -0,0 +1,185 @@
+# metrics.py
+"""
+请求监控指标（Prometheus）。
+
+多进程部署（gunicorn / uvicorn --workers）时设置环境变量 PROMETHEUS_MULTIPROC_DIR
+指向一个每次启动前清空的目录，各工作进程把指标写入该目录，/metrics 汇总所有进程的数据。
+该变量必须在进程启动时设置（prometheus_client 导入时读取）。
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+    )
+except ImportError:  # 未安装时不采集指标，/metrics 返回 503
+    Counter = None
+
+ENABLED = Counter is not None
+
+# 下载与上传路由（URL 名称），按其中的 app_id 统计字节数
+DOWNLOAD_ROUTES = {'download-app-version', 'download-version-delta', 'signed-download'}
+UPLOAD_ROUTES = {'app-versions', 'upload_app_version', 'upload-session'}
+
+SIZE_BUCKETS = tuple(2 ** n for n in range(8, 32, 2))  # 256B ~ 512MB
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+if ENABLED:
+    REQUESTS = Counter(
+        'appstore_http_requests_total', "HTTP 请求数", ['route', 'method', 'status']
+    )
+    LATENCY = Histogram(
+        'appstore_http_request_duration_seconds', "视图返回响应的耗时（流式响应不含发送响应体的时间）",
+        ['route', 'method']
+    )
+    IN_FLIGHT = Gauge(
+        'appstore_http_requests_in_flight', "正在处理的请求数", multiprocess_mode='livesum'
+    )
+    RESPONSE_SIZE = Histogram(
+        'appstore_http_response_size_bytes', "响应体大小（有 Content-Length 的响应）", ['route'], buckets=SIZE_BUCKETS
+    )
+    DB_QUERIES = Histogram(
+        'appstore_db_queries_per_request', "单个请求执行的数据库查询数", ['route'], buckets=QUERY_COUNT_BUCKETS
+    )
+    DB_TIME = Histogram(
+        'appstore_db_query_seconds_per_request', "单个请求的数据库查询总耗时", ['route']
+    )
+    DOWNLOAD_BYTES = Counter('appstore_download_bytes_total', "由本服务发送的安装包字节数", ['app_id'])
+    UPLOAD_BYTES = Counter('appstore_upload_bytes_total', "上传请求体字节数", ['app_id'])
+
+
+class QueryTracker:
+    """单个请求的查询次数与耗时"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# 当前请求的 QueryTracker。sync_to_async 与 asyncio.to_thread 会把上下文复制到执行线程，
+# 异步视图在其它线程（各自的数据库连接）上执行的查询同样计入发起请求的 tracker
+_current_tracker = ContextVar('query_tracker', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    tracker = _current_tracker.get()
+    if tracker is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        tracker.count += 1
+        tracker.duration += time.perf_counter() - started
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    """每个线程的数据库连接建立时装上计数包装，重连时不重复添加"""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_install_wrapper)
+
+
+@contextmanager
+def track_queries():
+    """在 with 块（及其派生的线程调用）内统计查询，返回 QueryTracker"""
+    tracker = QueryTracker()
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+
+def _count_bytes(iterator, counter):
+    for chunk in iterator:
+        counter.inc(len(chunk))
+        yield chunk
+
+
+async def _acount_bytes(iterator, counter):
+    async for chunk in iterator:
+        counter.inc(len(chunk))
+        yield chunk
+
+
+def _track_download(response, app_id):
+    """统计实际发送的下载字节数；交给前端代理发送的响应（无响应体）不计入"""
+    if response.status_code not in (200, 206) or not response.streaming:
+        return
+    counter = DOWNLOAD_BYTES.labels(app_id)
+    if getattr(response, 'file_to_stream', None) is not None and response.has_header('Content-Length'):
+        # 完整文件保持 FileResponse 原样，WSGI 服务器可以用 sendfile 零拷贝发送，关闭时按长度计数
+        length = int(response['Content-Length'])
+        response._resource_closers.append(lambda: counter.inc(length))
+    elif response.is_async:
+        response.streaming_content = _acount_bytes(response.streaming_content, counter)
+    else:
+        response.streaming_content = _count_bytes(response.streaming_content, counter)
+
+
+def record_request(request, response, elapsed, queries):
+    """请求结束时记录指标，由 MetricsMiddleware 调用"""
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else '<unmatched>'
+    REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    LATENCY.labels(route, request.method).observe(elapsed)
+    DB_QUERIES.labels(route).observe(queries.count)
+    DB_TIME.labels(route).observe(queries.duration)
+    if not response.streaming:
+        RESPONSE_SIZE.labels(route).observe(len(response.content))
+    elif response.has_header('Content-Length'):
+        RESPONSE_SIZE.labels(route).observe(int(response['Content-Length']))
+
+    if match is None or 'app_id' not in match.kwargs:
+        return
+    if match.url_name in DOWNLOAD_ROUTES:
+        _track_download(response, match.kwargs['app_id'])
+    elif match.url_name in UPLOAD_ROUTES and request.method in ('POST', 'PATCH') and response.status_code < 400:
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        UPLOAD_BYTES.labels(match.kwargs['app_id']).inc(length)
+
+
+def metrics_view(request):
+    """
+    Prometheus 文本格式的指标，需要 Authorization: Bearer <METRICS_TOKEN>；
+    指标中带有按 app_id 统计的数据，未配置令牌时只在 DEBUG 下开放
+    """
+    if not ENABLED:
+        return HttpResponse("未安装 prometheus_client", status=503, content_type='text/plain; charset=utf-8')
+    if not settings.METRICS_TOKEN:
+        if not settings.DEBUG:
+            return HttpResponse("未配置 METRICS_TOKEN", status=403, content_type='text/plain; charset=utf-8')
+    elif request.META.get('HTTP_AUTHORIZATION') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponse(status=401)
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """
+    工作进程退出时清理其 livesum 类型的指标文件，供 gunicorn 的 child_exit 钩子调用：
+
+        def child_exit(server, worker):
+            from core.metrics import mark_process_dead
+            mark_process_dead(worker.pid)
+    """
+    if ENABLED and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,64 @@
+# middleware.py
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics
+
+
+class ASGIURLConfMiddleware(MiddlewareMixin):
+    """
+    通过 ASGI 服务器（uvicorn）进入的请求改用 settings.ASGI_ROOT_URLCONF，
+    使下载与版本查询走异步视图；WSGI 部署不受影响。
+    """
+
+    def process_request(self, request):
+        if settings.ASGI_ROOT_URLCONF and isinstance(request, ASGIRequest):
+            request.urlconf = settings.ASGI_ROOT_URLCONF
+
+
+class MetricsMiddleware:
+    """
+    记录每个路由的延迟、查询次数与耗时、响应大小和并发请求数，以及按应用统计的上传/下载字节数（见 core.metrics）。
+    同时支持 WSGI 与 ASGI，不会让 ASGI 下的中间件链退化为同步执行。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not metrics.ENABLED:
+            return self.get_response(request)
+        started = time.perf_counter()
+        metrics.IN_FLIGHT.inc()
+        try:
+            with metrics.track_queries() as queries:
+                response = self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+        metrics.record_request(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics.ENABLED:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        metrics.IN_FLIGHT.inc()
+        try:
+            # 异步视图的查询在线程池中各自的连接上执行，按上下文而不是按连接统计
+            with metrics.track_queries() as queries:
+                response = await self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+        metrics.record_request(request, response, time.perf_counter() - started, queries)
+        return response
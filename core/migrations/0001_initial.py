@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Application',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_id', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AppVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=50)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_size', models.BigIntegerField()),
+                ('md5_hash', models.CharField(max_length=32)),
+                ('upload_time', models.DateTimeField(auto_now_add=True)),
+                ('release_notes', models.TextField(blank=True)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.application')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GitHubSocialAuth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('github_id', models.PositiveBigIntegerField(unique=True)),
+                ('github_login', models.CharField(max_length=100)),
+                ('access_token', models.CharField(max_length=100)),
+                ('token_expiry', models.DateTimeField(blank=True, null=True)),
+                ('refresh_token', models.CharField(blank=True, max_length=100, null=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='github_auth', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('avatar_url', models.URLField(blank=True, max_length=255, null=True)),
+                ('full_name', models.CharField(blank=True, max_length=150, null=True)),
+                ('github_profile', models.URLField(blank=True, max_length=255, null=True)),
+                ('registration_source', models.CharField(choices=[('github', 'GitHub'), ('local', 'Local Registration')], default='local', max_length=20)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appversion',
+            name='sha256_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
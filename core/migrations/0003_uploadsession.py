@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:46
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_appversion_sha256_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=50)),
+                ('file_name', models.CharField(max_length=255)),
+                ('release_notes', models.TextField(blank=True)),
+                ('upload_length', models.BigIntegerField()),
+                ('upload_offset', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.application')),
+            ],
+        ),
+    ]
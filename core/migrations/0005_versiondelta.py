@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('algorithm', models.CharField(default='bsdiff4', max_length=20)),
+                ('file_size', models.BigIntegerField()),
+                ('sha256_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('from_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deltas_from', to='core.appversion')),
+                ('to_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deltas_to', to='core.appversion')),
+            ],
+            options={
+                'unique_together': {('from_version', 'to_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+from core.versioning import version_sort_key
+
+
+def backfill_sort_key(apps, schema_editor):
+    """为已有版本计算排序键"""
+    AppVersion = apps.get_model('core', 'AppVersion')
+    batch = []
+    for app_version in AppVersion.objects.only('id', 'version').iterator(chunk_size=2000):
+        app_version.sort_key = version_sort_key(app_version.version)
+        batch.append(app_version)
+        if len(batch) >= 2000:
+            AppVersion.objects.bulk_update(batch, ['sort_key'])
+            batch = []
+    if batch:
+        AppVersion.objects.bulk_update(batch, ['sort_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_versiondelta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appversion',
+            name='sort_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_sort_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='appversion',
+            index=models.Index(fields=['application', 'sort_key'], name='core_appver_app_sortkey_idx'),
+        ),
+    ]
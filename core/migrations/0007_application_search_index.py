@@ -0,0 +1,80 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE core_application_fts USING fts5(
+        name, description,
+        content='core_application', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER core_application_fts_ai AFTER INSERT ON core_application BEGIN
+        INSERT INTO core_application_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_application_fts_ad AFTER DELETE ON core_application BEGIN
+        INSERT INTO core_application_fts(core_application_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_application_fts_au AFTER UPDATE OF name, description ON core_application BEGIN
+        INSERT INTO core_application_fts(core_application_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO core_application_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO core_application_fts(core_application_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS core_application_fts_au",
+    "DROP TRIGGER IF EXISTS core_application_fts_ad",
+    "DROP TRIGGER IF EXISTS core_application_fts_ai",
+    "DROP TABLE IF EXISTS core_application_fts",
+]
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE core_application ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX core_application_search_idx ON core_application USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS core_application_search_idx",
+    "ALTER TABLE core_application DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    全文检索索引，按数据库类型创建：
+    SQLite 为 FTS5 外部内容表 + 触发器同步；PostgreSQL 为生成列 tsvector + GIN 索引。
+    """
+
+    dependencies = [
+        ('core', '0006_appversion_sort_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
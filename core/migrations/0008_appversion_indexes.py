@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:01
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def rename_duplicate_versions(apps, schema_editor):
+    """
+    添加唯一约束前处理重复的 (application, version)：保留最新一条，
+    其余重命名为 "<version>~<id>"，数据不丢失，排序键置空使其排在最后
+    """
+    AppVersion = apps.get_model('core', 'AppVersion')
+    duplicates = AppVersion.objects.values('application', 'version').annotate(
+        total=Count('id'), newest=Max('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates:
+        stale = AppVersion.objects.filter(
+            application=duplicate['application'], version=duplicate['version']
+        ).exclude(id=duplicate['newest'])
+        for app_version in stale:
+            suffix = f"~{app_version.id}"
+            app_version.version = app_version.version[:50 - len(suffix)] + suffix
+            app_version.sort_key = ''
+            app_version.save(update_fields=['version', 'sort_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_application_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appversion',
+            index=models.Index(fields=['application', 'upload_time'], name='core_appver_app_uptime_idx'),
+        ),
+        migrations.RunPython(rename_duplicate_versions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appversion',
+            constraint=models.UniqueConstraint(fields=('application', 'version'), name='core_appver_app_version_uniq'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:04
+
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+search_index = importlib.import_module('core.migrations.0007_application_search_index')
+
+
+def restore_search_triggers(apps, schema_editor):
+    """
+    SQLite 上给 core_application 加非空字段会重建整张表，表上的全文检索触发器随之被删除，
+    这里按 0007 的定义重新创建触发器并重建索引
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in search_index.SQLITE_FORWARD[1:]:
+        schema_editor.execute(statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_appversion_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='download_count',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='appversion',
+            name='download_count',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='DownloadStatDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_downloads', to='core.application')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_downloads', to='core.appversion')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['application', 'day'], name='core_dldaily_app_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('version', 'day'), name='core_dldaily_version_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DownloadStatHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_downloads', to='core.application')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_downloads', to='core.appversion')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['application', 'hour'], name='core_dlhourly_app_hour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('version', 'hour'), name='core_dlhourly_version_hour_uniq')],
+            },
+        ),
+    ]
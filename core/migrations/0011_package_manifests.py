@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_appversion_processing_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('md5_hash', models.CharField(max_length=32, unique=True)),
+                ('file_count', models.PositiveIntegerField(default=0)),
+                ('uncompressed_size', models.BigIntegerField(default=0)),
+                ('entries', models.JSONField(default=list)),
+                ('apk', models.JSONField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appversion',
+            name='manifest',
+            field=models.ForeignObject(from_fields=['md5_hash'], null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.packagemanifest', to_fields=['md5_hash']),
+        ),
+    ]
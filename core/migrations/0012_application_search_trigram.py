@@ -0,0 +1,42 @@
+import importlib
+
+from django.db import migrations
+
+search_index = importlib.import_module('core.migrations.0007_application_search_index')
+
+SQLITE_TRIGRAM_TABLE = """
+    CREATE VIRTUAL TABLE core_application_fts USING fts5(
+        name, description,
+        content='core_application', content_rowid='id',
+        tokenize='trigram'
+    )
+"""
+
+
+def use_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in search_index.SQLITE_BACKWARD + [SQLITE_TRIGRAM_TABLE] + search_index.SQLITE_FORWARD[1:]:
+        schema_editor.execute(statement)
+
+
+def use_unicode61(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in search_index.SQLITE_BACKWARD + search_index.SQLITE_FORWARD:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    """
+    SQLite 全文检索改用 trigram 分词（需要 SQLite 3.34+）：unicode61 把连续的汉字整体当作一个词，
+    "聊天" 检索不到 "一款好用的聊天工具"；trigram 按三字符切分，支持任意位置的子串匹配
+    """
+
+    dependencies = [
+        ('core', '0011_package_manifests'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_trigram, use_unicode61),
+    ]
@@ -1,9 +1,19 @@
 # models.py
+import os
+import uuid
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import bump_market_generation
+from .storage import get_storage, shard_key
+from .versioning import version_sort_key
 
 
 class Application(models.Model):
@@ -13,17 +23,309 @@ class Application(models.Model):
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    # 由 counters.flush_download_counters 定期批量写回，不在下载请求中直接更新
+    download_count = models.BigIntegerField(default=0, editable=False)
+
+
+class Blob(models.Model):
+    """
+    按 SHA-256 内容寻址存储的安装包文件，多个版本可共享同一份内容
+    """
+    sha256_hash = models.CharField(max_length=64, unique=True)
+    md5_hash = models.CharField(max_length=32)
+    size = models.BigIntegerField()
+    # 引用该内容的 AppVersion 数量，归零时删除文件
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def storage_key(self):
+        return blob_key(self.sha256_hash)
+
+    @property
+    def path(self):
+        return blob_path(self.sha256_hash)
+
+
+class PackageManifest(models.Model):
+    """
+    安装包内容清单（ZIP 中央目录与 APK 清单信息），按 MD5 缓存，内容相同的版本共用一条记录（见 core.manifests）
+    """
+    md5_hash = models.CharField(max_length=32, unique=True)
+    file_count = models.PositiveIntegerField(default=0)
+    # 解压后的总大小
+    uncompressed_size = models.BigIntegerField(default=0)
+    # [{name, size, compressed_size}]，条目过多时只保存前 APP_MANIFEST_MAX_ENTRIES 个
+    entries = models.JSONField(default=list)
+    # APK 的包名、versionCode、versionName 与 SDK 版本；不是 APK 时为空
+    apk = models.JSONField(null=True, blank=True)
+    # 不是有效的 ZIP 文件时记录原因，同样缓存，不再重复解析
+    error = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+def blob_key(sha256_hash):
+    """内容寻址存储键: blobs/ab/cd/<sha256>"""
+    return shard_key('blobs', sha256_hash)
+
+
+def blob_path(sha256_hash):
+    """本地存储后端中的内容寻址路径: APP_STORAGE/blobs/ab/cd/<sha256>；远程后端返回 None"""
+    return get_storage().local_path(blob_key(sha256_hash))
+
+
+def legacy_version_key(app_id, version, file_name):
+    """旧版按应用分目录的存储键: <app_id>/<version>_<file_name>"""
+    return f"{app_id}/{version}_{file_name}"
 
 
 class AppVersion(models.Model):
+    # 上传后的后台处理状态（见 core.processing），上传请求在文件落盘后即返回 pending
+    PENDING, READY, FAILED = 'pending', 'ready', 'failed'
+    PROCESSING_STATES = [(PENDING, '处理中'), (READY, '可用'), (FAILED, '处理失败')]
+
     # 原有字段保持不变
     application = models.ForeignKey(Application, on_delete=models.CASCADE)
     version = models.CharField(max_length=50)
     file_name = models.CharField(max_length=255)
     file_size = models.BigIntegerField()
     md5_hash = models.CharField(max_length=32)
+    sha256_hash = models.CharField(max_length=64, blank=True, default='')
     upload_time = models.DateTimeField(auto_now_add=True)
     release_notes = models.TextField(blank=True)
+    # 内容寻址存储中的文件；为空表示旧版按 <app_id>/<version>_<file_name> 存放的文件
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='versions')
+    # 由版本号生成的排序键（见 versioning.version_sort_key），用于在数据库中按语义版本排序
+    sort_key = models.CharField(max_length=255, editable=False, default='')
+    # 由 counters.flush_download_counters 定期批量写回
+    download_count = models.BigIntegerField(default=0, editable=False)
+    # 直接创建的记录（批量导入、测试数据）视为已处理
+    processing_state = models.CharField(max_length=10, choices=PROCESSING_STATES, default=READY)
+    processing_error = models.TextField(blank=True, default='')
+    # 按 md5_hash 关联的内容清单，不占用数据库列；select_related / values 时以 LEFT JOIN 一并取出
+    manifest = models.ForeignObject(
+        PackageManifest, on_delete=models.DO_NOTHING, from_fields=['md5_hash'], to_fields=['md5_hash'],
+        null=True, related_name='+'
+    )
+
+    class Meta:
+        constraints = [
+            # 同时作为按 (application, version) 查找的索引
+            models.UniqueConstraint(fields=['application', 'version'], name='core_appver_app_version_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['application', 'sort_key'], name='core_appver_app_sortkey_idx'),
+            models.Index(fields=['application', 'upload_time'], name='core_appver_app_uptime_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.sort_key = version_sort_key(self.version)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'version' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'sort_key'}
+        super().save(*args, **kwargs)
+
+    @property
+    def storage_key(self):
+        """安装包在存储后端中的键"""
+        if self.blob_id:
+            return blob_key(self.sha256_hash)
+        return self.legacy_storage_key
+
+    @property
+    def legacy_storage_key(self):
+        """旧版按应用分目录的存储键，由 migrate_storage 迁移到内容寻址布局"""
+        return legacy_version_key(self.application.app_id, self.version, self.file_name)
+
+    @property
+    def storage_path(self):
+        """安装包在本地磁盘上的路径；远程存储后端返回 None"""
+        return get_storage().local_path(self.storage_key)
+
+
+@receiver(post_save, sender=AppVersion)
+def acquire_blob(sender, instance, created, **kwargs):
+    if created and instance.blob_id:
+        Blob.objects.filter(pk=instance.blob_id).update(ref_count=F('ref_count') + 1)
+
+
+def _delete_blob_file(sha256_hash):
+    # 删除记录的事务提交后，并发上传可能已重新登记了相同内容，此时保留文件
+    if not Blob.objects.filter(sha256_hash=sha256_hash).exists():
+        get_storage().delete(blob_key(sha256_hash))
+
+
+@receiver(post_delete, sender=AppVersion)
+def release_blob(sender, instance, **kwargs):
+    """
+    版本删除时减少引用计数，不再被引用的内容连同文件一起删除。
+
+    计数的读取、递减与删除在同一事务中锁住内容记录完成，与 blobstore.create_version_from_blob 的
+    加锁互斥；文件在事务提交后才删除
+    """
+    if not instance.blob_id:
+        return
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=instance.blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 0:
+            # 重复释放时不会减到负数（PositiveIntegerField 会抛出 IntegrityError）
+            blob.ref_count -= 1
+            Blob.objects.filter(pk=blob.pk).update(ref_count=blob.ref_count)
+        if blob.ref_count or AppVersion.objects.filter(blob_id=blob.pk).exists():
+            # 计数有误（例如重复释放）时，仍被引用的内容不删除
+            return
+        sha256_hash = blob.sha256_hash
+        blob.delete()
+    transaction.on_commit(lambda: _delete_blob_file(sha256_hash))
+
+
+class VersionDelta(models.Model):
+    """
+    同一应用相邻两个版本之间的二进制差分包
+    """
+    from_version = models.ForeignKey(AppVersion, on_delete=models.CASCADE, related_name='deltas_from')
+    to_version = models.ForeignKey(AppVersion, on_delete=models.CASCADE, related_name='deltas_to')
+    # 差分算法，目前为 bsdiff4
+    algorithm = models.CharField(max_length=20, default='bsdiff4')
+    file_size = models.BigIntegerField()
+    sha256_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('from_version', 'to_version')
+
+    @property
+    def storage_key(self):
+        """按目标版本内容分片: deltas/ab/cd/<目标哈希>.from-<源哈希>.<算法>"""
+        return shard_key('deltas', self._content_key(self.to_version), self._suffix)
+
+    @property
+    def legacy_storage_key(self):
+        """旧版与目标版本的完整安装包存放在同一目录"""
+        return f"{self.to_version.storage_key}{self._suffix}"
+
+    @property
+    def _suffix(self):
+        return f".from-{self._content_key(self.from_version)}.{self.algorithm}"
+
+    @staticmethod
+    def _content_key(app_version):
+        return app_version.sha256_hash or app_version.md5_hash
+
+    @property
+    def storage_path(self):
+        """差分包在本地磁盘上的路径；远程存储后端返回 None"""
+        return get_storage().local_path(self.storage_key)
+
+
+class Job(models.Model):
+    """
+    数据库任务队列中的一项后台任务，由 manage.py run_jobs 领取并在进程池中执行（见 core.jobs）
+    """
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUSES = [(QUEUED, '排队中'), (RUNNING, '执行中'), (DONE, '已完成'), (FAILED, '失败')]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    # 失败重试时推迟到该时间之后再执行
+    run_after = models.DateTimeField(default=timezone.now)
+    # 执行中的任务由哪个工作进程领取，超时未完成时重新排队
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='core_job_status_runafter_idx'),
+        ]
+
+
+class DownloadStatHourly(models.Model):
+    """
+    按小时汇总的下载次数，统计看板直接读取汇总表而不扫描明细
+    """
+    version = models.ForeignKey(AppVersion, on_delete=models.CASCADE, related_name='hourly_downloads')
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name='hourly_downloads')
+    hour = models.DateTimeField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'hour'], name='core_dlhourly_version_hour_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['application', 'hour'], name='core_dlhourly_app_hour_idx'),
+        ]
+
+
+class DownloadStatDaily(models.Model):
+    """
+    按天（UTC）汇总的下载次数
+    """
+    version = models.ForeignKey(AppVersion, on_delete=models.CASCADE, related_name='daily_downloads')
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name='daily_downloads')
+    day = models.DateField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'day'], name='core_dldaily_version_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['application', 'day'], name='core_dldaily_app_day_idx'),
+        ]
+
+
+@receiver(post_delete, sender=VersionDelta)
+def remove_delta_file(sender, instance, **kwargs):
+    try:
+        key = instance.storage_key
+        from_version, to_version = instance.from_version, instance.to_version
+    except ObjectDoesNotExist:
+        return
+    # 内容相同的版本之间的差分包共用同一个文件，仍有其他记录引用时保留
+    shared = VersionDelta.objects.filter(
+        algorithm=instance.algorithm,
+        from_version__sha256_hash=from_version.sha256_hash, from_version__md5_hash=from_version.md5_hash,
+        to_version__sha256_hash=to_version.sha256_hash, to_version__md5_hash=to_version.md5_hash,
+    ).exists()
+    if not shared:
+        transaction.on_commit(lambda: get_storage().delete(key))
+
+
+class UploadSession(models.Model):
+    """
+    可续传的分块上传会话（tus 风格）
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    application = models.ForeignKey(Application, on_delete=models.CASCADE)
+    version = models.CharField(max_length=50)
+    file_name = models.CharField(max_length=255)
+    release_notes = models.TextField(blank=True)
+    # 文件总大小
+    upload_length = models.BigIntegerField()
+    # 已持久化到磁盘的字节数
+    upload_offset = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # 过期后会话及其分块文件会被清理
+    expires_at = models.DateTimeField(db_index=True)
+
+    @property
+    def partial_path(self):
+        """分块数据在本地磁盘上的存放位置"""
+        return os.path.join(settings.APP_STORAGE, '.uploads', 'sessions', f"{self.id}.part")
+
+    def delete_partial_file(self):
+        try:
+            os.remove(self.partial_path)
+        except FileNotFoundError:
+            pass
 
 
 class GitHubSocialAuth(models.Model):
@@ -75,6 +377,15 @@ class UserProfile(models.Model):
     )
 
 
+# 信号处理：应用或版本变化时使市场页缓存失效
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+@receiver(post_save, sender=AppVersion)
+@receiver(post_delete, sender=AppVersion)
+def invalidate_market_cache(sender, **kwargs):
+    transaction.on_commit(bump_market_generation)
+
+
 # 信号处理：创建用户时自动创建Profile
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
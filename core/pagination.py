@@ -0,0 +1,147 @@
+# pagination.py
+"""游标分页：不统计总数、不使用 OFFSET 扫描，翻页耗时与页码深度无关"""
+import base64
+import binascii
+import json
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def encode_cursor(position):
+    """把分页位置编码为不透明的游标字符串"""
+    raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游标，无效游标返回 None（按第一页处理）"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        position = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    return position if isinstance(position, dict) else None
+
+
+def _value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+class CursorPage:
+    """一页结果及前后页游标，接口与模板中使用的 Page 对象保持一致"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+def keyset_paginate(queryset, token, page_size, field='id'):
+    """
+    按 field 倒序的键集分页，field 需要有索引且取值唯一。
+
+    游标记录上一页边界的 field 值，翻页转化为 WHERE field < ? ORDER BY field DESC LIMIT n，
+    可直接走索引。
+    """
+    position = decode_cursor(token)
+    key = position.get('k') if position else None
+
+    if key is not None and position.get('d') == 'prev':
+        rows = list(queryset.filter(**{f'{field}__gt': key}).order_by(field)[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+    elif key is not None:
+        rows = list(queryset.filter(**{f'{field}__lt': key}).order_by(f'-{field}')[:page_size + 1])
+        has_previous = True
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+    else:
+        rows = []
+        has_previous = has_next = False
+
+    if not rows:
+        # 无游标，或游标所在位置的数据已被删除：回到第一页
+        rows = list(queryset.order_by(f'-{field}')[:page_size + 1])
+        has_previous = False
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor({'k': _value(rows[-1], field)}) if has_next and rows else None,
+        previous_cursor=encode_cursor({'k': _value(rows[0], field), 'd': 'prev'}) if has_previous and rows else None,
+    )
+
+
+def offset_paginate(queryset, token, page_size):
+    """
+    按相关度排序的检索结果无法做键集分页，游标中记录偏移量。
+    检索结果集本身已被全文索引限定，偏移扫描的代价有限。
+    """
+    position = decode_cursor(token)
+    try:
+        offset = max(int(position.get('o', 0)), 0) if position else 0
+    except (TypeError, ValueError):
+        offset = 0
+
+    rows = list(queryset[offset:offset + page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor({'o': offset + page_size}) if has_next else None,
+        previous_cursor=encode_cursor({'o': max(offset - page_size, 0)}) if offset > 0 else None,
+    )
+
+
+class VersionCursorPagination(CursorPagination):
+    """
+    版本列表的游标分页，按 (application, sort_key) 索引倒序翻页。
+
+    响应体仍是版本数组，前后页链接放在 Link 响应头中（RFC 8288），兼容已有客户端。
+    """
+    ordering = ('-sort_key', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_paginated_response(self, data):
+        response = Response(data)
+        links = []
+        next_link = self.get_next_link()
+        previous_link = self.get_previous_link()
+        if next_link:
+            links.append(f'<{next_link}>; rel="next"')
+        if previous_link:
+            links.append(f'<{previous_link}>; rel="prev"')
+        if links:
+            response['Link'] = ', '.join(links)
+        return response
+
+
+def version_list_columns(mapper, extra=()):
+    """版本列表 .values() 需要的列：输出字段、游标定位所需的排序字段以及 extra 中的列"""
+    ordering_fields = [field.lstrip('-') for field in VersionCursorPagination.ordering]
+    return list(dict.fromkeys([*mapper.sources, *ordering_fields, *extra]))
@@ -0,0 +1,73 @@
+# processing.py
+"""
+上传后的后台处理。
+
+上传请求在安装包写入存储后即返回，版本状态为 pending；run_jobs 工作进程执行 process_version
+（必须与 Web 服务一同运行，否则新版本会一直停留在 pending）：
+依次运行 PROCESSING_STEPS 中的各个步骤，全部通过后标记为 ready，并排队生成差分包。
+步骤抛出 ProcessingError 表示安装包本身有问题，版本直接标记为 failed，不再重试；
+其它异常按任务队列的规则重试，重试耗尽后同样标记为 failed。
+"""
+from django.conf import settings
+
+from . import deltas, jobs, manifests
+from .models import AppVersion
+from .storage import get_storage
+
+
+class ProcessingError(Exception):
+    """安装包校验不通过，重试也无法成功"""
+
+
+def verify_stored_file(app_version):
+    """
+    确认存储中的文件存在且大小与上传记录一致。
+    MD5 与 SHA-256 已在接收上传时一次流式计算，这里不再读取整个文件重新计算
+    """
+    storage = get_storage()
+    key = app_version.storage_key
+    if not storage.exists(key):
+        raise ProcessingError("安装包文件不存在")
+    if storage.size(key) != app_version.file_size:
+        raise ProcessingError("安装包大小与上传记录不一致")
+
+
+# 依次执行的处理步骤，每个步骤接收 AppVersion，可以在其它模块中追加
+PROCESSING_STEPS = [verify_stored_file, manifests.inspect_version]
+
+
+def _set_state(app_version, state, error=''):
+    app_version.processing_state = state
+    app_version.processing_error = error
+    # 通过 save 触发 post_save，使市场缓存与目录索引随状态更新
+    app_version.save(update_fields=['processing_state', 'processing_error'])
+
+
+def mark_failed(error, version_id, **payload):
+    """任务重试耗尽后的回调"""
+    app_version = AppVersion.objects.filter(pk=version_id).first()
+    if app_version is not None and app_version.processing_state != AppVersion.READY:
+        _set_state(app_version, AppVersion.FAILED, "处理失败，请重新上传")
+
+
+@jobs.register('process_version', on_failure=mark_failed)
+def process_version(version_id):
+    app_version = AppVersion.objects.select_related('application').filter(pk=version_id).first()
+    if app_version is None or app_version.processing_state == AppVersion.READY:
+        return
+    try:
+        for step in PROCESSING_STEPS:
+            step(app_version)
+    except ProcessingError as e:
+        _set_state(app_version, AppVersion.FAILED, str(e))
+        return
+    _set_state(app_version, AppVersion.READY)
+
+    if deltas.bsdiff4 is not None and settings.APP_DELTA_UPDATES:
+        jobs.enqueue('generate_delta', version_id=app_version.pk)
+
+
+def schedule_processing(app_version):
+    """新上传的版本进入 pending 状态并排队处理；在创建版本的事务中调用"""
+    jobs.enqueue('process_version', version_id=app_version.pk)
+    jobs.warn_if_backlogged()
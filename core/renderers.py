@@ -0,0 +1,30 @@
+# renderers.py
+"""基于 orjson 的 JSON 渲染器，输出与 DRF JSONRenderer 一致（紧凑格式、不转义中文、UTC 时间以 Z 结尾）"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # 未安装时退回 DRF 的 JSONRenderer
+    orjson = None
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Decimal、惰性翻译字符串等 orjson 不支持的类型交给 DRF 的编码器
+    return _fallback_encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # 请求缩进输出（可浏览的调试输出）时沿用 JSONRenderer，orjson 只支持两空格缩进
+        if orjson is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z)
+        # 与 JSONRenderer 一样转义 U+2028 / U+2029，输出可以安全嵌入 <script>
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
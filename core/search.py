@@ -0,0 +1,89 @@
+# search.py
+"""
+应用全文检索：SQLite 使用 FTS5（trigram 分词），PostgreSQL 使用 tsvector + GIN，其他数据库回退为 LIKE。
+
+索引无法处理的检索词改用 LIKE 子串匹配：trigram 至少需要 3 个字符；PostgreSQL 的 simple 配置
+把连续的汉字整体当作一个词，中日韩文字的检索词无法命中词中的一部分。
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+# 应用名称的权重高于描述
+SQLITE_RANK = 'bm25(core_application_fts, 10.0, 1.0)'
+POSTGRES_TSQUERY = "to_tsquery('simple', %s)"
+# trigram 分词能匹配的最短检索词
+TRIGRAM_MIN_LENGTH = 3
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def search_terms(query):
+    """把用户输入拆成检索词（去掉标点与下划线，避免注入检索语法）"""
+    return re.findall(r'[^\W_]+', query.lower())
+
+
+def legacy_search(queryset, query):
+    """旧的模糊匹配实现（全表扫描），用于不支持全文检索的数据库及基准对比"""
+    return queryset.filter(
+        Q(name__icontains=query) |
+        Q(description__icontains=query)
+    ).distinct()
+
+
+def _substring_search(queryset, terms):
+    """每个检索词都需出现在名称或描述中；名称全部匹配的排在前面"""
+    name_match = Q()
+    for term in terms:
+        queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        name_match &= Q(name__icontains=term)
+    return queryset.annotate(
+        search_rank=Case(When(name_match, then=Value(0)), default=Value(1), output_field=IntegerField())
+    ).order_by('search_rank', '-id')
+
+
+def search_applications(queryset, query):
+    """
+    按相关度排序的应用检索，每个检索词都支持子串匹配（"微" 可匹配 "微信"，"聊天" 可匹配 "好用的聊天工具"）。
+
+    queryset 需为 Application 查询集；返回结果按相关度、再按 id 倒序排列。
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        indexed = [term for term in terms if len(term) >= TRIGRAM_MIN_LENGTH]
+        short = [term for term in terms if len(term) < TRIGRAM_MIN_LENGTH]
+        if not indexed:
+            return _substring_search(queryset, short)
+        for term in short:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        match = ' '.join(f'"{term}"' for term in indexed)
+        return queryset.extra(
+            tables=['core_application_fts'],
+            where=[
+                'core_application_fts.rowid = core_application.id',
+                'core_application_fts MATCH %s',
+            ],
+            params=[match],
+            select={'search_rank': SQLITE_RANK},
+        ).order_by('search_rank', '-id')
+
+    if vendor == 'postgresql':
+        indexed = [term for term in terms if not CJK_PATTERN.search(term)]
+        cjk = [term for term in terms if CJK_PATTERN.search(term)]
+        if not indexed:
+            return _substring_search(queryset, cjk)
+        for term in cjk:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        tsquery = ' & '.join(f'{term}:*' for term in indexed)
+        return queryset.extra(
+            where=[f'core_application.search_vector @@ {POSTGRES_TSQUERY}'],
+            params=[tsquery],
+            select={'search_rank': f'ts_rank(core_application.search_vector, {POSTGRES_TSQUERY})'},
+            select_params=[tsquery],
+        ).order_by('-search_rank', '-id')
+
+    return legacy_search(queryset, query)
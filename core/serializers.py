@@ -1,5 +1,8 @@
 # serializers.py
-from rest_framework import serializers
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import Application, AppVersion
 
 class ApplicationSerializer(serializers.ModelSerializer):
@@ -17,12 +20,115 @@ class AppVersionSerializer(serializers.ModelSerializer):
         model = AppVersion
         fields = [
             'id', 'application', 'version', 'file_name',
-            'file_size', 'md5_hash', 'release_notes', 'upload_time'
+            'file_size', 'md5_hash', 'sha256_hash', 'release_notes', 'upload_time', 'processing_state'
         ]
         read_only_fields = [
             'id', 'file_name', 'file_size',
-            'md5_hash', 'upload_time'
+            'md5_hash', 'sha256_hash', 'upload_time', 'processing_state'
         ]
         extra_kwargs = {
             'version': {'required': True}
-        }
\ No newline at end of file
+        }
+
+
+# 列表接口的快速路径：.values() 取出字典后按预先编译的字段映射输出，
+# 不创建模型实例，也不对每一行实例化序列化器与字段
+
+# to_representation 不改变数据库值的字段类型
+_IDENTITY_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+    serializers.PrimaryKeyRelatedField, serializers.ReadOnlyField,
+)
+
+
+def _converter(field):
+    if isinstance(field, _IDENTITY_FIELDS):
+        return None
+    if isinstance(field, serializers.DateTimeField) and (
+        getattr(field, 'format', api_settings.DATETIME_FORMAT) or '').lower() == ISO_8601 and not getattr(
+            field, 'timezone', None):
+        # ISO 8601 输出只需换算到当前时区，由渲染器格式化（与 DRF 的编码结果相同），
+        # 比逐行调用 DateTimeField.to_representation 快一个数量级
+        return _LOCALTIME
+    return field.to_representation
+
+
+# 换算到当前时区的占位转换，map() 时按当前时区绑定（每批只查询一次当前时区）
+_LOCALTIME = object()
+
+
+class ValuesMapper:
+    """
+    把 .values() 的行映射为与 serializer_class 输出相同的字典（字段顺序一致）。
+
+    字段定义只在首次使用时读取一次；subset() 返回只包含部分字段的映射，用于稀疏字段集
+    """
+
+    def __init__(self, serializer_class, columns=None):
+        self.serializer_class = serializer_class
+        self._columns = columns
+        self._subsets = {}
+
+    @property
+    def columns(self):
+        """[(输出字段名, values() 中的键, 转换函数或 None), ...]"""
+        if self._columns is None:
+            columns = []
+            for name, field in self.serializer_class().fields.items():
+                if '.' in field.source or field.source == '*':
+                    raise ValueError(f"字段 {name} 不能由 values() 直接取得")
+                convert = _converter(field)
+                columns.append((name, field.source, convert))
+            self._columns = tuple(columns)
+        return self._columns
+
+    @property
+    def field_names(self):
+        return [name for name, _, _ in self.columns]
+
+    @property
+    def sources(self):
+        return [source for _, source, _ in self.columns]
+
+    def subset(self, fields_param):
+        """
+        解析 ?fields=version,md5_hash 形式的参数，返回只输出这些字段的映射；
+        参数为空时返回自身，包含未知字段时抛出 ValueError
+        """
+        if not fields_param:
+            return self
+        requested = {name.strip() for name in fields_param.split(',') if name.strip()}
+        unknown = requested.difference(self.field_names)
+        if unknown:
+            raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+        key = frozenset(requested)
+        if key not in self._subsets:
+            self._subsets[key] = ValuesMapper(
+                self.serializer_class, tuple(column for column in self.columns if column[0] in key)
+            )
+        return self._subsets[key]
+
+    def map(self, rows):
+        """把一批 values() 行映射为输出字典列表"""
+        current_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        columns = [
+            (name, source, _bind_timezone(current_timezone) if convert is _LOCALTIME else convert)
+            for name, source, convert in self.columns
+        ]
+        result = []
+        for row in rows:
+            item = {}
+            for name, source, convert in columns:
+                value = row[source]
+                item[name] = value if convert is None or value is None else convert(value)
+            result.append(item)
+        return result
+
+
+def _bind_timezone(current_timezone):
+    if current_timezone is None:
+        return None
+    return lambda value: value.astimezone(current_timezone)
+
+
+APP_VERSION_VALUES = ValuesMapper(AppVersionSerializer)
@@ -0,0 +1,108 @@
+# signed_downloads.py
+"""
+无状态的签名下载链接。
+
+版本接口为已登录用户给每个版本签发 /dl/<app_id>/<version>/<token>/<file_name> 形式的链接，token 中带有
+安装包的存储键、文件名、大小、MD5、计数用的主键与过期时间，以 SECRET_KEY 做 HMAC 签名。
+下载时只校验签名与有效期，不读取会话、不查询数据库；持有链接即可下载，因此匿名请求不签发，
+带链接的版本接口响应也不进入共享缓存（见 conditional.validator_headers）。
+
+过期时间按 APP_SIGNED_URL_TTL 对齐到时间窗口，同一窗口内签发的链接完全相同，
+CDN 与浏览器可以按链接缓存文件；链接的剩余有效期在 TTL 到 2×TTL 之间。
+"""
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+from .models import AppVersion, blob_key, legacy_version_key
+
+SALT = 'core.signed_downloads'
+
+# 签发链接需要从 values() 中额外读取的列
+SIGNED_URL_COLUMNS = (
+    'id', 'application_id', 'version', 'file_name', 'file_size', 'md5_hash', 'sha256_hash', 'blob_id',
+    'processing_state'
+)
+
+
+def current_window(now=None):
+    """当前签发窗口的序号，窗口变化时签发的链接随之变化"""
+    return int(now if now is not None else time.time()) // settings.APP_SIGNED_URL_TTL
+
+
+def expires_at(now=None):
+    """当前窗口签发的链接的过期时间（Unix 时间戳）"""
+    return (current_window(now) + 2) * settings.APP_SIGNED_URL_TTL
+
+
+def _value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def _storage_key(app_id, row):
+    # 与 AppVersion.storage_key 相同，但不需要模型实例
+    if _value(row, 'blob_id'):
+        return blob_key(_value(row, 'sha256_hash'))
+    return legacy_version_key(app_id, _value(row, 'version'), _value(row, 'file_name'))
+
+
+def url_base(request):
+    """链接的协议与主机：APP_SIGNED_URL_BASE（例如 CDN 域名），未配置时使用当前请求的主机"""
+    return settings.APP_SIGNED_URL_BASE.rstrip('/') or request.build_absolute_uri('/')[:-1]
+
+
+def signed_download_url(base, app_id, row, expires=None):
+    """为版本（模型实例或 values() 行）签发下载链接"""
+    version, file_name = _value(row, 'version'), _value(row, 'file_name')
+    token = signing.Signer(salt=SALT).sign_object({
+        'a': app_id,
+        'v': version,
+        'k': _storage_key(app_id, row),
+        'n': file_name,
+        's': _value(row, 'file_size'),
+        'h': _value(row, 'md5_hash'),
+        'i': _value(row, 'id'),
+        'p': _value(row, 'application_id'),
+        'e': expires or expires_at(),
+    })
+    return base + reverse('signed-download', args=[app_id, version, token, file_name])
+
+
+def add_download_urls(request, app_id, rows, items):
+    """
+    给序列化结果逐项加上 download_url，rows 与 items 一一对应。
+    签名链接下载时不再查询数据库，因此只为处理完成的版本签发，其余版本的 download_url 为 None
+    """
+    base = url_base(request)
+    expires = expires_at()
+    for row, item in zip(rows, items):
+        ready = _value(row, 'processing_state') == AppVersion.READY
+        item['download_url'] = signed_download_url(base, app_id, row, expires) if ready else None
+    return items
+
+
+def verify(token, app_id, version, file_name):
+    """
+    校验签名、有效期以及链接路径与签名内容是否一致，返回签名内容；无效或过期时返回 None
+    """
+    try:
+        grant = signing.Signer(salt=SALT).unsign_object(token)
+    except signing.BadSignature:
+        return None
+    if (grant.get('a'), grant.get('v'), grant.get('n')) != (app_id, version, file_name):
+        return None
+    if grant.get('e', 0) <= time.time():
+        return None
+    return grant
+
+
+def apply_cache_headers(response, grant):
+    """链接有效期内文件内容不变，允许 CDN 缓存到过期为止；重定向到对象存储的响应不缓存"""
+    if response.status_code in (301, 302, 307):
+        response['Cache-Control'] = 'private, no-cache'
+    else:
+        remaining = max(int(grant['e'] - time.time()), 0)
+        response['Cache-Control'] = f'public, max-age={remaining}, immutable'
+    return response
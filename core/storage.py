@@ -0,0 +1,267 @@
+# storage.py
+"""
+安装包与差分包的存储后端。
+
+存储键（key）是与后端无关的相对路径，按内容哈希分两级目录: blobs/ab/cd/<sha256>，
+每级最多 256 个子目录，数百万个文件时单个目录仍然很小。
+
+- LocalStorage: APP_STORAGE 下的本地目录，下载时支持进程内 Range 与 X-Accel-Redirect / X-Sendfile
+- S3Storage: S3 兼容的对象存储（AWS S3、MinIO 等，需要安装 boto3），大文件分段并发上传，
+  下载时重定向到预签名 URL，由对象存储处理 Range
+
+上传过程中的临时文件与分块上传会话始终在本地磁盘上，完成后通过 put_file 存入后端。
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.http import content_disposition_header
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # 未安装时只能使用本地存储
+    boto3 = None
+
+
+def shard_key(prefix, digest, suffix=''):
+    """prefix/ab/cd/<digest><suffix>"""
+    return f'{prefix}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}'
+
+
+class LocalStorage:
+    def __init__(self, location):
+        self.location = os.path.abspath(location)
+
+    def path(self, key):
+        path = os.path.normpath(os.path.join(self.location, *key.split('/')))
+        # 旧布局的键包含用户提交的版本号与文件名，不允许跳出存储目录
+        if os.path.commonpath([self.location, path]) != self.location:
+            raise ValueError(f"存储键超出存储目录: {key}")
+        return path
+
+    def local_path(self, key):
+        """本地文件路径；远程后端返回 None"""
+        return self.path(key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def open_seekable(self, key):
+        """可随机访问的只读文件，读取 ZIP 中央目录等只需要文件局部内容的场景使用"""
+        return self.open(key)
+
+    def put_file(self, key, source_path):
+        """把本地文件移入存储，源文件不再保留（同一文件系统内为原子 rename）"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(source_path, path)
+        except OSError:
+            # 跨文件系统时先复制到目标目录再原子替换
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+            os.close(fd)
+            try:
+                shutil.copyfile(source_path, temp_path)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            os.remove(source_path)
+
+    def put_bytes(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def download_url(self, key, filename):
+        """对象存储的直接下载地址；本地文件由应用或前端 Web 服务器发送，返回 None"""
+        return None
+
+
+class S3Storage:
+    def __init__(self, bucket, prefix='', endpoint_url=None, region_name=None, access_key_id=None,
+                 secret_access_key=None, multipart_threshold=64 * 1024 ** 2, multipart_chunksize=16 * 1024 ** 2,
+                 max_concurrency=8, url_expires=300):
+        if boto3 is None:
+            raise ImproperlyConfigured("使用 S3 存储需要安装 boto3")
+        if not bucket:
+            raise ImproperlyConfigured("使用 S3 存储需要设置 APP_S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.url_expires = url_expires
+        # boto3 的客户端可以在线程间共享；未配置密钥时使用默认的凭据链（环境变量、实例角色等）
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url or None, region_name=region_name or None,
+            aws_access_key_id=access_key_id or None, aws_secret_access_key=secret_access_key or None,
+        )
+        # 超过阈值的文件分段并发上传，内存占用为 分段大小 × 并发数
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency, use_threads=True,
+        )
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def local_path(self, key):
+        return None
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['ContentLength']
+
+    def open(self, key):
+        """返回流式读取的响应体，read(n) 按需从网络读取"""
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def open_seekable(self, key):
+        """可随机访问的只读文件，每次缓冲区未命中的读取对应一次 Range 请求，不下载整个对象"""
+        size = self.size(key)
+        return io.BufferedReader(_S3RangeReader(self, key, size), buffer_size=64 * 1024)
+
+    def put_file(self, key, source_path):
+        """上传本地文件（大文件自动分段上传），成功后删除源文件"""
+        self.client.upload_file(source_path, self.bucket, self._object_key(key), Config=self.transfer_config)
+        os.remove(source_path)
+
+    def put_bytes(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def download_url(self, key, filename):
+        return self.client.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': self._object_key(key),
+            'ResponseContentDisposition': content_disposition_header(True, filename),
+        }, ExpiresIn=self.url_expires)
+
+
+class _S3RangeReader(io.RawIOBase):
+    def __init__(self, storage, key, size):
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("无效的读取位置")
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self.position >= self.size or not len(buffer):
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        data = self.storage.client.get_object(
+            Bucket=self.storage.bucket, Key=self.storage._object_key(self.key), Range=f'bytes={self.position}-{end}'
+        )['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def create_storage(backend=None):
+    backend = backend or settings.APP_STORAGE_BACKEND
+    if backend == 'local':
+        return LocalStorage(settings.APP_STORAGE)
+    if backend == 's3':
+        return S3Storage(
+            bucket=settings.APP_S3_BUCKET,
+            prefix=settings.APP_S3_PREFIX,
+            endpoint_url=settings.APP_S3_ENDPOINT_URL,
+            region_name=settings.APP_S3_REGION,
+            access_key_id=settings.APP_S3_ACCESS_KEY_ID,
+            secret_access_key=settings.APP_S3_SECRET_ACCESS_KEY,
+            multipart_threshold=settings.APP_S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.APP_S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.APP_S3_MAX_CONCURRENCY,
+            url_expires=settings.APP_S3_URL_EXPIRES,
+        )
+    raise ImproperlyConfigured(f"未知的存储后端: {backend}")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """进程内共享的存储后端，首次使用时按 APP_STORAGE_BACKEND 创建"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+
+def reset_storage():
+    global _storage
+    with _storage_lock:
+        _storage = None
+
+
+@receiver(setting_changed)
+def reset_storage_on_setting_change(sender, setting, **kwargs):
+    if setting in ('APP_STORAGE', 'APP_STORAGE_BACKEND') or setting.startswith('APP_S3_'):
+        reset_storage()
@@ -1,3 +1,1911 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.core.checks import run_checks
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+try:
+    from prometheus_client import REGISTRY
+except ImportError:
+    REGISTRY = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from moto import mock_aws
+except ImportError:  # 未安装 moto（依赖 boto3）时跳过对象存储测试
+    mock_aws = None
+
+from . import catalog, deltas, jobs, manifests, metrics, processing, signed_downloads, views
+from .blobstore import create_version_from_blob, store_local_file
+from .caching import get_or_compute
+from .counters import flush_download_counters
+from .downloads import parse_range_header
+from .search import search_applications
+from .serializers import AppVersionSerializer
+from .storage import LocalStorage, S3Storage, get_storage, reset_storage, shard_key
+from .throttling import consume
+from .models import (
+    Application, AppVersion, Blob, DownloadStatDaily, DownloadStatHourly, GitHubSocialAuth, Job, PackageManifest,
+    UploadSession, VersionDelta, blob_key
+)
+from .versioning import version_sort_key
+
+
+class StorageTestMixin:
+    """为测试提供独立的临时存储目录"""
+
+    def setUp(self):
+        super().setUp()
+        # 限流与下载并发计数保存在缓存中，未读完的流式响应不会释放名额
+        cache.clear()
+        self.storage_dir = tempfile.mkdtemp()
+        patcher = mock.patch('core.views.STORAGE_PATH', self.storage_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        settings_override = override_settings(APP_STORAGE=self.storage_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.storage_dir, ignore_errors=True)
+
+    def write_package(self, app_id, version, file_name, content):
+        app_dir = os.path.join(self.storage_dir, app_id)
+        os.makedirs(app_dir, exist_ok=True)
+        with open(os.path.join(app_dir, f"{version}_{file_name}"), 'wb') as f:
+            f.write(content)
+
+
+class RangeHeaderParseTests(TestCase):
+    def test_single_range(self):
+        self.assertEqual(parse_range_header('bytes=0-9', 100), [(0, 9)])
+
+    def test_open_ended_and_suffix(self):
+        self.assertEqual(parse_range_header('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=-10', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=-500', 100), [(0, 99)])
+
+    def test_overlapping_ranges_are_merged(self):
+        self.assertEqual(parse_range_header('bytes=0-9,5-19,50-59', 100), [(0, 19), (50, 59)])
+
+    def test_invalid_and_unsatisfiable(self):
+        self.assertIsNone(parse_range_header('items=0-9', 100))
+        self.assertIsNone(parse_range_header('bytes=9-0', 100))
+        self.assertIsNone(parse_range_header('bytes=abc', 100))
+        self.assertEqual(parse_range_header('bytes=100-200', 100), [])
+
+
+class DownloadTestMixin(StorageTestMixin):
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='tester', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+        self.version = AppVersion.objects.create(
+            application=self.app, version='1.0.0', file_name='demo.apk',
+            file_size=len(self.content), md5_hash='0123456789abcdef0123456789abcdef'
+        )
+        self.write_package('demo', '1.0.0', 'demo.apk', self.content)
+        self.client.force_login(self.user)
+        self.url = '/apps/demo/versions/1.0.0/download/'
+
+
+class DownloadRangeTests(DownloadTestMixin, TestCase):
+    def test_full_download_advertises_ranges(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], '"0123456789abcdef0123456789abcdef"')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_single_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+    def test_multiple_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9,1000-1009')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(f'Content-Range: bytes 0-9/{len(self.content)}'.encode(), body)
+        self.assertIn(self.content[1000:1010], body)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range(self):
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"0123456789abcdef0123456789abcdef"'
+        )
+        self.assertEqual(response.status_code, 206)
+
+        # 文件已变更（ETag 不匹配）时返回完整文件
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+
+class CatalogIndexTests(DownloadTestMixin, TestCase):
+    index_url = '/apps/index.json'
+
+    def get_index(self, **extra):
+        response = self.client.get(self.index_url, **extra)
+        body = b''.join(response.streaming_content)
+        response.close()
+        if response.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        elif response.get('Content-Encoding') == 'br':
+            body = brotli.decompress(body)
+        return response, json.loads(body)
+
+    def test_index_is_precompressed_and_revalidated(self):
+        response, document = self.get_index(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(document['count'], 1)
+        self.assertEqual(document['applications'][0]['app_id'], 'demo')
+        self.assertEqual(document['applications'][0]['latest_version']['version'], '1.0.0')
+
+        # 未变化时只读取指针文件即可返回 304，不查询数据库
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.index_url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+
+        # 不接受压缩时发送原始 JSON，同一内容的任一编码 ETag 都可以重新验证
+        plain, _ = self.get_index(HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(self.index_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    @skipIf(brotli is None, "需要安装 brotli")
+    def test_brotli_preferred_when_accepted(self):
+        response, document = self.get_index(HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(document['applications'][0]['app_id'], 'demo')
+        gzipped, _ = self.get_index(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotEqual(gzipped['ETag'], response['ETag'])
+        # 同一内容的 br 与 gzip 版本可以互相重新验证
+        response = self.client.get(self.index_url, HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=gzipped['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_incremental_update(self):
+        self.get_index()
+        other = Application.objects.create(app_id='other', name='Other', description='other', owner=self.user)
+        AppVersion.objects.create(
+            application=self.app, version='1.1.0', file_name='demo.apk', file_size=10, md5_hash='f' * 32
+        )
+        # 只重新查询受影响的应用及其最新版本
+        with self.assertNumQueries(2):
+            catalog.update_catalog_index({self.app.pk, other.pk})
+        _, document = self.get_index()
+        self.assertEqual([entry['app_id'] for entry in document['applications']], ['demo', 'other'])
+        self.assertEqual(document['applications'][0]['latest_version']['version'], '1.1.0')
+        self.assertIsNone(document['applications'][1]['latest_version'])
+
+        other_pk = other.pk
+        other.delete()
+        catalog.update_catalog_index({other_pk})
+        _, document = self.get_index()
+        self.assertEqual(document['count'], 1)
+
+    @override_settings(APP_DELTA_UPDATES=False)
+    def test_changes_queue_debounced_update(self):
+        self.get_index()
+        for version in ('2.0.0', '2.1.0'):
+            AppVersion.objects.create(
+                application=self.app, version=version, file_name='demo.apk', file_size=10, md5_hash='f' * 32
+            )
+        # 推迟期间同一应用的多次变化只排队一个任务，请求进程中不重写索引
+        job = Job.objects.get(kind='update_catalog_index')
+        self.assertEqual(job.payload, {'application_id': self.app.pk})
+        self.assertGreater(job.run_after, timezone.now())
+        _, document = self.get_index()
+        self.assertEqual(document['applications'][0]['latest_version']['version'], '1.0.0')
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        call_command('run_jobs', once=True, processes=0, stdout=StringIO())
+        _, document = self.get_index()
+        self.assertEqual(document['applications'][0]['latest_version']['version'], '2.1.0')
+
+
+@skipIf(not metrics.ENABLED, "未安装 prometheus_client")
+class MetricsTests(DownloadTestMixin, TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_download_bytes_and_request_counts(self):
+        route = 'apps/<str:app_id>/versions/<str:version>/download/'
+        requests_before = self.sample(
+            'appstore_http_requests_total', route=route, method='GET', status='200'
+        )
+        bytes_before = self.sample('appstore_download_bytes_total', app_id='demo')
+
+        response = self.client.get(self.url)
+        b''.join(response.streaming_content)
+        response.close()
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        b''.join(response.streaming_content)
+        response.close()
+
+        self.assertEqual(
+            self.sample('appstore_http_requests_total', route=route, method='GET', status='200'), requests_before + 1
+        )
+        self.assertEqual(
+            self.sample('appstore_download_bytes_total', app_id='demo'), bytes_before + len(self.content) + 100
+        )
+        self.assertGreater(self.sample('appstore_db_queries_per_request_count', route=route), 0)
+
+    async def test_async_view_queries_are_counted(self):
+        route = 'apps/<str:app_id>/versions/latest/'
+        before = self.sample('appstore_db_queries_per_request_sum', route=route)
+        response = await self.async_client.get('/apps/demo/versions/latest/')
+        self.assertEqual(response.status_code, 200)
+        # 查询在 sync_to_async 的线程中执行，仍计入本次请求
+        self.assertGreater(self.sample('appstore_db_queries_per_request_sum', route=route), before)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/apps/demo/versions/latest/')
+        # 未配置令牌时只在 DEBUG 下开放
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(DEBUG=True):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'appstore_http_request_duration_seconds_bucket', response.content)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+
+class AsyncViewTests(DownloadTestMixin, TestCase):
+    """通过 ASGI 进入的请求由 core.async_views 处理"""
+
+    async def test_async_download_streams_file(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content)
+
+        response = await self.async_client.get(self.url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content[100:200])
+
+    async def test_async_download_requires_login(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    async def test_async_version_apis(self):
+        response = await self.async_client.get('/apps/demo/versions/latest/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], '1.0.0')
+
+        response = await self.async_client.get('/apps/demo/versions/')
+        self.assertEqual([item['version'] for item in response.json()], ['1.0.0'])
+
+        response = await self.async_client.get('/apps/missing/versions/')
+        self.assertEqual(response.status_code, 404)
+
+
+class SignedDownloadTests(DownloadTestMixin, TestCase):
+    def signed_url(self):
+        return self.client.get('/apps/demo/versions/latest/').json()['download_url']
+
+    def test_signed_url_skips_session_and_database(self):
+        url = self.signed_url()
+        self.assertTrue(url.startswith('http://testserver/dl/demo/1.0.0/'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        # 同一时间窗口内签发的链接相同，可被 CDN 缓存；链接本身不需要登录
+        self.assertEqual(self.client.get('/apps/demo/versions/').json()[0]['download_url'], url)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9').status_code, 206)
+
+    def test_urls_only_issued_to_logged_in_users(self):
+        signed = self.client.get('/apps/demo/versions/')
+        self.assertIn('private', signed['Cache-Control'])
+        self.assertIn('Cookie', signed['Vary'])
+
+        self.client.logout()
+        for path in ('/apps/demo/versions/', '/apps/demo/versions/latest/'):
+            response = self.client.get(path)
+            data = response.json()
+            self.assertNotIn('download_url', data[0] if isinstance(data, list) else data)
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('Cookie', response['Vary'])
+        # 登录前后的响应不同，校验器也不同
+        response = self.client.get('/apps/demo/versions/', HTTP_IF_NONE_MATCH=signed['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_tampered_or_expired_url_is_rejected(self):
+        url = self.signed_url()
+        prefix, token, file_name = url.rsplit('/', 2)
+        self.assertEqual(self.client.get(f'{prefix}/{token}x/{file_name}').status_code, 403)
+        self.assertEqual(self.client.get(f'{prefix}/{token}/other.apk').status_code, 403)
+        self.assertEqual(self.client.get(url.replace('/1.0.0/', '/2.0.0/')).status_code, 403)
+        with mock.patch('core.signed_downloads.time') as mock_time:
+            mock_time.time.return_value = time.time() + 3 * 60 * 60
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+    async def test_async_signed_download(self):
+        anonymous = (await self.async_client.get('/apps/demo/versions/latest/')).json()
+        self.assertNotIn('download_url', anonymous)
+        anonymous = (await self.async_client.get('/apps/demo/versions/')).json()
+        self.assertNotIn('download_url', anonymous[0])
+
+        await self.async_client.aforce_login(self.user)
+        url = (await self.async_client.get('/apps/demo/versions/latest/')).json()['download_url']
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content)
+
+
+class ThrottlingTests(DownloadTestMixin, TestCase):
+    def test_token_bucket(self):
+        rate = (2, 60)
+        self.assertEqual(consume('bucket', rate, now=0), 0)
+        self.assertEqual(consume('bucket', rate, now=0), 0)
+        self.assertEqual(consume('bucket', rate, now=0), 30)
+        # 每 30 秒补充一个令牌
+        self.assertEqual(consume('bucket', rate, now=30), 0)
+        self.assertGreater(consume('bucket', rate, now=30), 0)
+
+    def test_api_rate_limit(self):
+        rest_framework = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={'user': '2/min', 'ip': None})
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            for _ in range(2):
+                self.assertEqual(self.client.get('/apps/demo/versions/latest/').status_code, 200)
+            response = self.client.get('/apps/demo/versions/latest/')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '30')
+
+            # 每个用户各自一个令牌桶
+            other = User.objects.create_user(username='other', password='pass')
+            self.client.force_login(other)
+            self.assertEqual(self.client.get('/apps/demo/versions/latest/').status_code, 200)
+
+    @override_settings(APP_DOWNLOAD_CONCURRENCY_PER_USER=2, APP_DOWNLOAD_CONCURRENCY_GLOBAL=3)
+    def test_concurrent_download_limits(self):
+        # 未读完的流式响应一直占用名额，相当于仍在下载
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
+
+        # 下载结束（响应关闭）后释放名额
+        first.close()
+        third = self.client.get(self.url)
+        self.assertEqual(third.status_code, 200)
+
+        # 全局上限对所有用户生效
+        other = User.objects.create_user(username='other', password='pass')
+        self.client.force_login(other)
+        fourth = self.client.get(self.url)
+        self.assertEqual(fourth.status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 429)
+        for response in (second, third, fourth):
+            response.close()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_process_local_cache_is_reported(self):
+        messages = run_checks(include_deployment_checks=True)
+        self.assertIn('core.W001', [message.id for message in messages])
+        with override_settings(APP_DOWNLOAD_CONCURRENCY_PER_USER=0, APP_DOWNLOAD_CONCURRENCY_GLOBAL=0):
+            messages = run_checks(include_deployment_checks=True)
+        self.assertNotIn('core.W001', [message.id for message in messages])
+
+    @override_settings(APP_DOWNLOAD_BANDWIDTH=40 * 1024)
+    def test_bandwidth_shaping(self):
+        started = time.monotonic()
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        # 10 KB 按 40 KB/s 发送约需 0.25 秒
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+
+@override_settings(APP_DOWNLOAD_CONCURRENCY_PER_USER=2, APP_DOWNLOAD_BANDWIDTH=8 * 1024)
+class ConcurrentDownloadServerTests(DownloadTestMixin, LiveServerTestCase):
+    """多个客户端同时请求运行中的服务器，并发名额在各请求线程之间共享"""
+
+    def download(self, url, barrier, statuses):
+        barrier.wait()
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                # 限速下读完 10 KB 约需 1 秒，期间一直占用名额
+                response.read()
+                statuses.append(response.status)
+        except urllib.error.HTTPError as e:
+            statuses.append(e.code)
+
+    def test_concurrent_clients_hit_the_cap(self):
+        url = signed_downloads.signed_download_url(self.live_server_url, 'demo', self.version)
+        barrier = threading.Barrier(4)
+        statuses = []
+        threads = [threading.Thread(target=self.download, args=(url, barrier, statuses)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(statuses), [200, 200, 429, 429])
+
+        # 服务器关闭响应后名额全部释放
+        deadline = time.monotonic() + 5
+        while cache.get('downloads:ip:127.0.0.1') and time.monotonic() < deadline:
+            time.sleep(0.05)
+        statuses = []
+        self.download(url, threading.Barrier(1), statuses)
+        self.assertEqual(statuses, [200])
+
+
+class DownloadOffloadTests(DownloadTestMixin, TestCase):
+    @override_settings(APP_DOWNLOAD_OFFLOAD='')
+    def test_in_process_streaming(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    @override_settings(APP_DOWNLOAD_OFFLOAD='nginx', APP_DOWNLOAD_ACCEL_PREFIX='/protected-downloads/')
+    def test_nginx_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-downloads/demo/1.0.0_demo.apk')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(response.content, b'')
+
+    @override_settings(APP_DOWNLOAD_OFFLOAD='sendfile')
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.abspath(os.path.join(self.storage_dir, 'demo', '1.0.0_demo.apk'))
+        )
+        self.assertEqual(response.content, b'')
+
+    def test_unknown_mode_fails_system_check(self):
+        self.assertNotIn('core.E001', [message.id for message in run_checks()])
+        with override_settings(APP_DOWNLOAD_OFFLOAD='accel'):
+            self.assertIn('core.E001', [message.id for message in run_checks()])
+
+
+class DownloadCounterTests(DownloadTestMixin, TestCase):
+    def test_counter_errors_do_not_fail_download(self):
+        with mock.patch('core.counters._connection', side_effect=sqlite3.OperationalError('database is locked')), \
+                self.assertLogs('core.counters', 'ERROR'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_downloads_are_buffered_then_flushed(self):
+        self.client.get(self.url)
+        self.client.get(self.url, HTTP_RANGE='bytes=0-99')
+        # 断点续传的后续区间不重复计数
+        self.client.get(self.url, HTTP_RANGE='bytes=100-')
+
+        self.version.refresh_from_db()
+        self.assertEqual(self.version.download_count, 0)
+
+        # 与下载量无关的固定查询次数：校验版本、两条累加 UPDATE、两张汇总表各一读一写，外加事务保存点
+        with self.assertNumQueries(9):
+            self.assertEqual(flush_download_counters(), 2)
+        self.version.refresh_from_db()
+        self.app.refresh_from_db()
+        self.assertEqual(self.version.download_count, 2)
+        self.assertEqual(self.app.download_count, 2)
+        self.assertEqual(DownloadStatHourly.objects.get(version=self.version).count, 2)
+        self.assertEqual(DownloadStatDaily.objects.get(version=self.version).count, 2)
+
+        self.assertEqual(flush_download_counters(), 0)
+        self.client.get(self.url)
+        call_command('flush_download_counters', stdout=StringIO())
+        self.version.refresh_from_db()
+        self.assertEqual(self.version.download_count, 3)
+        self.assertEqual(DownloadStatHourly.objects.get(version=self.version).count, 3)
+
+    def test_counts_for_deleted_versions_are_dropped(self):
+        self.client.get(self.url)
+        self.version.delete()
+        self.assertEqual(flush_download_counters(), 0)
+        self.app.refresh_from_db()
+        self.assertEqual(self.app.download_count, 0)
+
+
+class StreamingUploadTests(StorageTestMixin, TestCase):
+    content = os.urandom(300 * 1024)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='uploader', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+
+    def assert_stored(self, version):
+        app_version = AppVersion.objects.get(application=self.app, version=version)
+        self.assertEqual(app_version.file_size, len(self.content))
+        self.assertEqual(app_version.md5_hash, hashlib.md5(self.content).hexdigest())
+        self.assertEqual(app_version.sha256_hash, hashlib.sha256(self.content).hexdigest())
+        with open(app_version.storage_path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        # 临时文件已通过 rename 移走，不留残余
+        self.assertEqual(os.listdir(os.path.join(self.storage_dir, '.uploads')), [])
+
+    def test_api_upload(self):
+        response = self.client.post('/apps/demo/versions/', {
+            'version': '1.0.0',
+            'file': SimpleUploadedFile('demo.apk', self.content),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['version']['sha256_hash'], hashlib.sha256(self.content).hexdigest())
+        self.assert_stored('1.0.0')
+
+    def test_form_upload(self):
+        response = self.client.post('/apps/versions/upload/demo/', {
+            'version': '2.0.0',
+            'file': SimpleUploadedFile('demo.apk', self.content),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assert_stored('2.0.0')
+
+    def test_rejected_upload_discards_temp_file(self):
+        response = self.client.post('/apps/demo/versions/', {
+            'file': SimpleUploadedFile('demo.apk', self.content),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(os.listdir(os.path.join(self.storage_dir, '.uploads')), [])
+
+
+class ResumableUploadTests(StorageTestMixin, TestCase):
+    content = os.urandom(200 * 1024)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='uploader', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+
+    def create_session(self):
+        response = self.client.post(
+            '/apps/demo/versions/uploads/',
+            {'version': '3.0.0', 'file_name': 'demo.apk'},
+            content_type='application/json',
+            HTTP_UPLOAD_LENGTH=str(len(self.content))
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Upload-Offset'], '0')
+        return response['Location']
+
+    def patch_chunk(self, url, offset, data):
+        return self.client.patch(
+            url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunked_upload_and_finalize(self):
+        url = self.create_session()
+        half = len(self.content) // 2
+
+        response = self.patch_chunk(url, 0, self.content[:half])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], str(half))
+
+        # 偏移量不匹配时拒绝写入，并告知服务端当前进度
+        response = self.patch_chunk(url, 0, self.content[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], str(half))
+
+        response = self.client.head(url)
+        self.assertEqual(response['Upload-Offset'], str(half))
+
+        # 未传完不能完成
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 409)
+
+        response = self.patch_chunk(url, half, self.content[half:])
+        self.assertEqual(response['Upload-Offset'], str(len(self.content)))
+
+        response = self.client.post(url + 'finalize/')
+        self.assertEqual(response.status_code, 201)
+        app_version = AppVersion.objects.get(application=self.app, version='3.0.0')
+        self.assertEqual(app_version.sha256_hash, hashlib.sha256(self.content).hexdigest())
+        with open(app_version.storage_path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_chunk_beyond_declared_length(self):
+        url = self.create_session()
+        response = self.patch_chunk(url, 0, self.content + b'extra')
+        self.assertEqual(response.status_code, 413)
+
+    def test_concurrent_patch_checks_offset_under_lock(self):
+        url = self.create_session()
+        upload_session = UploadSession.objects.get()
+        lock_file = views._lock_file
+
+        def lock_after_other_patch(f):
+            # 等待锁期间，另一个相同偏移量的 PATCH 已写入并推进了进度
+            with open(upload_session.partial_path, 'r+b') as other:
+                other.write(b'x' * 10)
+            UploadSession.objects.update(upload_offset=10)
+            lock_file(f)
+
+        with mock.patch('core.views._lock_file', side_effect=lock_after_other_patch):
+            response = self.patch_chunk(url, 0, self.content[:100])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '10')
+        with open(upload_session.partial_path, 'rb') as f:
+            self.assertEqual(f.read(), b'x' * 10)
+
+    def test_concurrent_finalize_returns_conflict(self):
+        url = self.create_session()
+        self.patch_chunk(url, 0, self.content)
+        get_session = views.UploadSessionFinalizeAPI.get_session
+
+        def finalized_while_waiting(view, app_id, upload_id, lock=False):
+            if lock:
+                # 等待行锁期间，另一个完成请求已创建版本并删除了会话
+                UploadSession.objects.all().delete()
+            return get_session(view, app_id, upload_id, lock=lock)
+
+        with mock.patch.object(views.UploadSessionFinalizeAPI, 'get_session', finalized_while_waiting):
+            self.assertEqual(self.client.post(url + 'finalize/').status_code, 409)
+
+        # SQLite 没有行锁时，另一个请求先移走了分块文件
+        url = self.create_session()
+        self.patch_chunk(url, 0, self.content)
+        os.remove(UploadSession.objects.get().partial_path)
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 409)
+        self.assertEqual(self.patch_chunk(url, len(self.content), b'x').status_code, 409)
+
+    def test_cleanup_expired_sessions(self):
+        self.create_session()
+        upload_session = UploadSession.objects.get()
+        self.assertTrue(os.path.exists(upload_session.partial_path))
+        UploadSession.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        call_command('cleanup_upload_sessions', stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(upload_session.partial_path))
+
+
+@override_settings(APP_CATALOG_INDEX=False)
+class BlobStoreTests(StorageTestMixin, TestCase):
+    content = os.urandom(64 * 1024)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='uploader', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+        self.other_app = Application.objects.create(app_id='other', name='Other', description='other', owner=self.user)
+
+    def upload(self, app_id, version):
+        return self.client.post(f'/apps/{app_id}/versions/', {
+            'version': version,
+            'file': SimpleUploadedFile('demo.apk', self.content),
+        })
+
+    def precheck(self, app_id, version):
+        return self.client.post(f'/apps/{app_id}/versions/precheck/', {
+            'version': version,
+            'file_name': 'demo.apk',
+            'sha256_hash': hashlib.sha256(self.content).hexdigest(),
+            'file_size': len(self.content),
+        }, content_type='application/json')
+
+    def test_identical_uploads_share_one_blob(self):
+        self.assertEqual(self.upload('demo', '1.0.0').status_code, 201)
+        self.assertEqual(self.upload('other', '1.0.0').status_code, 201)
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.path, AppVersion.objects.get(application=self.app).storage_path)
+        blob_files = [name for _, _, files in os.walk(os.path.join(self.storage_dir, 'blobs')) for name in files]
+        self.assertEqual(blob_files, [hashlib.sha256(self.content).hexdigest()])
+
+    def test_instant_upload(self):
+        response = self.precheck('demo', '1.0.0')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['instant'])
+
+        self.upload('demo', '1.0.0')
+        response = self.precheck('demo', '1.0.1')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()['instant'])
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    def test_blob_removed_with_last_reference(self):
+        self.upload('demo', '1.0.0')
+        self.precheck('demo', '1.0.1')
+        blob = Blob.objects.get()
+
+        AppVersion.objects.get(version='1.0.0').delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AppVersion.objects.get(version='1.0.1').delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(blob.path))
+
+    def test_concurrent_duplicate_version_returns_conflict(self):
+        store = views.store_uploaded_file
+        other = b'other content'
+
+        def other_request_finishes_first(uploaded_file):
+            # exists() 检查之后、创建版本之前，另一请求以不同内容上传了同一版本号
+            path = os.path.join(self.storage_dir, 'other.apk')
+            with open(path, 'wb') as f:
+                f.write(other)
+            blob = store_local_file(
+                path, hashlib.md5(other).hexdigest(), hashlib.sha256(other).hexdigest(), len(other)
+            )
+            create_version_from_blob(self.app, '1.0.0', 'demo.apk', blob)
+            return store(uploaded_file)
+
+        with mock.patch('core.views.store_uploaded_file', side_effect=other_request_finishes_first), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.upload('demo', '1.0.0')
+        self.assertEqual(response.status_code, 409)
+        # 本次存入而没有被引用的内容随之删除
+        self.assertEqual(Blob.objects.get().sha256_hash, hashlib.sha256(other).hexdigest())
+        discarded = blob_key(hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(get_storage().exists(discarded))
+
+    def test_release_racing_with_reuse(self):
+        self.upload('demo', '1.0.0')
+        # 上传请求取得已存在的内容后，最后一个引用它的版本被删除
+        stale = Blob.objects.get()
+        with self.captureOnCommitCallbacks() as callbacks:
+            AppVersion.objects.get(version='1.0.0').delete()
+        self.assertFalse(Blob.objects.exists())
+
+        app_version = create_version_from_blob(self.app, '1.0.1', 'demo.apk', stale)
+        blob = Blob.objects.get()
+        self.assertEqual((app_version.blob_id, blob.ref_count), (blob.pk, 1))
+        # 重新登记后，删除事务提交时不再删除文件
+        for callback in callbacks:
+            callback()
+        self.assertTrue(os.path.exists(blob.path))
+
+    def test_release_never_goes_negative(self):
+        self.upload('demo', '1.0.0')
+        self.upload('other', '1.0.0')
+        Blob.objects.update(ref_count=0)
+        blob = Blob.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            AppVersion.objects.get(application=self.app).delete()
+        # 计数不会减到负数，仍被引用的内容保留
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+        self.assertTrue(os.path.exists(blob.path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AppVersion.objects.get(application=self.other_app).delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(blob.path))
+
+
+@override_settings(APP_CATALOG_INDEX=False)
+class StorageMigrationTests(StorageTestMixin, TestCase):
+    content = os.urandom(32 * 1024)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.client.force_login(self.user)
+
+    def legacy_version(self, app_id, version, content, md5_hash=None):
+        application, _ = Application.objects.get_or_create(
+            app_id=app_id, defaults={'name': app_id, 'description': app_id, 'owner': self.user}
+        )
+        self.write_package(app_id, version, 'demo.apk', content)
+        return AppVersion.objects.create(
+            application=application, version=version, file_name='demo.apk', file_size=len(content),
+            md5_hash=md5_hash or hashlib.md5(content).hexdigest()
+        )
+
+    def test_local_storage_keys(self):
+        storage = LocalStorage(self.storage_dir)
+        self.assertEqual(shard_key('blobs', 'abcdef'), 'blobs/ab/cd/abcdef')
+        self.assertEqual(storage.path('blobs/ab/cd/abcdef'), os.path.join(self.storage_dir, 'blobs', 'ab', 'cd', 'abcdef'))
+        with self.assertRaises(ValueError):
+            storage.path('../outside')
+
+    def test_legacy_files_moved_to_sharded_layout(self):
+        first = self.legacy_version('demo', '1.0.0', self.content)
+        second = self.legacy_version('other', '1.0.0', self.content)
+        corrupt = self.legacy_version('demo', '0.9.0', b'corrupt', md5_hash='0' * 32)
+        newer = self.legacy_version('demo', '1.1.0', self.content[::-1])
+        delta = VersionDelta.objects.create(from_version=first, to_version=newer, file_size=5, sha256_hash='d' * 64)
+        legacy_delta_path = os.path.join(self.storage_dir, *delta.legacy_storage_key.split('/'))
+        with open(legacy_delta_path, 'wb') as f:
+            f.write(b'delta')
+
+        out = StringIO()
+        call_command('migrate_storage', workers=1, stdout=out, stderr=StringIO())
+
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        blob = Blob.objects.get(sha256_hash=sha256)
+        self.assertEqual(blob.ref_count, 2)
+        for app_version in (first, second):
+            app_version.refresh_from_db()
+            self.assertEqual((app_version.blob_id, app_version.sha256_hash), (blob.pk, sha256))
+        self.assertEqual(blob.path, os.path.join(self.storage_dir, 'blobs', sha256[:2], sha256[2:4], sha256))
+        self.assertFalse(os.path.exists(os.path.join(self.storage_dir, 'demo', '1.0.0_demo.apk')))
+
+        # 校验失败的文件保持原样
+        corrupt.refresh_from_db()
+        self.assertIsNone(corrupt.blob_id)
+        self.assertTrue(os.path.exists(corrupt.storage_path))
+
+        delta.refresh_from_db()
+        self.assertTrue(delta.storage_key.startswith('deltas/'))
+        self.assertFalse(os.path.exists(legacy_delta_path))
+        with open(delta.storage_path, 'rb') as f:
+            self.assertEqual(f.read(), b'delta')
+
+        response = self.client.get('/apps/demo/versions/1.0.0/download/')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        # 重复执行不会重复计数
+        call_command('migrate_storage', workers=1, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Blob.objects.get(pk=blob.pk).ref_count, 2)
+
+
+@skipIf(mock_aws is None, "未安装 moto")
+@override_settings(
+    APP_STORAGE_BACKEND='s3', APP_S3_BUCKET='apps', APP_S3_PREFIX='store', APP_S3_REGION='us-east-1',
+    APP_S3_ACCESS_KEY_ID='testing', APP_S3_SECRET_ACCESS_KEY='testing', APP_CATALOG_INDEX=False,
+    # S3 要求除最后一段外每段至少 5MB
+    APP_S3_MULTIPART_THRESHOLD=5 * 1024 * 1024, APP_S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024,
+)
+class S3StorageTests(StorageTestMixin, TestCase):
+    """以 moto 模拟的 S3 测试对象存储后端"""
+    content = os.urandom(32 * 1024)
+
+    def setUp(self):
+        super().setUp()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        reset_storage()
+        self.addCleanup(reset_storage)
+        self.storage = get_storage()
+        self.assertIsInstance(self.storage, S3Storage)
+        self.s3 = self.storage.client
+        self.s3.create_bucket(Bucket='apps')
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.client.force_login(self.user)
+
+    def local_file(self, content):
+        fd, path = tempfile.mkstemp(dir=self.storage_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_put_file_and_multipart_upload(self):
+        path = self.local_file(self.content)
+        self.storage.put_file('blobs/ab/cd/small', path)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(self.storage.exists('blobs/ab/cd/small'))
+        self.assertFalse(self.storage.exists('blobs/ab/cd/missing'))
+        self.assertEqual(self.storage.size('blobs/ab/cd/small'), len(self.content))
+        with self.storage.open('blobs/ab/cd/small') as f:
+            self.assertEqual(f.read(), self.content)
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open('blobs/ab/cd/missing')
+
+        # 超过阈值的文件分段上传，分段上传的对象 ETag 以 "-段数" 结尾
+        large = os.urandom(11 * 1024 * 1024)
+        self.storage.put_file('blobs/ab/cd/large', self.local_file(large))
+        head = self.s3.head_object(Bucket='apps', Key='store/blobs/ab/cd/large')
+        self.assertTrue(head['ETag'].strip('"').endswith('-3'))
+        self.assertEqual(self.s3.get_object(Bucket='apps', Key='store/blobs/ab/cd/large')['Body'].read(), large)
+
+        self.storage.delete('blobs/ab/cd/large')
+        self.assertFalse(self.storage.exists('blobs/ab/cd/large'))
+
+    def test_open_seekable_uses_range_requests(self):
+        content = os.urandom(512 * 1024)
+        self.storage.put_bytes('blobs/ab/cd/seek', content)
+        ranges = []
+        get_object = self.s3.get_object
+
+        def recording_get_object(**kwargs):
+            ranges.append(kwargs.get('Range'))
+            return get_object(**kwargs)
+
+        with mock.patch.object(self.s3, 'get_object', side_effect=recording_get_object):
+            with self.storage.open_seekable('blobs/ab/cd/seek') as f:
+                f.seek(-100, io.SEEK_END)
+                self.assertEqual(f.read(), content[-100:])
+                f.seek(1000)
+                self.assertEqual(f.read(10), content[1000:1010])
+                self.assertEqual(f.read(10), content[1010:1020])
+        # 每次缓冲区未命中只读取一段，不下载整个对象
+        self.assertEqual(ranges, [f'bytes={len(content) - 100}-{len(content) - 1}', f'bytes=1000-{1000 + 64 * 1024 - 1}'])
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('assets/data.bin', os.urandom(256 * 1024))
+        self.storage.put_bytes('blobs/ab/cd/zip', archive.getvalue())
+        with self.storage.open_seekable('blobs/ab/cd/zip') as f:
+            self.assertEqual(manifests.read_package(f)['file_count'], 1)
+
+    def test_download_redirects_to_presigned_url(self):
+        application = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        blob = Blob.objects.create(
+            md5_hash=hashlib.md5(self.content).hexdigest(), sha256_hash=sha256, size=len(self.content), ref_count=1
+        )
+        AppVersion.objects.create(
+            application=application, version='1.0.0', file_name='demo.apk', file_size=len(self.content),
+            md5_hash=blob.md5_hash, sha256_hash=sha256, blob=blob
+        )
+        self.storage.put_bytes(blob.storage_key, self.content)
+
+        url = self.storage.download_url(blob.storage_key, 'demo.apk')
+        self.assertTrue(url.startswith(f'https://apps.s3.amazonaws.com/store/{blob.storage_key}?'))
+        self.assertIn('response-content-disposition=attachment', url)
+        self.assertIn('Expires=', url)
+
+        response = self.client.get('/apps/demo/versions/1.0.0/download/')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(f'https://apps.s3.amazonaws.com/store/{blob.storage_key}?'))
+
+    def test_migrate_storage_uploads_local_files(self):
+        application = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+        self.write_package('demo', '1.0.0', 'demo.apk', self.content)
+        app_version = AppVersion.objects.create(
+            application=application, version='1.0.0', file_name='demo.apk', file_size=len(self.content),
+            md5_hash=hashlib.md5(self.content).hexdigest()
+        )
+
+        out = StringIO()
+        call_command('migrate_storage', workers=1, stdout=out, stderr=StringIO())
+
+        app_version.refresh_from_db()
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(app_version.sha256_hash, sha256)
+        self.assertEqual(app_version.storage_key, blob_key(sha256))
+        self.assertEqual(self.storage.open(app_version.storage_key).read(), self.content)
+        self.assertFalse(os.path.exists(os.path.join(self.storage_dir, 'demo', '1.0.0_demo.apk')))
+
+        # 本地已有的内容文件一并上传，重复执行时跳过
+        local_blob = os.path.join(self.storage_dir, *blob_key('f' * 64).split('/'))
+        os.makedirs(os.path.dirname(local_blob))
+        with open(local_blob, 'wb') as f:
+            f.write(b'blob')
+        Blob.objects.create(md5_hash='e' * 32, sha256_hash='f' * 64, size=4, ref_count=0)
+        call_command('migrate_storage', workers=1, stdout=out, stderr=StringIO())
+        self.assertEqual(self.storage.open(blob_key('f' * 64)).read(), b'blob')
+        self.assertEqual(Blob.objects.get(sha256_hash=sha256).ref_count, 1)
+
+
+@skipIf(deltas.bsdiff4 is None, "未安装 bsdiff4")
+class VersionDeltaTests(StorageTestMixin, TestCase):
+    old_content = os.urandom(256 * 1024)
+    new_content = old_content[:100 * 1024] + b'patched' + old_content[100 * 1024:]
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='uploader', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+        self.client.force_login(self.user)
+
+    def upload(self, version, content):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post('/apps/demo/versions/', {
+                'version': version,
+                'file': SimpleUploadedFile('demo.apk', content),
+            })
+        return AppVersion.objects.get(application=self.app, version=version)
+
+    def test_delta_generated_and_served(self):
+        self.upload('1.0.0', self.old_content)
+        target = self.upload('1.1.0', self.new_content)
+        delta = deltas.generate_delta(target.pk)
+        self.assertIsNotNone(delta)
+        self.assertLess(delta.file_size, len(self.new_content) // 10)
+
+        response = self.client.get('/apps/demo/versions/1.0.0/delta/1.1.0/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Delta-Algorithm'], 'bsdiff4')
+        self.assertEqual(response['X-Target-SHA256'], hashlib.sha256(self.new_content).hexdigest())
+        patch = b''.join(response.streaming_content)
+        self.assertEqual(deltas.bsdiff4.patch(self.old_content, patch), self.new_content)
+
+    def test_memory_error_skips_delta(self):
+        self.upload('1.0.0', self.old_content)
+        target = self.upload('1.1.0', self.new_content)
+        with mock.patch.object(deltas.bsdiff4, 'diff', side_effect=MemoryError), self.assertLogs('core.deltas'):
+            self.assertIsNone(deltas.generate_delta(target.pk))
+        self.assertFalse(VersionDelta.objects.exists())
+
+    def test_failed_delta_job_is_not_retried(self):
+        self.upload('1.0.0', self.old_content)
+        target = self.upload('1.1.0', self.new_content)
+        Job.objects.all().delete()
+        jobs.enqueue('generate_delta', version_id=target.pk)
+        with mock.patch.object(deltas, 'generate_delta', side_effect=RuntimeError('killed')), \
+                self.assertLogs('core', 'WARNING') as logs:
+            call_command('run_jobs', once=True, processes=0, stdout=StringIO())
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1))
+        self.assertTrue(any('已跳过' in line for line in logs.output))
+
+    def test_falls_back_to_full_file(self):
+        self.upload('1.0.0', self.old_content)
+        self.upload('1.1.0', self.new_content)
+        self.assertFalse(VersionDelta.objects.exists())
+
+        response = self.client.get('/apps/demo/versions/1.0.0/delta/1.1.0/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Delta-Algorithm'], 'none')
+        self.assertEqual(b''.join(response.streaming_content), self.new_content)
+
+
+@override_settings(APP_CATALOG_INDEX=False, APP_JOB_RETRY_DELAY=0)
+class BackgroundJobTests(StorageTestMixin, TestCase):
+    old_content = os.urandom(128 * 1024)
+    new_content = old_content[:64 * 1024] + b'patched' + old_content[64 * 1024:]
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='uploader', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+        self.client.force_login(self.user)
+
+    def upload(self, version, content):
+        response = self.client.post('/apps/demo/versions/', {
+            'version': version,
+            'file': SimpleUploadedFile('demo.apk', content),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['version']
+
+    def run_jobs(self):
+        call_command('run_jobs', once=True, processes=0, stdout=StringIO())
+
+    def test_upload_returns_before_processing(self):
+        self.assertEqual(self.upload('1.0.0', self.old_content)['processing_state'], AppVersion.PENDING)
+        self.upload('1.1.0', self.new_content)
+        self.assertEqual(Job.objects.filter(kind='process_version', status=Job.QUEUED).count(), 2)
+        self.assertFalse(VersionDelta.objects.exists())
+
+        self.run_jobs()
+        self.assertEqual(
+            set(AppVersion.objects.values_list('processing_state', flat=True)), {AppVersion.READY}
+        )
+        # 处理完成后排队的差分包任务在同一轮中执行
+        self.assertTrue(VersionDelta.objects.filter(to_version__version='1.1.0').exists())
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+        response = self.client.get('/apps/demo/versions/')
+        self.assertEqual(
+            {item['processing_state'] for item in response.json()}, {AppVersion.READY}
+        )
+
+    def test_state_change_updates_etag(self):
+        self.upload('1.0.0', self.old_content)
+        etag = self.client.get('/apps/demo/versions/')['ETag']
+        self.run_jobs()
+        response = self.client.get('/apps/demo/versions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_corrupted_file_fails_without_retry(self):
+        self.upload('1.0.0', self.old_content)
+        app_version = AppVersion.objects.get()
+        with open(app_version.storage_path, 'wb') as f:
+            f.write(self.old_content[:-1])
+
+        self.run_jobs()
+        app_version.refresh_from_db()
+        self.assertEqual(app_version.processing_state, AppVersion.FAILED)
+        self.assertIn('大小', app_version.processing_error)
+        self.assertEqual(Job.objects.get().attempts, 1)
+
+    def test_only_ready_versions_are_advertised(self):
+        self.upload('1.0.0', self.old_content)
+        self.run_jobs()
+        self.upload('1.1.0', self.new_content)
+        # 仍在处理的版本既不是最新版本，也不是更新目标
+        self.assertEqual(self.client.get('/apps/demo/versions/latest/').json()['version'], '1.0.0')
+        response = self.client.post(
+            '/apps/updates/check/', {'apps': [{'app_id': 'demo', 'installed_version': '1.0.0'}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.json()['updates'], [])
+        listed = {item['version']: item for item in self.client.get('/apps/demo/versions/').json()}
+        self.assertIsNone(listed['1.1.0']['download_url'])
+
+        AppVersion.objects.filter(version='1.1.0').update(processing_state=AppVersion.FAILED)
+        self.assertEqual(self.client.get('/apps/demo/versions/1.1.0/download/').status_code, 404)
+        self.assertEqual(self.client.get('/apps/demo/versions/1.0.0/download/').status_code, 200)
+
+        AppVersion.objects.filter(version='1.0.0').update(processing_state=AppVersion.FAILED)
+        self.assertEqual(self.client.get('/apps/demo/versions/latest/').status_code, 404)
+
+    def test_verification_does_not_reread_file(self):
+        self.upload('1.0.0', self.old_content)
+        with mock.patch.object(LocalStorage, 'open', side_effect=AssertionError("不应重新读取安装包")):
+            processing.verify_stored_file(AppVersion.objects.get())
+
+    def test_backlog_without_worker_is_logged(self):
+        self.upload('1.0.0', self.old_content)
+        self.assertFalse(jobs.warn_if_backlogged())
+        Job.objects.update(run_after=timezone.now() - timedelta(seconds=jobs.BACKLOG_WARNING_AGE + 1))
+        with self.assertLogs('core.jobs', 'WARNING') as logs:
+            self.upload('1.1.0', self.new_content)
+        self.assertIn('run_jobs', logs.output[0])
+
+    @override_settings(APP_JOB_MAX_ATTEMPTS=2)
+    def test_errors_are_retried_then_marked_failed(self):
+        self.upload('1.0.0', self.old_content)
+        step = mock.Mock(side_effect=RuntimeError('boom'))
+        with mock.patch.object(processing, 'PROCESSING_STEPS', [step]), self.assertLogs('core.jobs', 'ERROR'):
+            self.run_jobs()
+
+        self.assertEqual(step.call_count, 2)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIn('boom', job.last_error)
+        self.assertEqual(AppVersion.objects.get().processing_state, AppVersion.FAILED)
+
+    def test_claim_is_exclusive_and_stale_jobs_are_requeued(self):
+        self.upload('1.0.0', self.old_content)
+        self.assertEqual(len(jobs.claim(5, owner='a')), 1)
+        self.assertEqual(jobs.claim(5, owner='b'), [])
+
+        later = timezone.now() + timedelta(seconds=settings.APP_JOB_TIMEOUT + 1)
+        self.assertEqual(jobs.requeue_stale(now=later), 1)
+        self.assertEqual([job.locked_by for job in jobs.claim(5, owner='b', now=later)], ['b'])
+
+
+def build_axml(elements, utf8=False):
+    """
+    编写最小的二进制 AndroidManifest.xml。elements 为 [(元素名, [(属性名, 资源 ID, 值)])]，
+    值为 str 时按字符串属性、int 时按十进制整数属性写入
+    """
+    resource_names = [(name, rid) for _, attributes in elements for name, rid, _ in attributes if rid]
+    strings = list(dict.fromkeys(name for name, _ in resource_names))
+    resource_ids = [dict(resource_names)[name] for name in strings]
+    for element, attributes in elements:
+        for name, _, value in attributes:
+            strings.extend(item for item in (name, value) if isinstance(item, str) and item not in strings)
+        if element not in strings:
+            strings.append(element)
+
+    data, offsets = b'', []
+    for string in strings:
+        offsets.append(len(data))
+        if utf8:
+            encoded = string.encode('utf-8')
+            data += bytes([len(string), len(encoded)]) + encoded + b'\0'
+        else:
+            data += struct.pack('<H', len(string)) + string.encode('utf-16-le') + b'\0\0'
+    data += b'\0' * (-len(data) % 4)
+    header_size = 28
+    strings_start = header_size + 4 * len(strings)
+    pool = struct.pack(
+        '<HHIIIIII', 0x0001, header_size, strings_start + len(data), len(strings), 0,
+        0x100 if utf8 else 0, strings_start, 0
+    ) + struct.pack(f'<{len(strings)}I', *offsets) + data
+    resource_map = struct.pack('<HHI', 0x0180, 8, 8 + 4 * len(resource_ids)) + struct.pack(
+        f'<{len(resource_ids)}I', *resource_ids
+    )
+
+    body = pool + resource_map
+    for element, attributes in elements:
+        chunk = struct.pack('<IIIIHHHHHH', 1, 0xFFFFFFFF, 0xFFFFFFFF, strings.index(element), 20, 20,
+                            len(attributes), 0, 0, 0)
+        for name, _, value in attributes:
+            if isinstance(value, str):
+                chunk += struct.pack('<IIIHBBI', 0xFFFFFFFF, strings.index(name), strings.index(value), 8, 0,
+                                     0x03, strings.index(value))
+            else:
+                chunk += struct.pack('<IIIHBBI', 0xFFFFFFFF, strings.index(name), 0xFFFFFFFF, 8, 0, 0x10, value)
+        body += struct.pack('<HHI', 0x0102, 16, 8 + len(chunk)) + chunk
+    return struct.pack('<HHI', 0x0003, 8, 8 + len(body)) + body
+
+
+def build_apk(payload=b''):
+    axml = build_axml([
+        ('manifest', [
+            ('package', None, 'com.example.demo'),
+            ('versionCode', 0x0101021b, 42),
+            ('versionName', 0x0101021c, '1.2.3'),
+        ]),
+        ('uses-sdk', [('minSdkVersion', 0x0101020c, 21), ('targetSdkVersion', 0x01010270, 34)]),
+        ('application', []),
+    ])
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('AndroidManifest.xml', axml)
+        archive.writestr('res/', b'')
+        archive.writestr('classes.dex', b'dex\n035\0' * 100)
+        archive.writestr(zipfile.ZipInfo('assets/payload.bin'), payload, compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+class ReadCountingFile(io.FileIO):
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        ReadCountingFile.bytes_read += len(data)
+        return data
+
+
+@override_settings(APP_CATALOG_INDEX=False, APP_DELTA_UPDATES=False)
+class PackageManifestTests(StorageTestMixin, TestCase):
+    payload = os.urandom(512 * 1024)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='uploader', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+
+    def upload(self, version, content, file_name='demo.apk'):
+        self.client.force_login(self.user)
+        response = self.client.post('/apps/demo/versions/', {
+            'version': version,
+            'file': SimpleUploadedFile(file_name, content),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.client.logout()
+
+    def test_parse_android_manifest(self):
+        for utf8 in (False, True):
+            with self.subTest(utf8=utf8):
+                axml = build_axml([
+                    ('manifest', [('package', None, 'com.example.demo'), ('versionCode', 0x0101021b, 7)]),
+                    ('uses-sdk', [('minSdkVersion', 0x0101020c, 24)]),
+                ], utf8=utf8)
+                self.assertEqual(
+                    manifests.parse_android_manifest(axml),
+                    {'package': 'com.example.demo', 'version_code': 7, 'min_sdk': 24}
+                )
+        with self.assertRaises(manifests.ManifestError):
+            manifests.parse_android_manifest(b'<manifest/>')
+
+    def test_manifest_reads_central_directory_only_and_is_cached(self):
+        content = build_apk(self.payload)
+        self.upload('1.0.0', content)
+        ReadCountingFile.bytes_read = 0
+        with mock.patch.object(
+            LocalStorage, 'open_seekable', lambda storage, key: ReadCountingFile(storage.path(key))
+        ):
+            response = self.client.get('/apps/demo/versions/1.0.0/manifest/')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(ReadCountingFile.bytes_read, len(self.payload) // 10)
+
+        data = response.json()
+        self.assertEqual(data['apk'], {
+            'package': 'com.example.demo', 'version_code': 42, 'version_name': '1.2.3',
+            'min_sdk': 21, 'target_sdk': 34,
+        })
+        self.assertEqual(data['file_count'], 3)
+        self.assertEqual(
+            [entry['name'] for entry in data['entries']], ['AndroidManifest.xml', 'classes.dex', 'assets/payload.bin']
+        )
+        self.assertFalse(data['truncated'])
+        self.assertEqual(PackageManifest.objects.count(), 1)
+
+        # 再次查看时随版本一并 JOIN 取出，不再读取安装包
+        with mock.patch.object(LocalStorage, 'open_seekable') as open_seekable, self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/apps/demo/versions/1.0.0/manifest/').json(), data)
+        open_seekable.assert_not_called()
+        response = self.client.get('/apps/demo/versions/1.0.0/manifest/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_app_detail_links_manifest_by_url_name(self):
+        self.upload('1.0~12', build_apk())
+        response = self.client.get(f'/app/{self.app.pk}/')
+        self.assertContains(response, f'href="{reverse("version-manifest", args=["demo", "1.0~12"])}"')
+
+    def test_processing_step_and_version_summaries(self):
+        self.upload('1.0.0', b'not a zip file')
+        self.upload('1.1.0', build_apk())
+        etag = self.client.get('/apps/demo/versions/')['ETag']
+        call_command('run_jobs', once=True, processes=0, stdout=StringIO())
+
+        self.assertEqual(
+            set(AppVersion.objects.values_list('processing_state', flat=True)), {AppVersion.READY}
+        )
+        response = self.client.get('/apps/demo/versions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        summaries = {item['version']: item['manifest'] for item in response.json()}
+        self.assertEqual(summaries['1.0.0']['error'], '不是有效的 ZIP 文件')
+        self.assertEqual(summaries['1.1.0']['apk']['version_code'], 42)
+        self.assertEqual(summaries['1.1.0']['file_count'], 3)
+
+        latest = self.client.get('/apps/demo/versions/latest/').json()
+        self.assertEqual(latest['manifest'], summaries['1.1.0'])
+        self.assertNotIn('manifest', self.client.get('/apps/demo/versions/', {'fields': 'version'}).json()[0])
+
+        response = self.client.get(f'/app/{self.app.pk}/')
+        self.assertContains(response, 'com.example.demo')
+        self.assertContains(response, 'AndroidManifest.xml')
+
+
+class VersionOrderingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+
+    def add_version(self, version):
+        return AppVersion.objects.create(
+            application=self.app, version=version, file_name='demo.apk', file_size=1, md5_hash='0' * 32
+        )
+
+    def test_sort_key_matches_packaging_order(self):
+        ordered = [
+            '1.0.dev1', '1.0a1', '1.0a2.dev1', '1.0b1', '1.0rc1', '1.0', '1.0+abc', '1.0+abc.5', '1.0+5',
+            '1.0.post1.dev1', '1.0.post1', '1.0.1', '1.2', '1.10', '2.0', '1!0.1',
+        ]
+        keys = [version_sort_key(v) for v in ordered]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual(version_sort_key('1.0'), version_sort_key('1.0.0'))
+
+    def test_versions_api_orders_and_paginates_in_sql(self):
+        for version in ['1.2.0', '1.10.0', '1.9.0', '2.0.0rc1']:
+            self.add_version(version)
+
+        response = self.client.get('/apps/demo/versions/')
+        self.assertEqual([v['version'] for v in response.json()], ['2.0.0rc1', '1.10.0', '1.9.0', '1.2.0'])
+
+        response = self.client.get('/apps/demo/versions/?page_size=2')
+        self.assertEqual([v['version'] for v in response.json()], ['2.0.0rc1', '1.10.0'])
+        next_link = re.search(r'<([^>]+)>; rel="next"', response['Link']).group(1)
+        response = self.client.get(next_link)
+        self.assertEqual([v['version'] for v in response.json()], ['1.9.0', '1.2.0'])
+        self.assertIn('rel="prev"', response['Link'])
+        self.assertNotIn('rel="next"', response['Link'])
+
+    def test_latest_is_highest_version_not_last_upload(self):
+        self.add_version('2.0.0')
+        self.add_version('1.9.1')  # 旧版本线的热修复最后上传
+
+        response = self.client.get('/apps/demo/versions/latest/')
+        self.assertEqual(response.json()['version'], '2.0.0')
+
+
+class BatchUpdateCheckTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        for index in range(5):
+            app = Application.objects.create(
+                app_id=f'app{index}', name=f'App {index}', description='demo', owner=self.user
+            )
+            for version in ['1.0.0', '1.1.0', '2.0.0']:
+                AppVersion.objects.create(
+                    application=app, version=version, file_name='demo.apk', file_size=10, md5_hash='0' * 32
+                )
+
+    def check(self, apps):
+        return self.client.post('/apps/updates/check/', {'apps': apps}, content_type='application/json')
+
+    def test_returns_only_apps_with_newer_versions(self):
+        response = self.check([
+            {'app_id': 'app0', 'installed_version': '1.0.0'},
+            {'app_id': 'app1', 'installed_version': '2.0.0'},
+            {'app_id': 'app2', 'installed_version': '2.0'},
+            {'app_id': 'app3', 'installed_version': ''},
+            {'app_id': 'missing', 'installed_version': '1.0.0'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        updates = {u['app_id']: u for u in response.json()['updates']}
+        self.assertEqual(set(updates), {'app0', 'app3'})
+        self.assertEqual(updates['app0']['version'], '2.0.0')
+        self.assertTrue(updates['app0']['download_url'].endswith('/apps/app0/versions/2.0.0/download/'))
+        self.assertNotIn('download_url_expires', updates['app0'])
+
+    def test_authenticated_callers_get_signed_urls(self):
+        self.client.force_login(self.user)
+        update = self.check([{'app_id': 'app0', 'installed_version': '1.0.0'}]).json()['updates'][0]
+        # 签名链接无需会话即可下载
+        _, _, app_id, version, token, file_name = update['download_url'].split('://')[1].split('/')
+        grant = signed_downloads.verify(token, app_id, version, file_name)
+        self.assertEqual((app_id, version, file_name), ('app0', '2.0.0', 'demo.apk'))
+        self.assertEqual(grant['e'], update['download_url_expires'])
+        self.assertGreater(update['download_url_expires'], time.time())
+
+    def test_constant_number_of_queries(self):
+        for count in (1, 5):
+            apps = [{'app_id': f'app{i}', 'installed_version': '1.0.0'} for i in range(count)]
+            with self.assertNumQueries(1):
+                response = self.check(apps)
+            self.assertEqual(len(response.json()['updates']), count)
+
+
+class ApplicationSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.by_name = Application.objects.create(
+            app_id='notes', name='Cloud Notes', description='write things down', owner=self.user
+        )
+        self.by_description = Application.objects.create(
+            app_id='sync', name='Syncer', description='keeps your cloud folders in sync', owner=self.user
+        )
+        Application.objects.create(app_id='game', name='Puzzle', description='a game', owner=self.user)
+
+    def search(self, query):
+        return list(search_applications(Application.objects.all(), query).values_list('app_id', flat=True))
+
+    def test_ranked_and_prefix_matching(self):
+        self.assertEqual(self.search('cloud'), ['notes', 'sync'])
+        self.assertEqual(self.search('clo'), ['notes', 'sync'])
+        self.assertEqual(self.search('cloud fold'), ['sync'])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_cjk_substring_matching(self):
+        chat = Application.objects.create(
+            app_id='chat', name='微聊', description='一款好用的聊天工具', owner=self.user
+        )
+        Application.objects.create(app_id='wechat', name='微信', description='消息', owner=self.user)
+        self.assertEqual(self.search('聊天'), ['chat'])
+        self.assertEqual(self.search('好用的聊天'), ['chat'])
+        self.assertEqual(self.search('微'), ['wechat', 'chat'])
+        self.assertEqual(self.search('聊天 cloud'), [])
+        chat.description = '一款好用的聊天工具，支持 cloud 同步'
+        chat.save()
+        self.assertEqual(self.search('聊天 cloud'), ['chat'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.by_name.name = 'Paper Notes'
+        self.by_name.save()
+        self.assertEqual(self.search('paper'), ['notes'])
+        self.assertEqual(self.search('cloud'), ['sync'])
+
+        self.by_description.delete()
+        self.assertEqual(self.search('cloud'), [])
+
+    def test_market_uses_search(self):
+        cache.clear()
+        response = self.client.get('/', {'q': 'puz'})
+        self.assertEqual([app['app_id'] for app in response.context['applications']], ['game'])
+
+
+@override_settings(APP_CATALOG_INDEX=False)
+class MarketCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(12):
+                Application.objects.create(
+                    app_id=f'app{index}', name=f'App {index}', description='demo', owner=self.user
+                )
+
+    def market_ids(self, **params):
+        response = self.client.get('/', params)
+        return [app['app_id'] for app in response.context['applications']]
+
+    def test_pages_are_cached_as_card_dicts(self):
+        self.assertEqual(self.market_ids(), [f'app{index}' for index in range(11, 2, -1)])
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+        self.assertEqual(response.context['applications'][0]['owner']['username'], 'owner')
+
+    def test_new_application_invalidates_cache(self):
+        self.market_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            Application.objects.create(app_id='fresh', name='Fresh', description='demo', owner=self.user)
+        self.assertEqual(self.market_ids()[0], 'fresh')
+
+    def test_query_is_normalized(self):
+        self.market_ids(q='App')
+        with self.assertNumQueries(0):
+            self.client.get('/', {'q': '  app '})
+
+    def test_stampede_lock_waits_for_first_computation(self):
+        cache.add('stampede:lock', 1, 10)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'fresh'
+
+        # 锁被占用且结果迟迟未写入时，等待超时后自行计算
+        self.assertEqual(get_or_compute('stampede', compute, 60, max_wait=0.1), 'fresh')
+        cache.set('stampede', 'cached', 60)
+        self.assertEqual(get_or_compute('stampede', compute, 60), 'cached')
+        self.assertEqual(len(calls), 1)
+
+
+class MarketCursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='pass')
+        for index in range(20):
+            Application.objects.create(
+                app_id=f'app{index:02d}', name=f'App {index}', description='paging demo', owner=self.user
+            )
+
+    def get_page(self, **params):
+        response = self.client.get('/', params)
+        page = response.context['page_obj']
+        return [app['app_id'] for app in page], page
+
+    def test_forward_and_backward_without_count(self):
+        with self.assertNumQueries(1):
+            first, page = self.get_page()
+        self.assertEqual(first, [f'app{index:02d}' for index in range(19, 10, -1)])
+        self.assertFalse(page.has_previous())
+
+        second, page = self.get_page(cursor=page.next_cursor)
+        self.assertEqual(second, [f'app{index:02d}' for index in range(10, 1, -1)])
+
+        third, page = self.get_page(cursor=page.next_cursor)
+        self.assertEqual(third, ['app01', 'app00'])
+        self.assertFalse(page.has_next())
+
+        back, page = self.get_page(cursor=page.previous_cursor)
+        self.assertEqual(back, second)
+        back, page = self.get_page(cursor=page.previous_cursor)
+        self.assertEqual(back, first)
+        self.assertFalse(page.has_previous())
+
+    def test_search_results_are_paginated(self):
+        first, page = self.get_page(q='paging')
+        self.assertEqual(len(first), 9)
+        second, page = self.get_page(q='paging', cursor=page.next_cursor)
+        self.assertEqual(len(second), 9)
+        self.assertFalse(set(first) & set(second))
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        first, _ = self.get_page(cursor='not-a-cursor')
+        self.assertEqual(first[0], 'app19')
+
+
+class QueryBudgetTests(StorageTestMixin, TestCase):
+    """
+    固定各视图的查询次数，数据量增长时查询次数不变；出现 N+1 或多余查询时测试失败。
+    """
+    sizes = (1, 10, 50)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='pass')
+
+    def build_catalog(self, size):
+        """创建 size 个应用（各有不同的所有者），目标应用带 size 个版本"""
+        Application.objects.all().delete()
+        for index in range(size):
+            owner = User.objects.create_user(username=f'owner-{size}-{index}')
+            Application.objects.create(app_id=f'app{index}', name=f'App {index}', description='demo', owner=owner)
+        target = Application.objects.create(app_id='target', name='Target', description='demo', owner=self.user)
+        for index in range(size):
+            AppVersion.objects.create(
+                application=target, version=f'1.{index}.0', file_name='target.apk',
+                file_size=4, md5_hash='0' * 32
+            )
+        self.write_package('target', '1.0.0', 'target.apk', b'data')
+        cache.clear()
+        return target
+
+    def test_market(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                self.build_catalog(size)
+                with self.assertNumQueries(1):
+                    self.client.get('/')
+                with self.assertNumQueries(1):
+                    self.client.get('/', {'q': 'app'})
+
+    def test_app_detail(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                target = self.build_catalog(size)
+                with self.assertNumQueries(2):
+                    self.client.get(f'/app/{target.pk}/')
+
+    def test_versions_api(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                self.build_catalog(size)
+                with self.assertNumQueries(2):
+                    response = self.client.get('/apps/target/versions/')
+                self.assertEqual(len(response.json()), size)
+
+    def test_latest_version_api(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                self.build_catalog(size)
+                # 校验器聚合与最新版本各一次；未变化时只需聚合查询
+                with self.assertNumQueries(2):
+                    response = self.client.get('/apps/target/versions/latest/')
+                with self.assertNumQueries(1):
+                    response = self.client.get('/apps/target/versions/latest/', HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_download(self):
+        self.client.force_login(self.user)
+        for size in self.sizes:
+            with self.subTest(size=size):
+                self.build_catalog(size)
+                # 会话、用户、版本各一次
+                with self.assertNumQueries(3):
+                    response = self.client.get('/apps/target/versions/1.0.0/download/')
+                self.assertEqual(response.status_code, 200)
+                response.close()
+
+
+class ConditionalVersionAPITests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=self.user)
+        self.add_version('1.0.0')
+
+    def add_version(self, version):
+        return AppVersion.objects.create(
+            application=self.app, version=version, file_name='demo.apk', file_size=4, md5_hash='0' * 32
+        )
+
+    def test_versions_list_revalidates(self):
+        response = self.client.get('/apps/demo/versions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=', response['Cache-Control'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.client.get('/apps/demo/versions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/apps/demo/versions/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # 不同分页游标各有自己的 ETag
+        self.assertNotEqual(self.client.get('/apps/demo/versions/', {'page_size': 1})['ETag'], etag)
+
+        self.add_version('1.1.0')
+        response = self.client.get('/apps/demo/versions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_deletion_changes_etag(self):
+        old = self.add_version('0.9.0')
+        etag = self.client.get('/apps/demo/versions/latest/')['ETag']
+        old.delete()
+        self.assertEqual(self.client.get('/apps/demo/versions/latest/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    async def test_async_views_revalidate(self):
+        response = await self.async_client.get('/apps/demo/versions/latest/')
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(
+            '/apps/demo/versions/latest/', headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get('/apps/demo/versions/')
+        response = await self.async_client.get('/apps/demo/versions/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+class VersionListSerializationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='owner', password='pass')
+        self.app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=user)
+        for index in range(3):
+            AppVersion.objects.create(
+                application=self.app, version=f'1.{index}.0', file_name='demo.apk', file_size=4,
+                md5_hash='0' * 32, release_notes='说明\u2028第二行'
+            )
+
+    def test_fast_path_matches_model_serializer(self):
+        expected = AppVersionSerializer(
+            AppVersion.objects.filter(application=self.app).order_by('-sort_key', '-id'), many=True
+        ).data
+        self.client.force_login(self.app.owner)
+        response = self.client.get('/apps/demo/versions/')
+        items = response.json()
+        self.assertTrue(all(item.pop('download_url').startswith('http://testserver/dl/demo/') for item in items))
+        self.assertTrue(all(item.pop('manifest') is None for item in items))
+        self.assertEqual(items, json.loads(json.dumps(expected)))
+        # 列出全部字段时不附带签名链接与清单摘要，输出与 ModelSerializer + JSONRenderer 逐字节一致
+        response = self.client.get('/apps/demo/versions/', {'fields': ','.join(AppVersionSerializer.Meta.fields)})
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_cursor_pages_over_values(self):
+        response = self.client.get('/apps/demo/versions/', {'page_size': 2, 'fields': 'version'})
+        self.assertEqual(response.json(), [{'version': '1.2.0'}, {'version': '1.1.0'}])
+        next_url = re.search(r'<([^>]+)>; rel="next"', response['Link']).group(1)
+        self.assertEqual(self.client.get(next_url).json(), [{'version': '1.0.0'}])
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/apps/demo/versions/', {'fields': 'md5_hash,version'})
+        # 字段顺序与完整输出一致
+        self.assertEqual(list(response.json()[0]), ['version', 'md5_hash'])
+        response = self.client.get('/apps/demo/versions/', {'fields': 'version,owner'})
+        self.assertEqual(response.status_code, 400)
+
+
+class VersionConstraintTests(TestCase):
+    def test_duplicate_version_is_rejected(self):
+        user = User.objects.create_user(username='owner', password='pass')
+        app = Application.objects.create(app_id='demo', name='Demo', description='demo', owner=user)
+        AppVersion.objects.create(application=app, version='1.0.0', file_name='a.apk', file_size=1, md5_hash='0' * 32)
+        response = self.client.post('/apps/demo/versions/', {
+            'version': '1.0.0',
+            'file': SimpleUploadedFile('demo.apk', b'data'),
+        })
+        self.assertEqual(response.status_code, 409)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AppVersion.objects.create(
+                application=app, version='1.0.0', file_name='b.apk', file_size=1, md5_hash='0' * 32
+            )
+
+
+class BenchmarkCommandTests(StorageTestMixin, TestCase):
+    def test_generate_catalog_and_run_benchmarks(self):
+        call_command(
+            'generate_catalog', users=2, apps=3, versions=2, files=2, file_sizes='1K', batch_size=2,
+            stdout=StringIO()
+        )
+        self.assertEqual(Application.objects.filter(app_id__startswith='bench-app-').count(), 3)
+        latest = AppVersion.objects.filter(application__app_id='bench-app-0').order_by('-sort_key').first()
+        self.assertEqual(latest.sort_key, version_sort_key(latest.version))
+        with open(latest.storage_path, 'rb') as f:
+            self.assertEqual(hashlib.md5(f.read()).hexdigest(), latest.md5_hash)
+
+        output_path = os.path.join(self.storage_dir, 'results.json')
+        call_command(
+            'run_benchmarks', iterations=2, io_iterations=1, warmup=0, sizes='1K', output=output_path,
+            stdout=StringIO()
+        )
+        with open(output_path) as f:
+            results = json.load(f)
+        self.assertEqual(
+            set(results['scenarios']),
+            {'market', 'market_cold', 'market_search', 'app_detail', 'versions_api', 'latest_api',
+             'download_1K', 'upload_1K'}
+        )
+        self.assertEqual(results['scenarios']['latest_api']['count'], 2)
+        self.assertIn('p99_ms', results['scenarios']['download_1K'])
+        self.assertFalse(Application.objects.filter(app_id='bench-upload').exists())
+
+    def test_benchmark_serialization(self):
+        output_path = os.path.join(self.storage_dir, 'serialization.json')
+        call_command('benchmark_serialization', versions=5, repeat=1, json_path=output_path, stdout=StringIO())
+        with open(output_path) as f:
+            results = json.load(f)['results']
+        self.assertEqual(results['model_serializer']['bytes'], results['values_mapper']['bytes'])
+        self.assertLess(results['values_mapper_sparse']['bytes'], results['values_mapper']['bytes'])
+        # 测试数据随事务回滚
+        self.assertFalse(Application.objects.filter(app_id='bench-serialization').exists())
+
+
+class GitHubStubHandler(BaseHTTPRequestHandler):
+    """本地模拟的 GitHub OAuth / API，支持 keep-alive，按路径返回预设响应或延迟"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.respond()
+
+    def respond(self):
+        path = self.path.split('?')[0]
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.connections.add(self.client_address)
+        self.server.hits.append(path)
+        time.sleep(self.server.delays.get(path, 0))
+        status_code, payload = self.server.routes.get(path, (404, {}))
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class GitHubStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭连接池中的空闲连接属于正常情况，不输出回溯
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class GitHubCallbackTests(TestCase):
+    def setUp(self):
+        self.server = GitHubStubServer(('127.0.0.1', 0), GitHubStubHandler)
+        self.server.connections, self.server.hits, self.server.delays = set(), [], {}
+        self.server.routes = {
+            '/login/oauth/access_token': (200, {'access_token': 'token-1'}),
+            '/user': (200, {
+                'id': 42, 'login': 'octocat', 'email': None, 'name': 'Octo Cat',
+                'avatar_url': 'https://example.com/a.png', 'html_url': 'https://github.com/octocat',
+            }),
+            '/user/emails': (200, [
+                {'email': 'other@example.com', 'primary': False, 'verified': True},
+                {'email': 'octo@example.com', 'primary': True, 'verified': True},
+            ]),
+        }
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        base_url = f'http://127.0.0.1:{self.server.server_port}'
+        settings_override = override_settings(
+            GITHUB_OAUTH_URL=f'{base_url}/login/oauth', GITHUB_API_URL=base_url,
+            GITHUB_CLIENT_ID='id', GITHUB_CLIENT_SECRET='secret',
+            GITHUB_READ_TIMEOUT=0.3, GITHUB_RETRIES=0, GITHUB_CIRCUIT_FAILURES=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_login_reuses_pooled_connection(self):
+        response = self.client.get('/github-callback/', {'code': 'abc'})
+        self.assertRedirects(response, '/profile/', fetch_redirect_response=False)
+        user = GitHubSocialAuth.objects.get(github_id=42).user
+        self.assertEqual(user.email, 'octo@example.com')
+        self.assertEqual(user.profile.registration_source, 'github')
+
+        # 已关联的用户再次登录不查询邮箱
+        self.client.logout()
+        self.client.get('/github-callback/', {'code': 'def'})
+        self.assertEqual(self.server.hits.count('/user/emails'), 1)
+        self.assertEqual(len(self.server.hits), 5)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_timeouts_open_the_circuit(self):
+        self.server.delays['/login/oauth/access_token'] = 1
+        for _ in range(2):
+            started = time.monotonic()
+            with self.assertLogs('core.views', 'ERROR'):
+                response = self.client.get('/github-callback/', {'code': 'abc'})
+            self.assertEqual(response.status_code, 200)
+            self.assertLess(time.monotonic() - started, 1)
+
+        # 熔断后不再请求 GitHub
+        response = self.client.get('/github-callback/', {'code': 'abc'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.server.hits), 2)
@@ -0,0 +1,236 @@
+# throttling.py
+"""
+接口限流与下载并发控制，状态保存在共享缓存中（配置 REDIS_URL 后多进程、多机共用）。
+默认的进程内缓存（LocMemCache）只在单个工作进程内计数，多进程部署时必须配置共享缓存（见 checks）。
+
+- 令牌桶：按用户与按 IP 各一个桶，容量为速率中的次数，按速率匀速补充（以 GCRA 实现，
+  每个桶只保存一个时间戳）。读取与写回之间没有加锁，与 DRF 自带的限流一样，
+  并发请求可能多放行少量请求
+- 下载并发：按用户（签名链接与未登录请求按 IP）与全局分别计数，使用缓存的原子 incr/decr，
+  响应发送完毕（关闭）时释放
+- 带宽整形：可选，按单个下载连接限速；与并发上限一起限定单个用户占用的总带宽
+
+超过限制时返回 429 与 Retry-After。
+"""
+import asyncio
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# 并发下载计数的过期时间（秒）：进程异常退出未能释放的计数最迟在此之后清零
+SLOT_TTL = 60 * 60
+# 达到并发上限时建议客户端等待的时间（秒）
+SLOT_RETRY_AFTER = 5
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (120, 60)；为空时返回 None（不限流）"""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def consume(key, rate, now=None):
+    """
+    从令牌桶中取出一个令牌，成功返回 0，否则返回需要等待的秒数。
+
+    GCRA: 缓存中保存理论到达时间（TAT），每个请求把 TAT 推后 period / count；
+    TAT 超出当前时间一个 period 以上（桶已空）时拒绝
+    """
+    count, period = rate
+    interval = period / count
+    now = time.time() if now is None else now
+    tat = max(cache.get(key) or now, now) + interval
+    wait = tat - period - now
+    if wait > 0:
+        return wait
+    cache.set(key, tat, math.ceil(period) + 1)
+    return 0
+
+
+def client_ip(request):
+    """客户端 IP，经过反向代理时按 REST_FRAMEWORK 的 NUM_PROXIES 从 X-Forwarded-For 中取得"""
+    return BaseThrottle().get_ident(request)
+
+
+def too_many_requests(wait, message="请求过于频繁，请稍后再试"):
+    response = JsonResponse({"error": message}, status=429, json_dumps_params={'ensure_ascii': False})
+    response['Retry-After'] = str(max(math.ceil(wait), 1))
+    return response
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF 令牌桶限流，速率取自 REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][scope]，
+    每次请求时读取（override_settings 后立即生效）
+    """
+    scope = None
+
+    def get_cache_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        rate = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(self.scope))
+        key = self.get_cache_key(request)
+        if rate is None or key is None:
+            return True
+        self.wait_seconds = consume(f'throttle:{self.scope}:{key}', rate)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """已登录用户的令牌桶"""
+    scope = 'user'
+
+    def get_cache_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """按客户端 IP 的令牌桶（包括已登录用户，同一出口 IP 的多个账号共用）"""
+    scope = 'ip'
+
+    def get_cache_key(self, request):
+        return client_ip(request)
+
+
+def check_ip_throttle(request):
+    """
+    不经过 DRF 的视图（异步视图、签名下载）使用的 IP 令牌桶，超过限制时返回 429 响应。
+    这些视图不读取会话，因此只按 IP 限流
+    """
+    throttle = IPTokenBucketThrottle()
+    if throttle.allow_request(request, None):
+        return None
+    return too_many_requests(throttle.wait())
+
+
+def _acquire(key, limit):
+    cache.add(key, 0, SLOT_TTL)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # 计数恰好过期
+        cache.add(key, 1, SLOT_TTL)
+        count = 1
+    if count > limit:
+        _release(key)
+        return False
+    return True
+
+
+def _release(key):
+    try:
+        if cache.decr(key) < 0:
+            # 计数过期后重新计数时，过期前开始的下载仍会释放
+            cache.set(key, 0, SLOT_TTL)
+    except ValueError:
+        pass
+
+
+class DownloadSlot:
+    """一个已占用的下载并发名额，release() 可重复调用"""
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def release(self):
+        keys, self.keys = self.keys, []
+        for key in keys:
+            _release(key)
+
+
+def download_identity(request, user=None):
+    """并发计数的主体：已登录用户按用户，否则按 IP"""
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def acquire_download_slot(identity):
+    """占用一个下载名额，超过单个用户或全局并发上限时返回 None"""
+    acquired = []
+    for key, limit in (
+        (f'downloads:{identity}', settings.APP_DOWNLOAD_CONCURRENCY_PER_USER),
+        ('downloads:global', settings.APP_DOWNLOAD_CONCURRENCY_GLOBAL),
+    ):
+        if not limit:
+            continue
+        if not _acquire(key, limit):
+            DownloadSlot(acquired).release()
+            return None
+        acquired.append(key)
+    return DownloadSlot(acquired)
+
+
+def _shape(iterator, rate):
+    started = time.monotonic()
+    sent = 0
+    for chunk in iterator:
+        yield chunk
+        sent += len(chunk)
+        delay = sent / rate - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+async def _ashape(iterator, rate):
+    started = time.monotonic()
+    sent = 0
+    async for chunk in iterator:
+        yield chunk
+        sent += len(chunk)
+        delay = sent / rate - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def finish_download(response, slot):
+    """响应关闭（发送完毕或客户端断开）时释放名额；配置了 APP_DOWNLOAD_BANDWIDTH 时对流式响应限速"""
+    response._resource_closers.append(slot.release)
+    rate = settings.APP_DOWNLOAD_BANDWIDTH
+    if rate and response.streaming and response.status_code in (200, 206):
+        # 不再交给 wsgi.file_wrapper 零拷贝发送，否则会绕过限速
+        response.file_to_stream = None
+        if response.is_async:
+            response.streaming_content = _ashape(response.streaming_content, rate)
+        else:
+            response.streaming_content = _shape(response.streaming_content, rate)
+    return response
+
+
+def limit_concurrent_downloads(by_user=True):
+    """
+    同步下载视图的并发上限装饰器。by_user=False 时只按 IP 计数，不读取会话（签名下载）
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            slot = acquire_download_slot(
+                download_identity(request, request.user if by_user else None)
+            )
+            if slot is None:
+                return too_many_requests(SLOT_RETRY_AFTER, "同时进行的下载过多，请稍后再试")
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                slot.release()
+                raise
+            return finish_download(response, slot)
+        return wrapper
+    return decorator
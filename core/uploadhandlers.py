@@ -0,0 +1,98 @@
+# uploadhandlers.py
+"""上传处理器：请求体流入时一次性完成写盘与 MD5/SHA-256 计算"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class HashingUploadedFile(UploadedFile):
+    """
+    已写入存储目录临时文件的上传文件，附带 MD5 与 SHA-256。
+
+    调用 commit() 后通过原子 rename 移动到最终位置；未提交的临时文件在 close() 时删除
+    （Django 会在请求结束时关闭所有上传文件）。
+    """
+
+    def __init__(self, file, temp_path, name, content_type, size, charset,
+                 md5_hash, sha256_hash, content_type_extra=None):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self._temp_path = temp_path
+        self._committed = False
+        self.md5_hash = md5_hash
+        self.sha256_hash = sha256_hash
+
+    def temporary_file_path(self):
+        return self._temp_path
+
+    def commit(self, storage, key):
+        """将临时文件存入存储后端（本地存储为原子 rename）"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        storage.put_file(key, self._temp_path)
+        self._committed = True
+        self._temp_path = storage.local_path(key)
+        return key
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            if not self._committed:
+                try:
+                    os.remove(self._temp_path)
+                except FileNotFoundError:
+                    pass
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """
+    边接收边写入临时文件并增量计算哈希，内存占用与文件大小无关。
+
+    临时文件放在 upload_dir（默认 APP_STORAGE/.uploads）中，与最终位置位于同一文件系统，
+    保证 commit() 时的 rename 是原子操作。
+    """
+
+    def __init__(self, request=None, upload_dir=None):
+        super().__init__(request)
+        self.upload_dir = upload_dir or os.path.join(settings.APP_STORAGE, '.uploads')
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=self.upload_dir, suffix='.part')
+        self.file = os.fdopen(fd, 'wb+')
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.md5.update(raw_data)
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        # 返回 None，数据块不再传递给后续处理器
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        return HashingUploadedFile(
+            file=self.file,
+            temp_path=self.temp_path,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            md5_hash=self.md5.hexdigest(),
+            sha256_hash=self.sha256.hexdigest(),
+            content_type_extra=self.content_type_extra
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+            try:
+                os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
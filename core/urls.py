@@ -1,15 +1,35 @@
 # urls.py
 from django.urls import path
-from . import views
+from . import metrics, views
 
 urlpatterns = [
     # 应用版本管理 (列表和创建)
     path('apps/<str:app_id>/versions/', views.AppVersionAPI.as_view(), name='app-versions'),
+    # 秒传预检: 已存在相同内容时直接创建版本
+    path('apps/<str:app_id>/versions/precheck/', views.InstantUploadAPI.as_view(), name='instant-upload'),
+    # 可续传分块上传 (创建会话 / 查询进度与追加分块 / 完成)
+    path('apps/<str:app_id>/versions/uploads/', views.UploadSessionCreateAPI.as_view(), name='upload-sessions'),
+    path('apps/<str:app_id>/versions/uploads/<uuid:upload_id>/', views.UploadSessionAPI.as_view(),
+         name='upload-session'),
+    path('apps/<str:app_id>/versions/uploads/<uuid:upload_id>/finalize/', views.UploadSessionFinalizeAPI.as_view(),
+         name='upload-session-finalize'),
     # 下载特定版本
     path('apps/<str:app_id>/versions/<str:version>/download/', views.download_app_version, name='download-app-version'),
+    # 下载两个版本之间的差分包（没有差分包时回退为完整文件）
+    path('apps/<str:app_id>/versions/<str:from_version>/delta/<str:to_version>/', views.download_version_delta,
+         name='download-version-delta'),
+    # 安装包内容清单（只读取 ZIP 中央目录，结果按 MD5 缓存）
+    path('apps/<str:app_id>/versions/<str:version>/manifest/', views.PackageManifestAPI.as_view(),
+         name='version-manifest'),
+    # 签名下载链接（无需登录，由版本接口签发）
+    path('dl/<str:app_id>/<str:version>/<str:token>/<str:file_name>', views.signed_download, name='signed-download'),
 
     # 获取最新版本信息
     path('apps/<str:app_id>/versions/latest/', views.LatestVersionAPI.as_view(), name='latest-version'),
+    # 全量目录索引（静态文件，支持 ETag / 预压缩）
+    path('apps/index.json', views.catalog_index, name='catalog-index'),
+    # 批量检查更新
+    path('apps/updates/check/', views.BatchUpdateCheckAPI.as_view(), name='batch-update-check'),
 
     path('', views.market, name='market'),
     path('app/<str:app_id>/', views.app_detail, name='app_detail'),
@@ -24,4 +44,7 @@ urlpatterns = [
     path('github-callback/', views.github_callback, name='github_callback'),
 
     path('profile/', views.user_profile, name='user_profile'),
+
+    # Prometheus 监控指标
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
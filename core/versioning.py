@@ -0,0 +1,62 @@
+# versioning.py
+"""版本号排序键：把 packaging.version 的比较规则编码成可按字符串直接比较的键"""
+from packaging.version import InvalidVersion, Version
+
+# 预发布标记的顺序: a < b < rc
+_PRE_RELEASE_ORDER = {'a': '1', 'b': '2', 'rc': '3'}
+
+
+def _encode_int(value):
+    """变长整数：两位长度前缀 + 十进制数字，保证字符串顺序与数值顺序一致"""
+    digits = str(value)
+    return f"{len(digits):02d}{digits}"
+
+
+def version_sort_key(version_string):
+    """
+    生成与 packaging.version.Version 排序一致的键，只包含 [0-9a-f] 字符，
+    在任意数据库排序规则下按字符串比较结果都相同。
+
+    各段依次为 epoch、release、pre、post、dev、local，每段自定界：
+    '0' 表示负无穷/段结束，'1' 表示有值，'2' 表示正无穷。
+    无法解析的版本号返回空字符串，排在所有合法版本之前。
+    """
+    try:
+        version = Version(version_string)
+    except (InvalidVersion, TypeError):
+        return ''
+
+    parts = [_encode_int(version.epoch)]
+
+    # release 去掉末尾的 0（1.0 == 1.0.0），逐段编码后以 '0' 结束
+    release = list(version.release)
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+    parts.extend('1' + _encode_int(n) for n in release)
+    parts.append('0')
+
+    # 没有 pre/post 只有 dev 的版本（1.0.dev1）排在所有预发布之前
+    if version.pre is None and version.post is None and version.dev is not None:
+        parts.append('0')
+    elif version.pre is None:
+        parts.append('2')
+    else:
+        letter, number = version.pre
+        parts.append('1' + _PRE_RELEASE_ORDER[letter] + _encode_int(number))
+
+    parts.append('0' if version.post is None else '1' + _encode_int(version.post))
+    parts.append('2' if version.dev is None else '1' + _encode_int(version.dev))
+
+    # local 段: 字符串 < 数字，字符串按字符的十六进制编码并以 '00' 结束
+    if version.local is None:
+        parts.append('0')
+    else:
+        parts.append('1')
+        for segment in version.local.split('.'):
+            if segment.isdigit():
+                parts.append('2' + _encode_int(int(segment)))
+            else:
+                parts.append('1' + segment.encode('ascii').hex() + '00')
+        parts.append('0')
+
+    return ''.join(parts)
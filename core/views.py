@@ -1,30 +1,51 @@
 import hashlib
 import os
 import re
+from datetime import timedelta
 from urllib.parse import urlencode
 
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只依赖数据库行锁
+    fcntl = None
+
 from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm, logger
-from django.core.files.storage import FileSystemStorage
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import FileResponse
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.http import FileResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
-from packaging.version import parse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_safe
 from rest_framework import status
 from rest_framework.decorators import api_view
-from rest_framework.renderers import JSONRenderer  # 添加渲染器
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import AppVersion, Application
-from .serializers import ApplicationSerializer, AppVersionSerializer
+from . import catalog, manifests, signed_downloads, throttling
+from .blobstore import create_version_from_blob, find_blob, store_local_file, store_uploaded_file
+from .caching import get_or_compute, market_generation
+from .conditional import apply_headers, not_modified, validator_headers, version_validators
+from .counters import record_download, should_count
+from .downloads import storage_download_response
+from .models import AppVersion, Application, UploadSession, VersionDelta
+from .pagination import (
+    CursorPage, VersionCursorPagination, keyset_paginate, offset_paginate, version_list_columns,
+)
+from .renderers import ORJSONRenderer
+from .search import search_applications
+from .serializers import APP_VERSION_VALUES, ApplicationSerializer, AppVersionSerializer
+from .storage import get_storage
+from .uploadhandlers import HashingFileUploadHandler
+from .versioning import version_sort_key
 from django.contrib.auth.decorators import login_required
 
-# 配置存储路径
+# 本地存储目录：上传临时文件与分块上传会话始终放在这里，安装包本身由 storage.get_storage() 管理
 STORAGE_PATH = getattr(settings, 'APP_STORAGE', 'app_storage')
-storage = FileSystemStorage(location=STORAGE_PATH)
 
 
 def sanitize_filename(filename):
@@ -34,37 +55,81 @@ def sanitize_filename(filename):
     return filename
 
 
+def version_list_fields(fields_param):
+    """
+    解析版本列表的 ?fields= 参数，返回 (字段映射, 是否附带 download_url, 是否附带 manifest 摘要)；
+    未指定时输出全部字段、签名下载链接与清单摘要，包含未知字段时抛出 ValueError
+    """
+    if not fields_param:
+        return APP_VERSION_VALUES, True, True
+    requested = [name.strip() for name in fields_param.split(',') if name.strip()]
+    with_url = 'download_url' in requested
+    with_manifest = 'manifest' in requested
+    names = [name for name in requested if name not in ('download_url', 'manifest')]
+    if not names:
+        raise ValueError("至少需要一个版本字段")
+    return APP_VERSION_VALUES.subset(','.join(names)), with_url, with_manifest
+
+
+def version_list_extra_columns(with_url, with_manifest):
+    """签名下载链接与清单摘要需要额外读取的列"""
+    return (
+        (signed_downloads.SIGNED_URL_COLUMNS if with_url else ())
+        + (manifests.MANIFEST_COLUMNS if with_manifest else ())
+    )
+
+
+def hashing_upload_handlers(request):
+    """上传文件边接收边写入存储目录并计算哈希，避免整文件读入内存或重复读写"""
+    return [HashingFileUploadHandler(request, upload_dir=os.path.join(STORAGE_PATH, '.uploads'))]
+
+
 class AppVersionAPI(APIView):
     """应用版本管理"""
-    renderer_classes = [JSONRenderer]  # 明确指定渲染器
+    renderer_classes = [ORJSONRenderer]  # 明确指定渲染器
+
+    def initialize_request(self, request, *args, **kwargs):
+        # 必须在解析请求体（包括 CSRF 校验读取 POST）之前替换上传处理器
+        if request.method == 'POST':
+            request.upload_handlers = hashing_upload_handlers(request)
+        return super().initialize_request(request, *args, **kwargs)
 
     def get(self, request, app_id, format=None):
         """获取应用所有版本信息"""
+        # 稀疏字段集: ?fields=version,md5_hash 只返回指定字段
         try:
-            application = Application.objects.get(app_id=app_id)
-        except Application.DoesNotExist:
+            mapper, with_url, with_manifest = version_list_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 一条聚合查询同时确认应用存在并得到条件请求的校验器，未变化时不再查询与序列化版本
+        validators = version_validators(app_id)
+        if validators is None:
             return Response(
                 {"error": f"应用ID '{app_id}' 不存在"},
                 status=status.HTTP_404_NOT_FOUND
             )
-
-        versions = AppVersion.objects.filter(
-            application=application
-        ).order_by('-upload_time')
-
-        if not versions.exists():
-            return Response([], status=status.HTTP_200_OK)
-
-        serializer = AppVersionSerializer(versions, many=True)
-
-        # 按版本号排序（使用packaging.version）
-        sorted_versions = sorted(
-            serializer.data,
-            key=lambda x: parse(x['version']),
-            reverse=True
+        # 签名下载链接不校验用户，只签发给已登录用户，否则匿名客户端可以绕过下载接口的登录要求
+        with_url = with_url and request.user.is_authenticated
+        headers = validator_headers(request, validators, 'versions', signed=with_url)
+        response = not_modified(request, validators, headers)
+        if response is not None:
+            return response
+
+        # 按语义版本号倒序的游标分页，排序与分页都在数据库中完成（使用 (application, sort_key) 索引），
+        # 前后页链接放在 Link 响应头中；只取需要的列，按字段映射输出而不经过 ModelSerializer；
+        # 清单摘要以 LEFT JOIN 在同一查询中取出
+        versions = AppVersion.objects.filter(application_id=validators['id']).values(
+            *version_list_columns(mapper, version_list_extra_columns(with_url, with_manifest))
         )
-
-        return Response(sorted_versions, status=status.HTTP_200_OK)
+        paginator = VersionCursorPagination()
+        page = paginator.paginate_queryset(versions, request, view=self)
+        data = mapper.map(page)
+        if with_url:
+            signed_downloads.add_download_urls(request, app_id, page, data)
+        if with_manifest:
+            manifests.add_manifest_summaries(page, data)
+        return apply_headers(paginator.get_paginated_response(data), headers)
 
     def post(self, request, app_id, format=None):
         """上传新版本应用"""
@@ -93,36 +158,359 @@ class AppVersionAPI(APIView):
         file = request.FILES['file']
         sanitized_filename = sanitize_filename(file.name)
 
-        # 创建应用目录
-        app_dir = os.path.join(STORAGE_PATH, app_id)
-        os.makedirs(app_dir, exist_ok=True)
-
-        # 保存文件
-        filename = f"{version}_{sanitized_filename}"
-        file_path = os.path.join(app_dir, filename)
-        with open(file_path, 'wb+') as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
-
-        # 计算文件哈希和大小
-        with open(file_path, 'rb') as f:
-            content = f.read()
-            file_md5 = hashlib.md5(content).hexdigest()
-        file_size = os.path.getsize(file_path)
-
-        # 创建版本记录
-        app_version = AppVersion.objects.create(
+        if AppVersion.objects.filter(application=application, version=version).exists():
+            return Response(
+                {"error": "该版本号已存在"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        # 文件在请求体流入时已写入临时文件并完成哈希计算，这里按内容寻址原子地移动到最终位置，
+        # 相同内容已存在时直接复用
+        blob = store_uploaded_file(file)
+
+        # 创建版本记录；exists() 检查之后并发上传了同一版本号时由唯一约束拦下
+        try:
+            app_version = create_version_from_blob(
+                application, version, sanitized_filename, blob, release_notes=release_notes
+            )
+        except IntegrityError:
+            return Response(
+                {"error": "该版本号已存在"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(
+            {
+                "success": f"版本 {version} 上传成功!",
+                "version": AppVersionSerializer(app_version).data
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+
+class InstantUploadAPI(APIView):
+    """
+    秒传预检：客户端先提交 SHA-256 与文件大小，
+    服务端已存有相同内容时直接创建版本，无需再上传文件
+    """
+    renderer_classes = [ORJSONRenderer]
+
+    def post(self, request, app_id, format=None):
+        try:
+            application = Application.objects.get(app_id=app_id)
+        except Application.DoesNotExist:
+            return Response(
+                {"error": f"应用ID '{app_id}' 不存在"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        version = request.data.get('version')
+        file_name = sanitize_filename(request.data.get('file_name', ''))
+        sha256_hash = str(request.data.get('sha256_hash', ''))
+        if not version or not file_name:
+            return Response(
+                {"error": "缺少版本号或文件名参数"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not re.fullmatch(r'[0-9a-fA-F]{64}', sha256_hash):
+            return Response(
+                {"error": "无效的 SHA-256 哈希"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            file_size = int(request.data.get('file_size'))
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "缺少或无效的文件大小"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if AppVersion.objects.filter(application=application, version=version).exists():
+            return Response(
+                {"error": "该版本号已存在"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        blob = find_blob(sha256_hash, file_size)
+        if blob is None:
+            # 内容不存在，客户端需要走普通上传或分块上传
+            return Response({"instant": False}, status=status.HTTP_200_OK)
+
+        try:
+            app_version = create_version_from_blob(
+                application, version, file_name, blob, release_notes=request.data.get('release_notes', '')
+            )
+        except IntegrityError:
+            return Response(
+                {"error": "该版本号已存在"},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(
+            {
+                "instant": True,
+                "success": f"版本 {version} 上传成功!",
+                "version": AppVersionSerializer(app_version).data
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+
+TUS_VERSION = '1.0.0'
+# 读取 PATCH 请求体的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _tus_headers(response, upload_session):
+    """附加 tus 协议的进度头"""
+    response['Tus-Resumable'] = TUS_VERSION
+    response['Upload-Offset'] = str(upload_session.upload_offset)
+    response['Upload-Length'] = str(upload_session.upload_length)
+    response['Upload-Expires'] = http_date(upload_session.expires_at.timestamp())
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def _upload_session_data(upload_session):
+    return {
+        "id": str(upload_session.id),
+        "version": upload_session.version,
+        "file_name": upload_session.file_name,
+        "upload_offset": upload_session.upload_offset,
+        "upload_length": upload_session.upload_length,
+        "expires_at": upload_session.expires_at,
+    }
+
+
+class UploadSessionCreateAPI(APIView):
+    """创建可续传上传会话"""
+    renderer_classes = [ORJSONRenderer]
+
+    def post(self, request, app_id, format=None):
+        try:
+            application = Application.objects.get(app_id=app_id)
+        except Application.DoesNotExist:
+            return Response(
+                {"error": f"应用ID '{app_id}' 不存在"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        version = request.data.get('version')
+        file_name = sanitize_filename(request.data.get('file_name', ''))
+        upload_length = request.headers.get('Upload-Length', request.data.get('upload_length'))
+
+        if not version:
+            return Response(
+                {"error": "缺少版本号参数"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not file_name:
+            return Response(
+                {"error": "缺少文件名参数"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            upload_length = int(upload_length)
+            if upload_length < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "缺少或无效的文件大小 (Upload-Length)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if AppVersion.objects.filter(application=application, version=version).exists():
+            return Response(
+                {"error": "该版本号已存在"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        upload_session = UploadSession.objects.create(
             application=application,
             version=version,
-            file_name=sanitized_filename,
-            file_size=file_size,
-            md5_hash=file_md5,
-            release_notes=release_notes
+            file_name=file_name,
+            release_notes=request.data.get('release_notes', ''),
+            upload_length=upload_length,
+            expires_at=timezone.now() + timedelta(seconds=settings.APP_UPLOAD_SESSION_TTL)
+        )
+        # 预先创建空的分块文件，后续 PATCH 直接按偏移写入
+        os.makedirs(os.path.dirname(upload_session.partial_path), exist_ok=True)
+        open(upload_session.partial_path, 'wb').close()
+
+        response = Response(_upload_session_data(upload_session), status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(
+            reverse('upload-session', args=[app_id, upload_session.id])
         )
+        return _tus_headers(response, upload_session)
+
+
+def _lock_file(f):
+    """对打开的分块文件加排他锁，文件关闭时释放；同一会话的并发请求靠文件锁串行化"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _session_finished():
+    return Response({"error": "上传会话已完成或已取消"}, status=status.HTTP_409_CONFLICT)
+
+
+class UploadSessionMixin:
+    def get_session(self, app_id, upload_id, lock=False):
+        """返回 (会话, 错误响应)；lock 为 True 时在当前事务中锁住会话记录"""
+        queryset = UploadSession.objects.select_for_update() if lock else UploadSession.objects
+        try:
+            upload_session = queryset.get(id=upload_id, application__app_id=app_id)
+        except UploadSession.DoesNotExist:
+            return None, Response({"error": "上传会话不存在"}, status=status.HTTP_404_NOT_FOUND)
+        if upload_session.expires_at <= timezone.now():
+            return None, Response({"error": "上传会话已过期"}, status=status.HTTP_410_GONE)
+        return upload_session, None
+
+
+class UploadSessionAPI(UploadSessionMixin, APIView):
+    """查询进度 (HEAD/GET)、追加分块 (PATCH)、取消 (DELETE) 上传会话"""
+    renderer_classes = [ORJSONRenderer]
+
+    def head(self, request, app_id, upload_id, format=None):
+        upload_session, error = self.get_session(app_id, upload_id)
+        if error:
+            return error
+        return _tus_headers(Response(status=status.HTTP_200_OK), upload_session)
+
+    def get(self, request, app_id, upload_id, format=None):
+        upload_session, error = self.get_session(app_id, upload_id)
+        if error:
+            return error
+        return _tus_headers(Response(_upload_session_data(upload_session)), upload_session)
+
+    def patch(self, request, app_id, upload_id, format=None):
+        upload_session, error = self.get_session(app_id, upload_id)
+        if error:
+            return error
+
+        if request.content_type.split(';')[0].strip() != 'application/offset+octet-stream':
+            return Response(
+                {"error": "Content-Type 必须为 application/offset+octet-stream"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "缺少或无效的 Upload-Offset"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            f = open(upload_session.partial_path, 'r+b')
+        except FileNotFoundError:
+            # 会话已完成（分块文件已移入存储）或已取消
+            return _session_finished()
+        # 偏移量检查与写入在文件锁内完成，相同偏移量的并发 PATCH 不会交错写入；
+        # 接收请求体期间不持有数据库事务，客户端再慢也不会阻塞其它写入
+        with f:
+            _lock_file(f)
+            upload_session, error = self.get_session(app_id, upload_id)
+            if error:
+                return _session_finished() if error.status_code == status.HTTP_404_NOT_FOUND else error
+            if offset != upload_session.upload_offset:
+                return _tus_headers(Response(
+                    {"error": f"偏移量不匹配，当前偏移量为 {upload_session.upload_offset}"},
+                    status=status.HTTP_409_CONFLICT
+                ), upload_session)
+
+            # 边读边写，不把分块整体读入内存；客户端中途断开时保留已写入的部分
+            remaining = upload_session.upload_length - offset
+            written = 0
+            f.seek(offset)
+            while True:
+                chunk = request.stream.read(UPLOAD_CHUNK_SIZE) if request.stream else b''
+                if not chunk:
+                    break
+                if written + len(chunk) > remaining:
+                    return Response(
+                        {"error": "上传数据超出声明的文件大小"},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                    )
+                f.write(chunk)
+                written += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+            # 以旧偏移量为条件更新（没有 fcntl 的平台上由它防止重复推进进度），会话已删除时同样不会更新
+            updated = UploadSession.objects.filter(
+                id=upload_session.id, upload_offset=offset
+            ).update(upload_offset=offset + written)
+        if not updated:
+            return _session_finished()
+        upload_session.upload_offset = offset + written
+        return _tus_headers(Response(status=status.HTTP_204_NO_CONTENT), upload_session)
+
+    def delete(self, request, app_id, upload_id, format=None):
+        upload_session, error = self.get_session(app_id, upload_id)
+        if error:
+            return error
+        upload_session.delete_partial_file()
+        upload_session.delete()
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        response['Tus-Resumable'] = TUS_VERSION
+        return response
+
+
+class UploadSessionFinalizeAPI(UploadSessionMixin, APIView):
+    """所有分块上传完成后，生成正式的应用版本"""
+    renderer_classes = [ORJSONRenderer]
+
+    def post(self, request, app_id, upload_id, format=None):
+        upload_session, error = self.get_session(app_id, upload_id)
+        if error:
+            return error
+        if upload_session.upload_offset != upload_session.upload_length:
+            return _tus_headers(Response(
+                {"error": "文件尚未上传完成"},
+                status=status.HTTP_409_CONFLICT
+            ), upload_session)
+        if AppVersion.objects.filter(
+                application=upload_session.application, version=upload_session.version
+        ).exists():
+            return Response(
+                {"error": "该版本号已存在"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        # 哈希计算与存入存储（对象存储时包括上传）在事务之外完成
+        try:
+            md5 = hashlib.md5()
+            sha256 = hashlib.sha256()
+            with open(upload_session.partial_path, 'rb') as f:
+                # 单次顺序读取计算哈希
+                _lock_file(f)
+                for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                    md5.update(chunk)
+                    sha256.update(chunk)
+            blob = store_local_file(
+                upload_session.partial_path, md5.hexdigest(), sha256.hexdigest(), upload_session.upload_length
+            )
+        except FileNotFoundError:
+            # 另一个完成请求已先移走了分块文件
+            return _session_finished()
+
+        # 只在创建版本与删除会话时锁住会话，并发的完成请求等待后发现会话已删除，返回 409
+        with transaction.atomic():
+            upload_session, error = self.get_session(app_id, upload_id, lock=True)
+            if error:
+                return _session_finished() if error.status_code == status.HTTP_404_NOT_FOUND else error
+            try:
+                app_version = create_version_from_blob(
+                    upload_session.application, upload_session.version, upload_session.file_name, blob,
+                    release_notes=upload_session.release_notes
+                )
+            except IntegrityError:
+                return Response(
+                    {"error": "该版本号已存在"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            upload_session.delete()
 
         return Response(
             {
-                "success": f"版本 {version} 上传成功!",
+                "success": f"版本 {app_version.version} 上传成功!",
                 "version": AppVersionSerializer(app_version).data
             },
             status=status.HTTP_201_CREATED
@@ -130,80 +518,370 @@ class AppVersionAPI(APIView):
 
 
 @login_required
+@throttling.limit_concurrent_downloads()
 @api_view(['GET'])
 def download_app_version(request, app_id, version):
     """下载特定版本应用"""
     app_version = get_object_or_404(
-        AppVersion,
+        AppVersion.objects.select_related('application').exclude(processing_state=AppVersion.FAILED),
         application__app_id=app_id,
         version=version
     )
 
-    file_path = os.path.join(STORAGE_PATH, app_id, f"{version}_{app_version.file_name}")
-    print(file_path)
-    if not os.path.exists(file_path):
+    storage = get_storage()
+    if not storage.exists(app_version.storage_key):
         return Response(
             {"error": "文件不存在"},
             status=status.HTTP_404_NOT_FOUND
         )
 
-    return FileResponse(
-        open(file_path, 'rb'),
-        as_attachment=True,
-        filename=app_version.file_name
+    # 计数只写入本机旁路表，由 flush_download_counters 批量写回数据库
+    if should_count(request):
+        record_download(app_version.id, app_version.application_id)
+
+    # 进程内发送时支持 Range / If-Range 断点续传，ETag 使用版本的 MD5；
+    # 配置 APP_DOWNLOAD_OFFLOAD 后交给 nginx / Apache 发送文件，对象存储则重定向到预签名 URL
+    return storage_download_response(
+        request,
+        storage,
+        app_version.storage_key,
+        app_version.file_name,
+        md5_hash=app_version.md5_hash
     )
 
 
+@login_required
+@throttling.limit_concurrent_downloads()
+@api_view(['GET'])
+def download_version_delta(request, app_id, from_version, to_version):
+    """
+    下载从 from_version 升级到 to_version 的差分包。
+
+    响应头携带目标版本的哈希与大小，供客户端打补丁后校验；
+    没有可用差分包时回退为目标版本的完整文件（X-Delta-Algorithm: none）。
+    """
+    target = get_object_or_404(
+        AppVersion.objects.select_related('application').exclude(processing_state=AppVersion.FAILED),
+        application__app_id=app_id,
+        version=to_version
+    )
+    delta = VersionDelta.objects.select_related(
+        'from_version__application', 'to_version__application'
+    ).filter(
+        from_version__application__app_id=app_id,
+        from_version__version=from_version,
+        to_version=target
+    ).first()
+
+    storage = get_storage()
+    if delta is not None and storage.exists(delta.storage_key):
+        response = storage_download_response(
+            request,
+            storage,
+            delta.storage_key,
+            f"{app_id}_{from_version}_to_{to_version}.{delta.algorithm}",
+            md5_hash=delta.sha256_hash
+        )
+        response['X-Delta-Algorithm'] = delta.algorithm
+        response['X-Delta-SHA256'] = delta.sha256_hash
+    else:
+        if not storage.exists(target.storage_key):
+            return Response(
+                {"error": "文件不存在"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        response = storage_download_response(
+            request,
+            storage,
+            target.storage_key,
+            target.file_name,
+            md5_hash=target.md5_hash
+        )
+        response['X-Delta-Algorithm'] = 'none'
+
+    if should_count(request):
+        record_download(target.id, target.application_id)
+
+    response['X-Target-Version'] = target.version
+    response['X-Target-Size'] = str(target.file_size)
+    response['X-Target-MD5'] = target.md5_hash
+    if target.sha256_hash:
+        response['X-Target-SHA256'] = target.sha256_hash
+    return response
+
+
+@require_safe
+@throttling.limit_concurrent_downloads(by_user=False)
+def signed_download(request, app_id, version, token, file_name):
+    """
+    签名下载链接（由版本接口签发）：只校验签名与有效期，不读取会话、不查询数据库，
+    响应可由 CDN 缓存到链接过期为止
+    """
+    throttled = throttling.check_ip_throttle(request)
+    if throttled is not None:
+        return throttled
+    grant = signed_downloads.verify(token, app_id, version, file_name)
+    if grant is None:
+        return JsonResponse({"error": "下载链接无效或已过期"}, status=403, json_dumps_params={'ensure_ascii': False})
+
+    storage = get_storage()
+    if not storage.exists(grant['k']):
+        return JsonResponse({"error": "文件不存在"}, status=404, json_dumps_params={'ensure_ascii': False})
+
+    if should_count(request):
+        record_download(grant['i'], grant['p'])
+
+    response = storage_download_response(request, storage, grant['k'], grant['n'], md5_hash=grant['h'])
+    return signed_downloads.apply_cache_headers(response, grant)
+
+
+def _accepted_encodings(header):
+    """解析 Accept-Encoding，忽略 q=0 的编码"""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        quality = params.strip().replace(' ', '')
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding)
+    return accepted
+
+
+@require_safe
+def catalog_index(request):
+    """
+    全量目录索引：全部应用及其最新版本的静态 JSON 文件。
+
+    按 Accept-Encoding 直接发送预先压缩好的文件；客户端带 If-None-Match 轮询，
+    索引未变化时返回 304，整个过程不查询数据库
+    """
+    index_file, pointer, encoding = catalog.open_catalog_index(
+        _accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    )
+    etag = catalog.index_etag(pointer['digest'], encoding)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # 内容相同时任一编码的 ETag 都视为匹配
+        etags = parse_etags(if_none_match)
+        variants = {catalog.index_etag(pointer['digest'], e) for e in (None, *pointer['encodings'])}
+        if '*' in etags or variants.intersection(etags):
+            index_file.close()
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = f'public, max-age={settings.APP_CATALOG_MAX_AGE}'
+            patch_vary_headers(response, ['Accept-Encoding'])
+            return response
+
+    response = FileResponse(index_file, content_type='application/json', filename='index.json')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={settings.APP_CATALOG_MAX_AGE}'
+    response['X-Catalog-Count'] = str(pointer['count'])
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
 class LatestVersionAPI(APIView):
     """获取最新版本信息"""
-    renderer_classes = [JSONRenderer]  # 明确指定渲染器
+    renderer_classes = [ORJSONRenderer]  # 明确指定渲染器
 
     def get(self, request, app_id, format=None):
-        try:
-            application = Application.objects.get(app_id=app_id)
-        except Application.DoesNotExist:
+        validators = version_validators(app_id)
+        if validators is None:
             return Response(
                 {"error": f"应用ID '{app_id}' 不存在"},
                 status=status.HTTP_404_NOT_FOUND
             )
-
-        version = AppVersion.objects.filter(
-            application=application
-        ).order_by('-upload_time').first()
-
-        if not version:
+        if not validators['version_count']:
             return Response(
                 {"error": "该应用暂无可用版本"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        signed = request.user.is_authenticated
+        headers = validator_headers(request, validators, 'latest', signed=signed)
+        response = not_modified(request, validators, headers)
+        if response is not None:
+            return response
+
+        # 最新版本按语义版本号判断，而不是上传时间（旧版本线的热修复可能最后上传）；
+        # 仍在处理或处理失败的版本不作为最新版本
+        version = AppVersion.objects.filter(
+            application_id=validators['id'], processing_state=AppVersion.READY
+        ).annotate(**manifests.MANIFEST_ANNOTATIONS).order_by('-sort_key', '-upload_time').first()
+        if version is None:
+            return apply_headers(Response(
+                {"error": "该应用暂无可用版本"},
+                status=status.HTTP_404_NOT_FOUND
+            ), headers)
+
+        data = AppVersionSerializer(version).data
+        if signed:
+            signed_downloads.add_download_urls(request, app_id, [version], [data])
+        manifests.add_manifest_summaries([version], [data])
+        return apply_headers(Response(data, status=status.HTTP_200_OK), headers)
+
+
+class PackageManifestAPI(APIView):
+    """安装包内容清单：文件列表与大小、APK 的包名与版本号，无需下载安装包"""
+    renderer_classes = [ORJSONRenderer]
+
+    def get(self, request, app_id, version, format=None):
+        app_version = AppVersion.objects.select_related('application', 'manifest').filter(
+            application__app_id=app_id,
+            version=version
+        ).first()
+        if app_version is None:
+            return Response({"error": "版本不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        # 清单由文件内容决定，ETag 直接使用 MD5
+        headers = {
+            'ETag': quote_etag(app_version.md5_hash),
+            'Cache-Control': f'public, max-age={settings.APP_VERSION_API_MAX_AGE}',
+        }
+        response = get_conditional_response(request, etag=headers['ETag'])
+        if response is not None:
+            return apply_headers(response, headers)
+
+        manifest = app_version.manifest
+        if manifest is None:
+            # 第一次查看时只读取中央目录生成清单，之后直接使用缓存
+            try:
+                manifest = manifests.get_manifest(app_version)
+            except FileNotFoundError:
+                return Response({"error": "文件不存在"}, status=status.HTTP_404_NOT_FOUND)
+        data = {'app_id': app_id, 'version': version, **manifests.manifest_data(manifest)}
+        return apply_headers(Response(data, status=status.HTTP_200_OK), headers)
+
+
+class BatchUpdateCheckAPI(APIView):
+    """
+    批量检查更新：客户端一次提交所有已安装应用及其版本，
+    只返回有更新的应用，查询次数与列表长度无关
+    """
+    renderer_classes = [ORJSONRenderer]
+
+    def post(self, request, format=None):
+        items = request.data.get('apps') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "请求体必须包含 apps 列表"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > settings.APP_UPDATE_CHECK_MAX_APPS:
+            return Response(
+                {"error": f"单次最多检查 {settings.APP_UPDATE_CHECK_MAX_APPS} 个应用"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        serializer = AppVersionSerializer(version)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-
-
-from django.core.cache import cache
+        installed = {}
+        for item in items:
+            if not isinstance(item, dict) or not item.get('app_id'):
+                return Response(
+                    {"error": "每一项都必须包含 app_id 和 installed_version"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            installed[str(item['app_id'])] = str(item.get('installed_version') or '')
+
+        # 单条查询取出每个应用的最新版本（相关子查询走 (application, sort_key) 索引）
+        latest_id = AppVersion.objects.filter(
+            application=OuterRef('application'), processing_state=AppVersion.READY
+        ).order_by('-sort_key', '-upload_time').values('id')[:1]
+        latest_versions = AppVersion.objects.filter(
+            application__app_id__in=installed.keys(),
+            id=Subquery(latest_id)
+        ).select_related('application')
+
+        # 与版本接口相同，只给已登录的调用方签发无需会话的签名链接，匿名调用方仍返回需要登录的下载地址
+        signed = request.user.is_authenticated
+        base = signed_downloads.url_base(request)
+        expires = signed_downloads.expires_at()
+        updates = []
+        for latest in latest_versions:
+            app_id = latest.application.app_id
+            installed_version = installed[app_id]
+            if installed_version and version_sort_key(installed_version) >= latest.sort_key:
+                continue
+            updates.append({
+                "app_id": app_id,
+                "installed_version": installed_version,
+                "version": latest.version,
+                "file_name": latest.file_name,
+                "file_size": latest.file_size,
+                "md5_hash": latest.md5_hash,
+                "sha256_hash": latest.sha256_hash,
+                "release_notes": latest.release_notes,
+                "upload_time": latest.upload_time,
+                "processing_state": latest.processing_state,
+            })
+            if signed:
+                updates[-1]["download_url"] = signed_downloads.signed_download_url(base, app_id, latest, expires)
+                updates[-1]["download_url_expires"] = expires
+            else:
+                updates[-1]["download_url"] = request.build_absolute_uri(
+                    reverse('download-app-version', args=[app_id, latest.version])
+                )
+
+        return Response({"updates": updates}, status=status.HTTP_200_OK)
+
+
+MARKET_PAGE_SIZE = 9  # 每页9个应用
+# 市场页卡片只需要这些字段，缓存中不保存完整的模型实例
+MARKET_CARD_FIELDS = ('id', 'app_id', 'name', 'description', 'created_at', 'owner__username')
+
+
+def _market_queryset(query):
+    apps = Application.objects.order_by('-id')
+    if query:
+        # 全文检索，按相关度排序
+        apps = search_applications(apps, query)
+    return apps
+
+
+def _market_card(row):
+    return {
+        'pk': row['id'],
+        'app_id': row['app_id'],
+        'name': row['name'],
+        'description': row['description'],
+        'created_at': row['created_at'],
+        'owner': {'username': row['owner__username']},
+    }
 
 
 def market(request):
-    query = request.GET.get('q', '')
-    cache_key = f"market_view_{query}"
-    apps = cache.get(cache_key)
-
-    if apps is None:
-        apps = Application.objects.all().order_by('-id')
+    # 规范化查询词，避免大小写、空白不同的相同查询各占一份缓存
+    query = ' '.join(request.GET.get('q', '').split()).lower()
+    cursor = request.GET.get('cursor', '')
+    # 应用或版本变更时代数递增，旧缓存随之失效
+    cache_key = "market:{}:{}:{}".format(
+        market_generation(),
+        hashlib.md5(query.encode('utf-8')).hexdigest(),
+        hashlib.md5(cursor.encode('utf-8')).hexdigest()
+    )
 
+    def load_page():
+        apps = _market_queryset(query).values(*MARKET_CARD_FIELDS)
+        # 浏览全部应用时按 -id 键集分页；检索结果按相关度排序，游标中记录偏移量
         if query:
-            apps = apps.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query)
-            ).distinct()
-
-        # 设置缓存，超时时间为60秒
-        cache.set(cache_key, list(apps), 60)
+            page = offset_paginate(apps, cursor, MARKET_PAGE_SIZE)
+        else:
+            page = keyset_paginate(apps, cursor, MARKET_PAGE_SIZE, field='id')
+        return {
+            'cards': [_market_card(row) for row in page],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
 
-    paginator = Paginator(apps, 9)  # 每页9个应用
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    data = get_or_compute(cache_key, load_page, settings.MARKET_CACHE_TIMEOUT)
+    page_obj = CursorPage(data['cards'], data['next_cursor'], data['previous_cursor'])
 
     return render(request, 'market.html', {
         'applications': page_obj,
@@ -213,12 +891,25 @@ def market(request):
 
 
 def app_detail(request, app_id):
-    app = get_object_or_404(Application, pk=app_id)
-    app_versions = AppVersion.objects.filter(application=app).order_by('-upload_time')
+    # 模板中会读取 app.owner.username，通过 select_related 一并取出，避免额外查询
+    app = get_object_or_404(Application.objects.select_related('owner'), pk=app_id)
+    # 清单随版本 JOIN 取出，查看次数不影响查询次数
+    app_versions = AppVersion.objects.filter(application=app).select_related('manifest').order_by(
+        '-sort_key', '-upload_time'
+    )
     return render(request, 'app_detail.html', {'app': app, 'app_versions': app_versions})
 
 
+@csrf_exempt
 def upload_version(request, app_id):
+    # CSRF 校验会读取 request.POST，因此需在校验之前替换上传处理器，再交给受保护的视图处理
+    if request.method == 'POST':
+        request.upload_handlers = hashing_upload_handlers(request)
+    return _upload_version(request, app_id)
+
+
+@csrf_protect
+def _upload_version(request, app_id):
     application = get_object_or_404(Application, app_id=app_id)
 
     if request.method == 'POST':
@@ -252,39 +943,28 @@ def upload_version(request, app_id):
                 'error': '该版本号已存在'
             })
 
-        # 创建应用目录
-        app_dir = os.path.join(STORAGE_PATH, str(app_id))
-        os.makedirs(app_dir, exist_ok=True)
-
-        # 计算文件MD5
-        md5 = hashlib.md5()
-        for chunk in file.chunks():
-            md5.update(chunk)
-        md5_hash = md5.hexdigest()
-
-        # 保存文件到指定的应用目录
+        # 文件在请求体流入时已写入临时文件并完成哈希计算，这里按内容寻址原子地移动到最终位置
         sanitized_filename = sanitize_filename(file.name)
-        filename = f"{version}_{sanitized_filename}"
-        file_path = os.path.join(app_dir, filename)
-        with open(file_path, 'wb+') as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
+        blob = store_uploaded_file(file)
 
         # 创建新版本记录
-        AppVersion.objects.create(
-            application=application,
-            version=version,
-            file_name=sanitized_filename,
-            file_size=os.path.getsize(file_path),
-            md5_hash=md5_hash,
-            upload_time=timezone.now(),
-            release_notes=release_notes
-        )
+        try:
+            create_version_from_blob(
+                application, version, sanitized_filename, blob,
+                release_notes=release_notes, upload_time=timezone.now()
+            )
+        except IntegrityError:
+            versions = AppVersion.objects.filter(application=application)
+            return render(request, 'upload-version.html', {
+                'application': application,
+                'versions': versions,
+                'error': '该版本号已存在'
+            })
 
         return redirect('app_detail', app_id=app_id)
 
     # GET请求
-    versions = AppVersion.objects.filter(application=application).order_by('-upload_time')
+    versions = AppVersion.objects.filter(application=application).order_by('-sort_key', '-upload_time')
     return render(request, 'upload-version.html', {
         'application': application,
         'versions': versions
@@ -370,7 +1050,7 @@ GITHUB_REDIRECT_URI = 'http://yourdomain.com/github-callback/'
 
 def github_login(request):
     """重定向到GitHub授权页面"""
-    base_url = "https://github.com/login/oauth/authorize"
+    base_url = f"{settings.GITHUB_OAUTH_URL.rstrip('/')}/authorize"
     params = {
         "client_id": settings.GITHUB_CLIENT_ID,
         "redirect_uri": settings.GITHUB_REDIRECT_URI
@@ -379,13 +1059,13 @@ def github_login(request):
     return redirect(auth_url)
 
 
-import requests
 import logging
 from django.shortcuts import redirect, render
 from django.conf import settings
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.db import IntegrityError
+from .github_client import GitHubError, GitHubUnavailable, get_github_client
 from .models import GitHubSocialAuth, UserProfile
 
 logger = logging.getLogger(__name__)
@@ -399,46 +1079,27 @@ def github_callback(request):
     if not code:
         return render(request, 'error.html', {'error': 'GitHub授权失败: 缺少code参数'})
 
-    # 1. 使用code换取access_token
-    token_url = "https://github.com/login/oauth/access_token"
-    data = {
-        "client_id": settings.GITHUB_CLIENT_ID,
-        "client_secret": settings.GITHUB_CLIENT_SECRET,
-        "code": code,
-        "redirect_uri": settings.GITHUB_REDIRECT_URI
-    }
-    headers = {"Accept": "application/json"}
+    # 通过进程内共享的连接池访问 GitHub，请求有超时、有限重试与熔断
+    client = get_github_client()
 
+    # 1. 使用code换取access_token
     try:
-        response = requests.post(token_url, data=data, headers=headers, verify=False)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
+        access_token = client.exchange_code(code, settings.GITHUB_REDIRECT_URI)
+    except GitHubUnavailable as e:
+        return render(request, 'error.html', {'error': str(e)}, status=503)
+    except GitHubError as e:
         logger.error(f"获取access_token失败: {str(e)}")
         return render(request, 'error.html', {'error': f'获取access_token失败: {str(e)}'})
 
-    if response.status_code != 200:
-        return render(request, 'error.html', {'error': f'获取access_token失败: 状态码{response.status_code}'})
-
-    token_data = response.json()
-    access_token = token_data.get('access_token')
-    if not access_token:
-        return render(request, 'error.html', {'error': '缺少access_token'})
-
     # 2. 使用access_token获取用户信息
-    user_api = "https://api.github.com/user"
-    headers = {"Authorization": f"Bearer {access_token}"}
-
     try:
-        user_response = requests.get(user_api, headers=headers, verify=False)
-        user_response.raise_for_status()
-    except requests.exceptions.RequestException as e:
+        github_user = client.get_user(access_token)
+    except GitHubUnavailable as e:
+        return render(request, 'error.html', {'error': str(e)}, status=503)
+    except GitHubError as e:
         logger.error(f"获取用户信息失败: {str(e)}")
         return render(request, 'error.html', {'error': f'获取用户信息失败: {str(e)}'})
 
-    if user_response.status_code != 200:
-        return render(request, 'error.html', {'error': f'获取用户信息失败: 状态码{user_response.status_code}'})
-
-    github_user = user_response.json()
     github_id = github_user['id']
     username = github_user['login']
     email = github_user.get('email', '')
@@ -491,32 +1152,11 @@ def github_callback(request):
         pass
 
     # 处理新用户创建
-    # 确保有有效的邮箱地址
-    if not email:
-        try:
-            emails_response = requests.get(
-                "https://api.github.com/user/emails",
-                headers=headers,
-                timeout=5,
-                verify=False
-            )
-            if emails_response.status_code == 200:
-                emails = emails_response.json()
-                primary_emails = [e['email'] for e in emails if e.get('primary') and e.get('verified')]
-                verified_emails = [e['email'] for e in emails if e.get('verified')]
-
-                if primary_emails:
-                    email = primary_emails[0]
-                elif verified_emails:
-                    email = verified_emails[0]
-                else:
-                    email = f"github-{github_id}@users.noreply.github.com"
-        except Exception as e:
-            logger.warning(f"获取邮箱失败: {str(e)}")
-            email = f"github-{github_id}@users.noreply.github.com"
-
-    if not email:
-        email = f"github-{github_id}@users.noreply.github.com"
+    # 公开资料中没有邮箱时查询邮箱列表，与创建用户、认证记录和资料并行进行，
+    # 先以 noreply 邮箱创建用户，查到已验证邮箱后再更新
+    fallback_email = f"github-{github_id}@users.noreply.github.com"
+    emails_future = client.submit(client.get_verified_email, access_token) if not email else None
+    email = email or fallback_email
 
     # 生成唯一用户名
     base_username = f"github_{github_id}"
@@ -562,18 +1202,31 @@ def github_callback(request):
         user.delete()
         return render(request, 'error.html', {'error': f'创建GitHub认证记录失败: {str(e)}'})
 
-    # 创建用户资料
+    # 创建或更新用户资料：创建用户时信号已生成空资料，并缓存在 user.profile 上，
+    # 之后每次 user.save()（包括 login 更新 last_login）都会保存它，因此直接修改这个实例
     try:
-        UserProfile.objects.create(
-            user=user,
-            avatar_url=avatar_url,
-            full_name=name or '',
-            github_profile=html_url,
-            registration_source='github'
-        )
+        try:
+            user_profile = user.profile
+        except UserProfile.DoesNotExist:
+            user_profile = UserProfile(user=user)
+        user_profile.avatar_url = avatar_url
+        user_profile.full_name = name or ''
+        user_profile.github_profile = html_url
+        user_profile.registration_source = 'github'
+        user_profile.save()
     except Exception as e:
         logger.warning(f"创建用户资料失败: {str(e)}")
 
+    if emails_future is not None:
+        try:
+            verified_email = emails_future.result()
+        except GitHubError as e:
+            logger.warning(f"获取邮箱失败: {str(e)}")
+        else:
+            if verified_email and verified_email != user.email:
+                user.email = verified_email
+                user.save(update_fields=['email'])
+
     # 关键修复：设置认证后端
     user.backend = 'django.contrib.auth.backends.ModelBackend'
 